@@ -3,7 +3,7 @@ Main Telegram Bot Application
 """
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ConversationHandler
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
+import asyncio
 import logging
 import os
 from .handlers import (
@@ -31,8 +31,9 @@ from .notification_handlers import (
     CITY,
     CONFIRM
 )
-from .notifications import send_daily_notifications
 from .scheduler import setup_event_import_scheduler
+from .subscriber_index import load_subscriber_index
+from ..scrapers.runner import shutdown_import_executor
 
 # Configure logging
 logging.basicConfig(
@@ -108,29 +109,20 @@ async def start_bot():
     application.add_handler(MessageHandler(filters.Regex("^🔔 Уведомления$"), notifications_command))
     application.add_handler(MessageHandler(filters.Regex("^ℹ️ Помощь$"), help_command))
     
-    # Setup scheduler for daily notifications
-    scheduler = AsyncIOScheduler()
+    # Load notification subscribers for in-memory matching of new events
+    try:
+        await asyncio.to_thread(load_subscriber_index)
+    except Exception as e:
+        logger.error(f"Failed to load subscriber index, matching falls back to SQL: {e}")
     
-    # Get notification time from environment (default: 09:00 Moscow time)
-    notification_hour = int(os.getenv('NOTIFICATION_HOUR', '9'))
-    notification_minute = int(os.getenv('NOTIFICATION_MINUTE', '0'))
-    
-    # Schedule daily notifications
-    # Note: This uses server time, adjust timezone as needed
-    scheduler.add_job(
-        send_daily_notifications,
-        trigger=CronTrigger(hour=notification_hour, minute=notification_minute),
-        args=[application.bot],
-        id='daily_notifications',
-        name='Send daily event notifications',
-        replace_existing=True
-    )
+    # Setup scheduler: per-city daily digests, imports and maintenance
+    scheduler = AsyncIOScheduler()
     
     # Setup Yandex Afisha import scheduler
     setup_event_import_scheduler(scheduler)
     
     scheduler.start()
-    logger.info(f"Scheduler started. Daily notifications at {notification_hour:02d}:{notification_minute:02d}")
+    logger.info("Scheduler started")
     
     # Start the bot
     await application.initialize()
@@ -151,6 +143,8 @@ async def stop_bot():
         scheduler.shutdown()
         logger.info("Scheduler stopped")
     
+    shutdown_import_executor()
+    
     if application:
         await application.updater.stop()
         await application.stop()
@@ -0,0 +1,264 @@
+"""
+Telegram Delivery Engine
+Sends many messages concurrently while staying inside Telegram limits:
+
+- global rate: a token bucket of TELEGRAM_MESSAGES_PER_SECOND (~30 msg/s)
+  shared by every fan-out of the process
+- per chat: at most one message per TELEGRAM_CHAT_INTERVAL seconds
+- RetryAfter: the whole process pauses for the time Telegram asks
+- transient errors (timeouts, network): retried with exponential backoff
+- blocked bots / deleted chats: reported, not retried
+
+Limits are kept as reservations under a threading lock, so fan-outs running
+on different event loops (bot loop, import job threads) share one budget.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, NamedTuple, Optional
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MESSAGES_PER_SECOND = float(os.getenv('TELEGRAM_MESSAGES_PER_SECOND', '30'))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', '1.0'))
+DELIVERY_CONCURRENCY = int(os.getenv('DELIVERY_CONCURRENCY', '20'))
+DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', '4'))
+DELIVERY_BACKOFF_BASE = 1.0  # Seconds before the first retry of a transient error
+
+# Telegram answers 400 for chats that no longer exist
+_GONE_CHAT_ERRORS = ('chat not found', 'user is deactivated', 'bot was blocked', 'bot was kicked')
+
+
+class OutgoingMessage(NamedTuple):
+    chat_id: int
+    text: str
+    parse_mode: Optional[str] = 'Markdown'
+    disable_web_page_preview: Optional[bool] = None
+    ref: Any = None  # Caller's reference, e.g. user id and event ids
+
+
+class DeliveryResult(NamedTuple):
+    message: OutgoingMessage
+    ok: bool
+    attempts: int
+    blocked: bool = False  # Chat is gone or blocked the bot
+    error: Optional[str] = None
+    retryable: bool = False  # Failed on transient errors, may succeed later
+
+
+class DeliveryLimits:
+    """Process-wide Telegram limits: global token bucket, per-chat spacing, RetryAfter pause"""
+
+    def __init__(self, rate: float = TELEGRAM_MESSAGES_PER_SECOND,
+                 chat_interval: float = TELEGRAM_CHAT_INTERVAL):
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self._tokens = rate
+        self._updated = time.monotonic()
+        self._chat_next: Dict[int, float] = {}
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, chat_id: int) -> float:
+        """Reserve a send slot for a chat, return seconds to wait before sending"""
+        with self._lock:
+            now = time.monotonic()
+
+            # Tokens may go negative: each reservation is a promise of a future slot
+            self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+            chat_at = max(now, self._chat_next.get(chat_id, 0.0))
+            self._chat_next[chat_id] = chat_at + self.chat_interval
+            wait = max(wait, chat_at - now, self._paused_until - now)
+
+            if len(self._chat_next) > 10000:
+                self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+
+            return wait
+
+    def set_rate(self, rate: float, chat_interval: Optional[float] = None):
+        """Change the global messages/s limit (and per-chat spacing), starting with a full bucket"""
+        with self._lock:
+            self.rate = rate
+            self._tokens = rate
+            self._updated = time.monotonic()
+            if chat_interval is not None:
+                self.chat_interval = chat_interval
+
+    def pause(self, seconds: float):
+        """Stop all sending for `seconds` (Telegram RetryAfter)"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def remaining_pause(self) -> float:
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+
+delivery_limits = DeliveryLimits()
+
+
+class DeliveryStats:
+    """Counters and throughput of one fan-out"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.retries = 0
+        self.retry_after_waits = 0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    @property
+    def messages_per_second(self) -> float:
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            "sent": self.sent,
+            "failed": self.failed,
+            "blocked": self.blocked,
+            "retries": self.retries,
+            "retry_after_waits": self.retry_after_waits,
+            "seconds": round(self.elapsed, 2),
+            "messages_per_second": round(self.messages_per_second, 2)
+        }
+
+
+ResultCallback = Callable[[DeliveryResult], Optional[Awaitable[None]]]
+
+
+class DeliveryEngine:
+    """Bounded-concurrency worker pool sending messages within Telegram limits"""
+
+    def __init__(self, bot: Bot, concurrency: int = DELIVERY_CONCURRENCY,
+                 max_attempts: int = DELIVERY_MAX_ATTEMPTS,
+                 limits: DeliveryLimits = delivery_limits):
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max(1, max_attempts)
+        self.limits = limits
+
+    async def deliver(self, messages: Iterable[OutgoingMessage],
+                      on_result: Optional[ResultCallback] = None,
+                      name: str = 'delivery') -> DeliveryStats:
+        """
+        Send messages and wait until every message is delivered or given up
+
+        Args:
+            messages: Messages to send
+            on_result: Called with every DeliveryResult (sync or async)
+            name: Fan-out name for logs
+
+        Returns:
+            Delivery statistics
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+
+        stats = DeliveryStats()
+        if queue.empty():
+            stats.finished = time.monotonic()
+            return stats
+
+        workers = [
+            asyncio.create_task(self._worker(queue, stats, on_result))
+            for _ in range(min(self.concurrency, queue.qsize()))
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            stats.finished = time.monotonic()
+
+        logger.info(
+            f"{name}: sent {stats.sent}, failed {stats.failed}, blocked {stats.blocked}, "
+            f"retries {stats.retries}, RetryAfter waits {stats.retry_after_waits} "
+            f"in {stats.elapsed:.1f}s ({stats.messages_per_second:.1f} msg/s)"
+        )
+        return stats
+
+    async def _worker(self, queue: asyncio.Queue, stats: DeliveryStats,
+                      on_result: Optional[ResultCallback]):
+        while True:
+            try:
+                message = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            result = await self._send(message, stats)
+            if result.ok:
+                stats.sent += 1
+            elif result.blocked:
+                stats.blocked += 1
+            else:
+                stats.failed += 1
+
+            if on_result is not None:
+                try:
+                    outcome = on_result(result)
+                    if asyncio.iscoroutine(outcome):
+                        await outcome
+                except Exception as e:
+                    logger.error(f"Delivery result callback failed for chat {message.chat_id}: {e}")
+
+    async def _send(self, message: OutgoingMessage, stats: DeliveryStats) -> DeliveryResult:
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._wait_for_slot(message.chat_id)
+            try:
+                await self.bot.send_message(
+                    chat_id=message.chat_id,
+                    text=message.text,
+                    parse_mode=message.parse_mode,
+                    disable_web_page_preview=message.disable_web_page_preview
+                )
+                return DeliveryResult(message, ok=True, attempts=attempt)
+            except RetryAfter as e:
+                # Flood control applies to the whole bot; does not use up attempts
+                retry_after = e.retry_after
+                seconds = retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+                self.limits.pause(seconds)
+                stats.retry_after_waits += 1
+                attempt -= 1
+                logger.warning(f"Telegram flood control: pausing delivery for {seconds:.0f}s")
+            except Forbidden as e:
+                return DeliveryResult(message, ok=False, attempts=attempt, blocked=True, error=str(e))
+            except BadRequest as e:
+                # Permanent: malformed message or missing chat
+                gone = any(marker in str(e).lower() for marker in _GONE_CHAT_ERRORS)
+                return DeliveryResult(message, ok=False, attempts=attempt, blocked=gone, error=str(e))
+            except NetworkError as e:
+                if attempt >= self.max_attempts:
+                    return DeliveryResult(message, ok=False, attempts=attempt, error=str(e), retryable=True)
+                stats.retries += 1
+                delay = DELIVERY_BACKOFF_BASE * 2 ** (attempt - 1) * random.uniform(0.8, 1.2)
+                logger.debug(f"Transient error sending to chat {message.chat_id}, retry in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                return DeliveryResult(message, ok=False, attempts=attempt, error=str(e), retryable=True)
+
+    async def _wait_for_slot(self, chat_id: int):
+        wait = self.limits.reserve(chat_id)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            # A RetryAfter may have arrived while waiting
+            wait = self.limits.remaining_pause()
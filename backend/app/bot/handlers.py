@@ -8,6 +8,8 @@ from sqlalchemy import func
 from datetime import datetime, date, timedelta
 from ..database import SessionLocal
 from ..models import TelegramUser, Event
+from .rendering import render_event_list
+from .subscriber_index import subscriber_index
 
 
 def get_main_menu_keyboard():
@@ -52,6 +54,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             db_user.last_interaction = datetime.utcnow()
             db_user.is_active = True
             db.commit()
+            subscriber_index.refresh_user(db, db_user.id)
             
             welcome_text = (
                 f"👋 С возвращением, {user.first_name}!\n\n"
@@ -117,35 +120,7 @@ async def events_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         text = f"📅 *События на сегодня ({today.strftime('%d.%m.%Y')}):*\n\n"
         
-        for event in events:
-                event_emoji = {
-                    'concert': '🎵',
-                    'theater': '🎭',
-                    'exhibition': '🖼️',
-                    'sport': '⚽',
-                    'festival': '🎪',
-                    'repair': '🚧',
-                    'accident': '🚗',
-                    'city_event': '🏛️'
-                }.get(event.event_type, '📍')
-                
-                text += f"\n{event_emoji} *{event.title}*\n"
-                if event.venue:
-                    text += f"   📍 {event.venue}\n"
-                text += f"   🕐 {event.start_time.strftime('%H:%M')}"
-                if event.end_time:
-                    text += f" - {event.end_time.strftime('%H:%M')}"
-                text += "\n"
-                if event.price:
-                    text += f"   💰 {event.price}\n"
-                if event.description:
-                    desc = event.description[:100]
-                    if len(event.description) > 100:
-                        desc += "..."
-                    text += f"   {desc}\n"
-                if event.source_url:
-                    text += f"   🔗 [Подробнее]({event.source_url})\n"
-                text += "\n"
+        text = render_event_list(text, events)
         
         await update.message.reply_text(text, parse_mode='Markdown', reply_markup=get_main_menu_keyboard())
     finally:
@@ -182,35 +157,7 @@ async def tomorrow_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         text = f"📅 *События на завтра ({tomorrow.strftime('%d.%m.%Y')}):*\n\n"
         
-        for event in events:
-                event_emoji = {
-                    'concert': '🎵',
-                    'theater': '🎭',
-                    'exhibition': '🖼️',
-                    'sport': '⚽',
-                    'festival': '🎪',
-                    'repair': '🚧',
-                    'accident': '🚗',
-                    'city_event': '🏛️'
-                }.get(event.event_type, '📍')
-                
-                text += f"\n{event_emoji} *{event.title}*\n"
-                if event.venue:
-                    text += f"   📍 {event.venue}\n"
-                text += f"   🕐 {event.start_time.strftime('%H:%M')}"
-                if event.end_time:
-                    text += f" - {event.end_time.strftime('%H:%M')}"
-                text += "\n"
-                if event.price:
-                    text += f"   💰 {event.price}\n"
-                if event.description:
-                    desc = event.description[:100]
-                    if len(event.description) > 100:
-                        desc += "..."
-                    text += f"   {desc}\n"
-                if event.source_url:
-                    text += f"   🔗 [Подробнее]({event.source_url})\n"
-                text += "\n"
+        text = render_event_list(text, events)
         
         await update.message.reply_text(text, parse_mode='Markdown', reply_markup=get_main_menu_keyboard())
     finally:
@@ -249,31 +196,7 @@ async def week_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         text = f"📅 *События на неделю ({today.strftime('%d.%m')} - {week_end.strftime('%d.%m.%Y')}):*\n\n"
         
-        for event in events:
-                event_emoji = {
-                    'concert': '🎵',
-                    'theater': '🎭',
-                    'exhibition': '🖼️',
-                    'sport': '⚽',
-                    'festival': '🎪',
-                    'repair': '🚧',
-                    'accident': '🚗',
-                    'city_event': '🏛️'
-                }.get(event.event_type, '📍')
-                
-                text += f"\n{event_emoji} *{event.title}*\n"
-                text += f"   📅 {event.start_time.strftime('%d.%m.%Y')}\n"
-                if event.venue:
-                    text += f"   📍 {event.venue}\n"
-                text += f"   🕐 {event.start_time.strftime('%H:%M')}"
-                if event.end_time:
-                    text += f" - {event.end_time.strftime('%H:%M')}"
-                text += "\n"
-                if event.price:
-                    text += f"   💰 {event.price}\n"
-                if event.source_url:
-                    text += f"   🔗 [Подробнее]({event.source_url})\n"
-                text += "\n"
+        text = render_event_list(text, events, template='week')
         
         await update.message.reply_text(text, parse_mode='Markdown', reply_markup=get_main_menu_keyboard())
     finally:
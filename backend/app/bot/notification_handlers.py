@@ -2,7 +2,6 @@
 Telegram Bot Handlers for Notification Settings
 Handles user preferences for real-time notifications
 """
-import json
 import logging
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
@@ -12,6 +11,7 @@ from datetime import datetime
 from ..database import SessionLocal
 from ..models import TelegramUser
 from .handlers import get_main_menu_keyboard
+from .subscriber_index import subscriber_index
 
 logger = logging.getLogger(__name__)
 
@@ -55,19 +55,15 @@ async def notifications_command(update: Update, context: ContextTypes.DEFAULT_TY
                 text += f"• Город: {db_user.preferred_city}\n"
             
             if db_user.preferred_event_types:
-                try:
-                    types = json.loads(db_user.preferred_event_types)
-                    type_names = {
-                        'concert': 'Концерты',
-                        'theater': 'Театр',
-                        'exhibition': 'Выставки',
-                        'sport': 'Спорт',
-                        'festival': 'Фестивали'
-                    }
-                    type_list = [type_names.get(t, t) for t in types]
-                    text += f"• Типы событий: {', '.join(type_list)}\n"
-                except:
-                    pass
+                type_names = {
+                    'concert': 'Концерты',
+                    'theater': 'Театр',
+                    'exhibition': 'Выставки',
+                    'sport': 'Спорт',
+                    'festival': 'Фестивали'
+                }
+                type_list = [type_names.get(t, t) for t in db_user.preferred_event_types]
+                text += f"• Типы событий: {', '.join(type_list)}\n"
         
         text += "\n*Доступные команды:*\n"
         text += "/setup_notifications - Настроить уведомления\n"
@@ -295,7 +291,7 @@ async def confirm_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
             db_user.notification_radius = context.user_data['radius']
         
         if context.user_data.get('event_types'):
-            db_user.preferred_event_types = json.dumps(context.user_data['event_types'])
+            db_user.preferred_event_types = list(context.user_data['event_types'])
         
         if context.user_data.get('city'):
             db_user.preferred_city = context.user_data['city']
@@ -303,6 +299,7 @@ async def confirm_settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
         db_user.last_interaction = datetime.utcnow()
         
         db.commit()
+        subscriber_index.refresh_user(db, db_user.id)
         
         await update.message.reply_text(
             "✅ *Уведомления настроены!*\n\n"
@@ -364,6 +361,7 @@ async def enable_notifications_command(update: Update, context: ContextTypes.DEF
         db_user.notifications_enabled = True
         db_user.last_interaction = datetime.utcnow()
         db.commit()
+        subscriber_index.refresh_user(db, db_user.id)
         
         await update.message.reply_text(
             "✅ Уведомления включены!\n\n"
@@ -393,6 +391,7 @@ async def disable_notifications_command(update: Update, context: ContextTypes.DE
         db_user.notifications_enabled = False
         db_user.last_interaction = datetime.utcnow()
         db.commit()
+        subscriber_index.refresh_user(db, db_user.id)
         
         await update.message.reply_text(
             "✅ Уведомления отключены.\n\n"
@@ -0,0 +1,98 @@
+"""
+Notification History Maintenance
+notification_history is partitioned by month of sent_at. Partitions are
+created ahead of time and whole months are dropped after retention, so the
+log never needs row-by-row deletes. Rows of a month without a partition go to
+the DEFAULT partition and are moved out once the month's partition is created. Deduplication does not read the log
+(see notification_dedup), so its size does not affect delivery.
+"""
+import logging
+import os
+import re
+from datetime import date
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Months of history kept; events themselves are deleted ~5 weeks after they end
+HISTORY_RETENTION_MONTHS = int(os.getenv('NOTIFICATION_HISTORY_RETENTION_MONTHS', '3'))
+# Partitions created ahead of the current month
+HISTORY_MONTHS_AHEAD = 2
+
+_PARTITION_RE = re.compile(r'^notification_history_(\d{4})_(\d{2})$')
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_history_partitions(db: Session, months_ahead: int = HISTORY_MONTHS_AHEAD) -> List[str]:
+    """Create partitions of the current and the next months, moving their rows out of DEFAULT"""
+    this_month = date.today().replace(day=1)
+    names = [
+        db.execute(
+            text("SELECT create_notification_history_partition(:month)"),
+            {"month": _add_months(this_month, offset)}
+        ).scalar()
+        for offset in range(months_ahead + 1)
+    ]
+    db.commit()
+    return names
+
+
+def drop_expired_history_partitions(db: Session, retention_months: int = HISTORY_RETENTION_MONTHS) -> List[str]:
+    """
+    Drop monthly partitions that ended more than retention_months ago
+
+    Returns:
+        Names of dropped partitions
+    """
+    cutoff = _add_months(date.today().replace(day=1), -retention_months)
+    partitions = db.execute(text("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'notification_history'
+    """)).scalars().all()
+
+    dropped = []
+    for name in sorted(partitions):
+        match = _PARTITION_RE.match(name)
+        if not match:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if _add_months(month, 1) <= cutoff:
+            # Name comes from the catalog and matches _PARTITION_RE
+            db.execute(text(f'DROP TABLE IF EXISTS "{name}"'))
+            dropped.append(name)
+
+    # Rows that landed in the DEFAULT partition expire row by row
+    db.execute(
+        text("DELETE FROM notification_history_default WHERE sent_at < :cutoff"),
+        {"cutoff": cutoff}
+    )
+
+    db.commit()
+    if dropped:
+        logger.info(f"Dropped expired notification history partitions: {', '.join(dropped)}")
+    return dropped
+
+
+def maintain_notification_history():
+    """Create upcoming partitions and drop expired ones (daily job)"""
+    db = SessionLocal()
+    try:
+        ensure_history_partitions(db)
+        drop_expired_history_partitions(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error maintaining notification history partitions: {e}")
+    finally:
+        db.close()
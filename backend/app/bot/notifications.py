@@ -3,106 +3,251 @@ Notification System for Telegram Bot
 """
 from telegram import Bot
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from datetime import date, datetime
+from sqlalchemy import text
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+import asyncio
+import os
+from ..cities_config import CITIES, get_city_timezone
 from ..database import SessionLocal
 from ..models import TelegramUser, Event
+from .delivery import DeliveryEngine, DeliveryResult, OutgoingMessage
+from .rendering import DIGEST_MAX_LENGTH, render_daily_digest, render_event
+from .subscriber_index import subscriber_index
 import logging
 
 logger = logging.getLogger(__name__)
 
-async def send_daily_notifications(bot: Bot):
+# Digest city of users with neither a preferred city nor a location
+DIGEST_DEFAULT_CITY = os.getenv('DIGEST_DEFAULT_CITY', 'moscow')
+# Granularity of spreading digest sends over the delivery window
+DIGEST_SPREAD_STEP_SECONDS = 30
+
+def _deactivate_blocked_users(db: Session, results: List[DeliveryResult]):
+    """Deactivate users whose chats blocked the bot (message ref is user id)"""
+    blocked_ids = [result.message.ref for result in results if result.blocked]
+    if not blocked_ids:
+        return
+    db.query(TelegramUser).filter(TelegramUser.id.in_(blocked_ids)).update(
+        {'is_active': False}, synchronize_session=False
+    )
+    db.commit()
+    subscriber_index.remove(blocked_ids)
+    logger.info(f"Deactivated {len(blocked_ids)} users due to blocked bot")
+
+# Digest preferences, {u} is the alias of the users (or preference profiles) relation
+_DIGEST_PREFERENCE_FILTER = """
+    ({u}.preferred_city IS NULL OR {u}.preferred_city = e.city)
+    AND (
+        {u}.preferred_event_types IS NULL OR cardinality({u}.preferred_event_types) = 0
+        OR {u}.preferred_event_types @> ARRAY[e.event_type::text]
+    )
+"""
+
+# Where the digest of a user goes out: preferred city, else the city nearest to the
+# user's location, else DIGEST_DEFAULT_CITY. {u} is the alias of telegram_users.
+_CITY_CENTRES = ", ".join(
+    f"('{slug}', {info['lon']}, {info['lat']})" for slug, info in CITIES.items()
+)
+_HOME_CITY = f"""
+    COALESCE(
+        {{u}}.preferred_city,
+        (SELECT c.slug FROM (VALUES {_CITY_CENTRES}) AS c(slug, lon, lat)
+         ORDER BY ST_Distance({{u}}.user_location, ST_SetSRID(ST_MakePoint(c.lon, c.lat), 4326))
+         LIMIT 1),
+        :default_city
+    )
+"""
+
+_DIGEST_SQL = """
+    WITH day_events AS (
+        SELECT e.id, e.city, e.event_type, e.start_time, e.geom
+        FROM events e
+        WHERE e.start_time >= :day_start AND e.start_time < :day_end
+          AND e.canonical_event_id IS NULL AND NOT e.is_archived
+    ),
+    -- Users without a location only differ by preferences: match events once per profile
+    profiles AS (
+        SELECT preferred_city, preferred_event_types,
+               array_agg(id ORDER BY id) AS user_ids,
+               array_agg(chat_id ORDER BY id) AS chat_ids
+        FROM telegram_users
+        WHERE is_active
+          AND (user_location IS NULL OR COALESCE(notification_radius, 0) <= 0)
+          AND {profile_city_filter}
+        GROUP BY preferred_city, preferred_event_types
+    )
+    -- Users with a location: radius join on the user_location GiST index
+    SELECT ARRAY[u.id] AS user_ids, ARRAY[u.chat_id] AS chat_ids,
+           array_agg(e.id ORDER BY e.start_time, e.id) AS event_ids
+    FROM day_events e
+    JOIN telegram_users u
+      ON ST_DWithin(
+             u.user_location::geography, e.geom::geography,
+             (SELECT MAX(notification_radius) FROM telegram_users WHERE user_location IS NOT NULL)
+         )
+     AND ST_DWithin(u.user_location::geography, e.geom::geography, u.notification_radius)
+    WHERE u.is_active
+      AND u.user_location IS NOT NULL AND u.notification_radius > 0
+      AND {user_city_filter}
+      AND {user_preferences}
+    GROUP BY u.id, u.chat_id
+
+    UNION ALL
+
+    SELECT p.user_ids, p.chat_ids, array_agg(e.id ORDER BY e.start_time, e.id)
+    FROM profiles p
+    JOIN day_events e ON {profile_preferences}
+    GROUP BY p.user_ids, p.chat_ids
+"""
+
+# All users at once / users whose digest goes out in :city
+_ALL_DIGESTS_SQL = _DIGEST_SQL.format(
+    profile_city_filter="TRUE",
+    user_city_filter="TRUE",
+    user_preferences=_DIGEST_PREFERENCE_FILTER.format(u='u'),
+    profile_preferences=_DIGEST_PREFERENCE_FILTER.format(u='p')
+)
+_CITY_DIGESTS_SQL = _DIGEST_SQL.format(
+    profile_city_filter="COALESCE(preferred_city, :default_city) = :city",
+    user_city_filter=_HOME_CITY.format(u='u') + " = :city",
+    user_preferences=_DIGEST_PREFERENCE_FILTER.format(u='u'),
+    profile_preferences=_DIGEST_PREFERENCE_FILTER.format(u='p')
+)
+
+
+def city_day_window(city: Optional[str], day: date) -> Tuple[datetime, datetime]:
+    """
+    Local calendar day of a city as naive server-time bounds
+
+    Event times are stored as naive server-local time, so the city's
+    midnight is converted to the server time zone.
     """
-    Send daily notifications to all active users about events in their subscribed districts
+    if city is None:
+        start = datetime.combine(day, datetime.min.time())
+        return start, start + timedelta(days=1)
+
+    tz = ZoneInfo(get_city_timezone(city))
+    start = datetime.combine(day, datetime.min.time(), tzinfo=tz)
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=tz)
+    return start.astimezone().replace(tzinfo=None), end.astimezone().replace(tzinfo=None)
+
+
+def city_today(city: Optional[str]) -> date:
+    """Current date in the city (server date without a city)"""
+    if city is None:
+        return date.today()
+    return datetime.now(ZoneInfo(get_city_timezone(city))).date()
+
+
+def compute_daily_digests(db: Session, day: date,
+                          city: Optional[str] = None) -> Dict[Tuple[int, ...], List[Tuple[int, int]]]:
+    """
+    Match active users to the events of a day in one batched query
+
+    Respects preferred_city, preferred_event_types and notification_radius.
+    Users without a location are grouped by their preferences, so their
+    events are matched once per distinct preference profile.
+
+    Args:
+        db: Database session
+        day: Digest date (local date of the city)
+        city: Only users whose digest goes out in this city (None - all users)
+
+    Returns:
+        Distinct event id sets (ordered by start time) -> [(user id, chat id)]
+    """
+    day_start, day_end = city_day_window(city, day)
+    rows = db.execute(
+        text(_CITY_DIGESTS_SQL if city else _ALL_DIGESTS_SQL),
+        {"day_start": day_start, "day_end": day_end, "city": city, "default_city": DIGEST_DEFAULT_CITY}
+    )
+
+    digests = defaultdict(list)
+    for row in rows:
+        digests[tuple(row.event_ids)].extend(zip(row.user_ids, row.chat_ids))
+    return digests
+
+async def send_daily_notifications(bot: Bot, city: Optional[str] = None, spread_seconds: float = 0):
+    """
+    Send personalized daily digests
     This function should be called by the scheduler every day
+    
+    Every active user gets the day's events, narrowed by their city, type
+    and radius preferences where set (real-time notifications need not be
+    enabled); each distinct event set is rendered once.
+    
+    Args:
+        bot: Telegram Bot instance
+        city: Send only digests of this city, for its local date (None - everyone, server date)
+        spread_seconds: Spread the sends evenly over this many seconds
     """
     db = SessionLocal()
     try:
-        today = date.today()
-        logger.info(f"Starting daily notifications for {today}")
+        today = city_today(city)
+        name = f"Daily notifications ({city})" if city else "Daily notifications"
+        logger.info(f"Starting {name} for {today}")
         
-        # Get all active users
-        users = db.query(TelegramUser).filter(
-            TelegramUser.is_active == True
-        ).all()
+        digests = compute_daily_digests(db, today, city)
+        if not digests:
+            logger.info(f"{name}: no events match any user today, skipping")
+            return
         
-        logger.info(f"Found {len(users)} active users")
+        event_ids = {event_id for ids in digests for event_id in ids}
+        events = {event.id: event for event in db.query(Event).filter(Event.id.in_(event_ids))}
         
-        # Get today's events
-        events = db.query(Event).filter(
-            func.date(Event.start_time) == today
-        ).all()
+        messages = []
+        for ids, recipients in digests.items():
+            message = format_daily_notification(today, [events[i] for i in ids if i in events])
+            messages.extend(
+                OutgoingMessage(chat_id=chat_id, text=message, ref=user_id)
+                for user_id, chat_id in recipients
+            )
         
-        if not events:
-            logger.info("No events today, skipping notifications")
-            return
+        logger.info(
+            f"{name}: rendered {len(digests)} distinct digests for {len(messages)} users "
+            f"from {len(event_ids)} events"
+        )
         
-        sent_count = 0
-        error_count = 0
+        results = []
+        sent = failed = 0
+        engine = DeliveryEngine(bot)
+        slices = _spread(messages, spread_seconds)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for offset, chunk in slices:
+            delay = started + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            stats = await engine.deliver(chunk, on_result=results.append, name=name)
+            sent += stats.sent
+            failed += stats.failed + stats.blocked
+        _deactivate_blocked_users(db, results)
         
-        for user in users:
-            try:
-                # Send notification with today's events
-                message = format_daily_notification(today, events)
-                await bot.send_message(
-                    chat_id=user.chat_id,
-                    text=message,
-                    parse_mode='Markdown'
-                )
-                sent_count += 1
-                logger.info(f"Sent notification to user {user.telegram_id}")
-                
-            except Exception as e:
-                error_count += 1
-                logger.error(f"Error sending notification to user {user.telegram_id}: {e}")
-                continue
-        
-        logger.info(f"Daily notifications completed. Sent: {sent_count}, Errors: {error_count}")
+        logger.info(f"{name} completed. Sent: {sent}, Errors: {failed}")
         
     except Exception as e:
         logger.error(f"Error in send_daily_notifications: {e}")
     finally:
         db.close()
 
-def format_daily_notification(today: date, events: list) -> str:
-    """Format the daily notification message"""
-    text = f"🌅 *Доброе утро!*\n\n"
-    text += f"📅 События на сегодня ({today.strftime('%d.%m.%Y')})\n\n"
-    
-    for event in events:
-        event_emoji = {
-            'concert': '🎵',
-            'theater': '🎭',
-            'exhibition': '🖼️',
-            'sport': '⚽',
-            'festival': '🎪',
-            'repair': '🚧',
-            'accident': '🚗',
-            'city_event': '🏛️'
-        }.get(event.event_type, '📍')
-        
-        text += f"{event_emoji} *{event.title}*\n"
-        if event.venue:
-            text += f"   📍 {event.venue}\n"
-        text += f"   🕐 {event.start_time.strftime('%H:%M')}"
-        if event.end_time:
-            text += f" - {event.end_time.strftime('%H:%M')}"
-        text += "\n"
-        if event.price:
-            text += f"   💰 {event.price}\n"
-        if event.description:
-            # Limit description length
-            desc = event.description[:100]
-            if len(event.description) > 100:
-                desc += "..."
-            text += f"   {desc}\n"
-        if event.source_url:
-            text += f"   🔗 [Подробнее]({event.source_url})\n"
-        text += "\n"
-    
-    text += "Хорошего дня! 😊"
-    
-    return text
+def _spread(messages: List[OutgoingMessage], spread_seconds: float) -> List[Tuple[float, List[OutgoingMessage]]]:
+    """Split messages into equal slices with start offsets evenly covering spread_seconds"""
+    if not messages:
+        return []
+    steps = max(1, min(len(messages), int(spread_seconds // DIGEST_SPREAD_STEP_SECONDS)))
+    size = -(-len(messages) // steps)
+    return [
+        (i * spread_seconds / steps, messages[i * size:(i + 1) * size])
+        for i in range(steps)
+        if messages[i * size:(i + 1) * size]
+    ]
+
+def format_daily_notification(today: date, events: list, max_length: int = DIGEST_MAX_LENGTH) -> str:
+    """Format the daily notification message, events that do not fit max_length are counted"""
+    return render_daily_digest(today, events, max_length)
 
 async def send_event_notification(bot: Bot, event_id: int):
     """
@@ -127,50 +272,18 @@ async def send_event_notification(bot: Bot, event_id: int):
             return
         
         # Format message
-        event_emoji = {
-            'concert': '🎵',
-            'theater': '🎭',
-            'exhibition': '🖼️',
-            'sport': '⚽',
-            'festival': '🎪',
-            'repair': '🚧',
-            'accident': '🚗',
-            'city_event': '🏛️'
-        }.get(event.event_type, '📍')
-        
-        message = f"🔔 *Новое событие!*\n\n"
-        message += f"{event_emoji} *{event.title}*\n\n"
-        if event.venue:
-            message += f"📍 Место: {event.venue}\n"
-        message += f"📅 Дата: {event.start_time.strftime('%d.%m.%Y')}\n"
-        message += f"🕐 Время: {event.start_time.strftime('%H:%M')}"
-        if event.end_time:
-            message += f" - {event.end_time.strftime('%H:%M')}"
-        message += "\n"
-        if event.price:
-            message += f"💰 Цена: {event.price}\n"
-        if event.description:
-            desc = event.description[:200]
-            if len(event.description) > 200:
-                desc += "..."
-            message += f"\n{desc}\n"
-        if event.source_url:
-            message += f"\n🔗 [Подробнее]({event.source_url})\n"
+        message = render_event(event, 'announcement')
         
         # Send to all subscribed users
-        sent_count = 0
-        for user in users:
-            try:
-                await bot.send_message(
-                    chat_id=user.chat_id,
-                    text=message,
-                    parse_mode='Markdown'
-                )
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Error sending event notification to user {user.telegram_id}: {e}")
+        results = []
+        stats = await DeliveryEngine(bot).deliver(
+            (OutgoingMessage(chat_id=user.chat_id, text=message, ref=user.id) for user in users),
+            on_result=results.append,
+            name=f"Event {event_id} notification"
+        )
+        _deactivate_blocked_users(db, results)
         
-        logger.info(f"Sent event notification to {sent_count} users")
+        logger.info(f"Sent event notification to {stats.sent} users")
         
     except Exception as e:
         logger.error(f"Error in send_event_notification: {e}")
@@ -0,0 +1,354 @@
+"""
+Notification Outbox
+Matched notifications are stored in notification_outbox first and sent by
+drain workers later, so imports return without waiting for Telegram and a
+crash mid-fan-out does not lose the remaining messages.
+
+Drain workers claim rows with FOR UPDATE SKIP LOCKED, so several drains
+(scheduler tick, post-import kick, other processes) never take the same
+row. Before sending, a worker inserts the (user, event, type) rows into
+notification_dedup; its primary key is the idempotency key:
+
+- already notified events are not sent again, a row whose events were
+  all notified is skipped
+- a failed send deletes the rows it inserted, so a retry can claim them
+- a worker crash between claim and send leaves the dedup rows behind, so
+  the message is dropped rather than sent twice (at-most-once)
+- a row left with only some of its events (others already notified or
+  deleted) is rendered again from the remaining events
+
+Delivered notifications are appended to the partitioned notification_history log.
+"""
+import asyncio
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+from telegram import Bot
+
+from ..database import SessionLocal
+from ..models import Event, NotificationHistory, NotificationOutbox, TelegramUser
+from .delivery import DeliveryEngine, DeliveryResult, OutgoingMessage
+from .rendering import render_new_events_message
+from .subscriber_index import subscriber_index
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv('NOTIFICATION_OUTBOX_BATCH_SIZE', '500'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', '5'))
+OUTBOX_RETRY_BASE = timedelta(seconds=30)
+# A 'sending' row older than this belongs to a crashed worker
+OUTBOX_STALE_AFTER = timedelta(minutes=10)
+# Sent and failed rows are kept this long for inspection
+OUTBOX_RETENTION = timedelta(days=7)
+
+# Payload renderers by notification type, used when only part of a row's events remain
+PAYLOAD_RENDERERS = {
+    'new_event': render_new_events_message
+}
+
+# Drain running in this process and whether new rows arrived meanwhile
+_drain_task: Optional[asyncio.Task] = None
+_drain_again = False
+
+
+def _worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_notifications(db: Session, rows: List[Dict]) -> int:
+    """
+    Store rendered notifications in the outbox with one bulk insert
+
+    Args:
+        db: Database session
+        rows: Dicts with user_id, chat_id, event_ids, payload and optionally
+            notification_type and next_attempt_at
+
+    Returns:
+        Number of enqueued notifications
+    """
+    if not rows:
+        return 0
+
+    now = datetime.now()
+    db.execute(insert(NotificationOutbox), [
+        {
+            'user_id': row['user_id'],
+            'chat_id': row['chat_id'],
+            'event_ids': list(row['event_ids']),
+            'notification_type': row.get('notification_type', 'new_event'),
+            'payload': row['payload'],
+            'max_attempts': OUTBOX_MAX_ATTEMPTS,
+            'next_attempt_at': row.get('next_attempt_at') or now
+        }
+        for row in rows
+    ])
+    db.commit()
+    logger.info(f"Enqueued {len(rows)} notifications")
+    return len(rows)
+
+
+def requeue_stale_notifications(db: Session) -> int:
+    """Return rows of crashed workers to the queue"""
+    result = db.execute(
+        text("""
+            UPDATE notification_outbox
+            SET status = 'pending', locked_by = NULL, locked_at = NULL, next_attempt_at = :now
+            WHERE status = 'sending' AND locked_at < :stale_before
+        """),
+        {"now": datetime.now(), "stale_before": datetime.now() - OUTBOX_STALE_AFTER}
+    )
+    db.commit()
+    if result.rowcount:
+        logger.warning(f"Requeued {result.rowcount} stale outbox notifications")
+    return result.rowcount
+
+
+def claim_notifications(db: Session, worker_id: str, limit: int = OUTBOX_BATCH_SIZE) -> List:
+    """Claim due pending rows for this worker"""
+    rows = db.execute(
+        text("""
+            UPDATE notification_outbox o
+            SET status = 'sending', attempts = o.attempts + 1, locked_by = :worker_id, locked_at = :now
+            WHERE o.id IN (
+                SELECT id FROM notification_outbox
+                WHERE status = 'pending' AND next_attempt_at <= :now
+                ORDER BY next_attempt_at, id
+                LIMIT :limit
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING o.id, o.user_id, o.chat_id, o.event_ids, o.notification_type,
+                      o.payload, o.attempts, o.max_attempts
+        """),
+        {"worker_id": worker_id, "now": datetime.now(), "limit": limit}
+    ).all()
+    db.commit()
+    return rows
+
+
+def _claim_dedup(db: Session, rows: List) -> Dict[int, List[int]]:
+    """
+    Insert dedup keys for claimed rows, return event ids each row may send
+
+    Events deleted since matching are dropped by the join with events.
+    """
+    inserted = set(
+        tuple(row) for row in db.execute(
+            text("""
+                INSERT INTO notification_dedup (user_id, event_id, notification_type)
+                SELECT o.user_id, e.id, o.notification_type
+                FROM notification_outbox o
+                CROSS JOIN LATERAL unnest(o.event_ids) AS ids(event_id)
+                JOIN events e ON e.id = ids.event_id
+                WHERE o.id = ANY(:ids)
+                ON CONFLICT (user_id, event_id, notification_type) DO NOTHING
+                RETURNING user_id, event_id, notification_type
+            """),
+            {"ids": [row.id for row in rows]}
+        )
+    )
+    db.commit()
+
+    fresh = {}
+    for row in rows:
+        fresh[row.id] = []
+        for event_id in row.event_ids:
+            key = (row.user_id, event_id, row.notification_type)
+            if key in inserted:
+                inserted.discard(key)
+                fresh[row.id].append(event_id)
+    return fresh
+
+
+def _payloads(db: Session, rows: List, fresh: Dict[int, List[int]]) -> Dict[int, str]:
+    """Message text per row: the stored payload, re-rendered if some events dropped out"""
+    payloads = {row.id: row.payload for row in rows}
+    partial = [
+        row for row in rows
+        if fresh[row.id] and fresh[row.id] != list(row.event_ids)
+        and row.notification_type in PAYLOAD_RENDERERS
+    ]
+    if not partial:
+        return payloads
+
+    event_ids = {event_id for row in partial for event_id in fresh[row.id]}
+    events = {event.id: event for event in db.query(Event).filter(Event.id.in_(event_ids))}
+    for row in partial:
+        remaining = [events[event_id] for event_id in fresh[row.id] if event_id in events]
+        if remaining:
+            payloads[row.id] = PAYLOAD_RENDERERS[row.notification_type](remaining)
+    return payloads
+
+
+def _release_dedup(db: Session, row, event_ids: List[int]):
+    """Delete dedup keys claimed for a message that was not delivered"""
+    db.execute(
+        text("""
+            DELETE FROM notification_dedup
+            WHERE user_id = :user_id AND notification_type = :notification_type
+              AND event_id = ANY(:event_ids)
+        """),
+        {"user_id": row.user_id, "notification_type": row.notification_type, "event_ids": event_ids}
+    )
+
+
+def _finish_batch(db: Session, results: List[DeliveryResult], fresh: Dict[int, List[int]]) -> Dict[str, int]:
+    """Store delivery outcomes of a claimed batch"""
+    now = datetime.now()
+    counts = {'sent': 0, 'retried': 0, 'failed': 0}
+    sent_ids = []
+    blocked_user_ids = []
+
+    for result in results:
+        row = result.message.ref
+        if result.ok:
+            sent_ids.append(row.id)
+            counts['sent'] += 1
+            continue
+
+        _release_dedup(db, row, fresh[row.id])
+        if result.retryable and row.attempts < row.max_attempts:
+            counts['retried'] += 1
+            db.execute(
+                text("""
+                    UPDATE notification_outbox
+                    SET status = 'pending', locked_by = NULL, next_attempt_at = :next_attempt_at, error = :error
+                    WHERE id = :id
+                """),
+                {"id": row.id, "error": result.error,
+                 "next_attempt_at": now + OUTBOX_RETRY_BASE * 2 ** (row.attempts - 1)}
+            )
+        else:
+            counts['failed'] += 1
+            if result.blocked:
+                blocked_user_ids.append(row.user_id)
+            db.execute(
+                text("UPDATE notification_outbox SET status = 'failed', locked_by = NULL, error = :error WHERE id = :id"),
+                {"id": row.id, "error": result.error}
+            )
+
+    if sent_ids:
+        db.execute(
+            text("UPDATE notification_outbox SET status = 'sent', locked_by = NULL, sent_at = :now WHERE id = ANY(:ids)"),
+            {"now": now, "ids": sent_ids}
+        )
+        db.execute(insert(NotificationHistory), [
+            {'user_id': result.message.ref.user_id, 'event_id': event_id,
+             'notification_type': result.message.ref.notification_type}
+            for result in results if result.ok
+            for event_id in fresh[result.message.ref.id]
+        ])
+    if blocked_user_ids:
+        db.query(TelegramUser).filter(TelegramUser.id.in_(blocked_user_ids)).update(
+            {'is_active': False}, synchronize_session=False
+        )
+        logger.info(f"Deactivated {len(blocked_user_ids)} users due to blocked bot")
+
+    db.commit()
+    subscriber_index.remove(blocked_user_ids)
+    return counts
+
+
+async def drain_outbox(bot: Bot, batch_size: int = OUTBOX_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Send due outbox notifications until none are left
+
+    Args:
+        bot: Telegram Bot instance
+        batch_size: Rows claimed per batch
+
+    Returns:
+        Counters: sent, skipped, retried, failed
+    """
+    worker_id = _worker_id()
+    totals = {'sent': 0, 'skipped': 0, 'retried': 0, 'failed': 0}
+
+    db = SessionLocal()
+    try:
+        requeue_stale_notifications(db)
+
+        while True:
+            rows = claim_notifications(db, worker_id, batch_size)
+            if not rows:
+                break
+
+            fresh = _claim_dedup(db, rows)
+
+            skipped_ids = [row.id for row in rows if not fresh[row.id]]
+            if skipped_ids:
+                db.execute(
+                    text("UPDATE notification_outbox SET status = 'skipped', locked_by = NULL WHERE id = ANY(:ids)"),
+                    {"ids": skipped_ids}
+                )
+                db.commit()
+                totals['skipped'] += len(skipped_ids)
+
+            payloads = _payloads(db, rows, fresh)
+            results = []
+            await DeliveryEngine(bot).deliver(
+                (
+                    OutgoingMessage(chat_id=row.chat_id, text=payloads[row.id],
+                                    disable_web_page_preview=False, ref=row)
+                    for row in rows if fresh[row.id]
+                ),
+                on_result=results.append,
+                name="Notification outbox"
+            )
+
+            for key, value in _finish_batch(db, results, fresh).items():
+                totals[key] += value
+
+            if len(rows) < batch_size:
+                break
+    finally:
+        db.close()
+
+    if any(totals.values()):
+        logger.info(f"Outbox drained: {totals}")
+    return totals
+
+
+async def _drain_loop(bot: Bot):
+    global _drain_again
+    while True:
+        _drain_again = False
+        try:
+            await drain_outbox(bot)
+        except Exception as e:
+            logger.error(f"Error draining notification outbox: {e}", exc_info=True)
+        if not _drain_again:
+            return
+
+
+def kick_outbox_drain(bot: Optional[Bot]):
+    """
+    Start draining the outbox in the background
+
+    If a drain of this process is already running, it makes one more pass
+    when finished instead of a second concurrent drain.
+    """
+    global _drain_task, _drain_again
+    if bot is None:
+        return
+    if _drain_task is not None and not _drain_task.done():
+        _drain_again = True
+        return
+    _drain_task = asyncio.ensure_future(_drain_loop(bot))
+
+
+def purge_outbox(db: Session) -> int:
+    """Delete finished rows older than retention"""
+    result = db.execute(
+        text("""
+            DELETE FROM notification_outbox
+            WHERE status IN ('sent', 'skipped', 'failed') AND created_at < :cutoff
+        """),
+        {"cutoff": datetime.now() - OUTBOX_RETENTION}
+    )
+    db.commit()
+    return result.rowcount
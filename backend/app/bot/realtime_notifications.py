@@ -1,21 +1,130 @@
 """
 Real-time notification system for new events
-Sends notifications to users when new events appear in their area
+Queues notifications for users when new events appear in their area,
+delivery is done by the notification outbox (see outbox.py)
 """
 import logging
-import json
-from datetime import datetime, time as dt_time
-from typing import List, Optional
-from sqlalchemy import func, and_, or_
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from sqlalchemy import func, text
 from sqlalchemy.orm import Session
 from telegram import Bot
-from telegram.error import TelegramError
 
 from ..database import SessionLocal
-from ..models import Event, TelegramUser, NotificationHistory
+from ..models import Event, TelegramUser, NotificationDedup
+from .outbox import enqueue_notifications, kick_outbox_drain
+from .rendering import render_new_events_message
+from .subscriber_index import IndexedEvent, subscriber_index
 
 logger = logging.getLogger(__name__)
 
+# Subscriber preferences shared by both matching branches below
+_PREFERENCE_FILTER = """
+    u.notifications_enabled AND u.is_active AND u.notify_on_import
+    AND (u.preferred_city IS NULL OR u.preferred_city = e.city)
+    AND (
+        u.preferred_event_types IS NULL OR cardinality(u.preferred_event_types) = 0
+        OR u.preferred_event_types @> ARRAY[e.event_type::text]
+    )
+    AND NOT EXISTS (
+        SELECT 1 FROM notification_dedup d
+        WHERE d.user_id = u.id AND d.event_id = e.id AND d.notification_type = 'new_event'
+    )
+"""
+
+_MATCH_SUBSCRIBERS_SQL = f"""
+    WITH matches AS (
+        -- Subscribers with a location: radius join on the user_location GiST index.
+        -- The constant largest radius makes the index usable, the per-user one is exact.
+        SELECT u.id AS user_id, e.id AS event_id, e.start_time
+        FROM events e
+        JOIN telegram_users u
+          ON ST_DWithin(
+                 u.user_location::geography, e.geom::geography,
+                 (SELECT MAX(notification_radius) FROM telegram_users WHERE user_location IS NOT NULL)
+             )
+         AND ST_DWithin(u.user_location::geography, e.geom::geography, u.notification_radius)
+        WHERE e.id = ANY(:event_ids)
+          AND e.canonical_event_id IS NULL
+          AND u.user_location IS NOT NULL AND u.notification_radius > 0
+          AND {_PREFERENCE_FILTER}
+
+        UNION ALL
+
+        -- Subscribers without a location: city and type preferences only
+        SELECT u.id, e.id, e.start_time
+        FROM events e
+        JOIN telegram_users u ON u.user_location IS NULL OR COALESCE(u.notification_radius, 0) <= 0
+        WHERE e.id = ANY(:event_ids)
+          AND e.canonical_event_id IS NULL
+          AND {_PREFERENCE_FILTER}
+    )
+    SELECT user_id, array_agg(event_id ORDER BY start_time, event_id) AS event_ids
+    FROM matches
+    GROUP BY user_id
+    ORDER BY user_id
+"""
+
+
+def match_subscribers(db: Session, event_ids: List[int]) -> List[Tuple[int, List[int]]]:
+    """
+    Match new events to subscribers
+
+    Uses the in-memory subscriber index when it is loaded (bot process),
+    otherwise joins the events to telegram_users in one SQL pass on city,
+    type preferences and notification radius. Events the user was already
+    notified about are dropped.
+
+    Args:
+        db: Database session
+        event_ids: IDs of newly created events
+
+    Returns:
+        List of (user id, matching event ids ordered by start time)
+    """
+    if not event_ids:
+        return []
+
+    if subscriber_index.loaded:
+        return _match_with_index(db, event_ids)
+
+    rows = db.execute(text(_MATCH_SUBSCRIBERS_SQL), {"event_ids": list(event_ids)}).all()
+    return [(row.user_id, list(row.event_ids)) for row in rows]
+
+
+def _match_with_index(db: Session, event_ids: List[int]) -> List[Tuple[int, List[int]]]:
+    """Point queries of the new events against the in-memory subscriber index"""
+    events = [
+        IndexedEvent(row.id, row.city, row.event_type, row.lat, row.lon)
+        for row in db.query(
+            Event.id,
+            Event.city,
+            Event.event_type,
+            func.ST_Y(Event.geom).label('lat'),
+            func.ST_X(Event.geom).label('lon')
+        ).filter(
+            Event.id.in_(event_ids),
+            Event.canonical_event_id.is_(None)
+        ).order_by(Event.start_time, Event.id)
+    ]
+    matches = subscriber_index.match_events(events)
+    if not matches:
+        return []
+
+    notified = set(
+        db.query(NotificationDedup.user_id, NotificationDedup.event_id).filter(
+            NotificationDedup.event_id.in_(event_ids),
+            NotificationDedup.notification_type == 'new_event'
+        ).all()
+    )
+
+    result = []
+    for user_id in sorted(matches):
+        ids = [event_id for event_id in matches[user_id] if (user_id, event_id) not in notified]
+        if ids:
+            result.append((user_id, ids))
+    return result
+
 
 class RealtimeNotificationService:
     """Service for sending real-time notifications about new events"""
@@ -31,7 +140,11 @@ class RealtimeNotificationService:
     
     async def notify_users_about_new_events(self, event_ids: List[int], db: Session = None):
         """
-        Notify relevant users about new events based on their preferences
+        Queue notifications about new events for relevant users
+        
+        Matched users get one rendered message each in the notification
+        outbox; delivery is done by outbox drain workers, one of which is
+        started right away when a bot is available.
         
         Args:
             event_ids: List of newly created event IDs
@@ -50,47 +163,48 @@ class RealtimeNotificationService:
             
             logger.info(f"Processing notifications for {len(event_ids)} new events")
             
-            # Get all events
-            events = db.query(Event).filter(Event.id.in_(event_ids)).all()
+            # One set-based pass: (user, matching event ids) groups
+            matches = match_subscribers(db, event_ids)
             
-            if not events:
-                logger.warning("No events found for given IDs")
+            if not matches:
+                logger.info("No subscribers match the new events")
                 return
             
-            # Get all users with notifications enabled
-            users = db.query(TelegramUser).filter(
-                TelegramUser.notifications_enabled == True,
-                TelegramUser.is_active == True,
-                TelegramUser.notify_on_import == True
-            ).all()
-            
-            logger.info(f"Found {len(users)} users with notifications enabled")
+            users = {
+                user.id: user
+                for user in db.query(TelegramUser).filter(
+                    TelegramUser.id.in_([user_id for user_id, _ in matches])
+                )
+            }
+            matched_event_ids = {event_id for _, ids in matches for event_id in ids}
+            events = {
+                event.id: event
+                for event in db.query(Event).filter(Event.id.in_(matched_event_ids))
+            }
             
-            notification_count = 0
+            logger.info(f"Matched {len(matches)} users to {len(matched_event_ids)} new events")
             
-            for user in users:
-                try:
-                    # Check if user is in quiet hours
-                    if self._is_quiet_hours(user):
-                        logger.debug(f"User {user.telegram_id} is in quiet hours, skipping")
-                        continue
-                    
-                    # Find relevant events for this user
-                    relevant_events = self._filter_events_for_user(user, events, db)
-                    
-                    if not relevant_events:
-                        continue
-                    
-                    # Send notification
-                    sent = await self._send_notification_to_user(user, relevant_events, db)
-                    if sent:
-                        notification_count += sent
+            rows = []
+            for user_id, ids in matches:
+                user = users.get(user_id)
+                if user is None:
+                    continue
                 
-                except Exception as e:
-                    logger.error(f"Error processing notifications for user {user.telegram_id}: {e}")
+                relevant_events = [events[event_id] for event_id in ids if event_id in events]
+                if not relevant_events:
                     continue
+                
+                rows.append({
+                    'user_id': user.id,
+                    'chat_id': user.chat_id,
+                    'event_ids': [event.id for event in relevant_events],
+                    'payload': render_new_events_message(relevant_events),
+                    # Users in quiet hours get the message when they end
+                    'next_attempt_at': self._quiet_hours_end(user)
+                })
             
-            logger.info(f"Sent {notification_count} notifications to users")
+            enqueue_notifications(db, rows)
+            kick_outbox_drain(self.bot)
             
         except Exception as e:
             logger.error(f"Error in notify_users_about_new_events: {e}", exc_info=True)
@@ -121,201 +235,32 @@ class RealtimeNotificationService:
         else:
             return now >= start or now <= end
     
-    def _filter_events_for_user(
-        self, 
-        user: TelegramUser, 
-        events: List[Event], 
-        db: Session
-    ) -> List[Event]:
-        """
-        Filter events based on user preferences
-        
-        Args:
-            user: TelegramUser instance
-            events: List of Event instances
-            db: Database session
-        
-        Returns:
-            List of relevant events for the user
-        """
-        relevant_events = []
-        
-        # Parse preferred event types
-        preferred_types = None
-        if user.preferred_event_types:
-            try:
-                preferred_types = json.loads(user.preferred_event_types)
-            except:
-                preferred_types = None
-        
-        for event in events:
-            # Check if already notified
-            already_notified = db.query(NotificationHistory).filter(
-                NotificationHistory.user_id == user.id,
-                NotificationHistory.event_id == event.id,
-                NotificationHistory.notification_type == 'new_event'
-            ).first()
-            
-            if already_notified:
-                continue
-            
-            # Filter by city if user has preferred city
-            if user.preferred_city and event.city != user.preferred_city:
-                continue
-            
-            # Filter by event type if user has preferences
-            if preferred_types and event.event_type not in preferred_types:
-                continue
-            
-            # Filter by location if user has set location
-            if user.user_location and user.notification_radius:
-                # Calculate distance using PostGIS
-                distance = db.query(
-                    func.ST_Distance(
-                        func.ST_Transform(user.user_location, 3857),
-                        func.ST_Transform(event.geom, 3857)
-                    )
-                ).scalar()
-                
-                if distance and distance > user.notification_radius:
-                    continue
-            
-            relevant_events.append(event)
-        
-        return relevant_events
-    
-    async def _send_notification_to_user(
-        self, 
-        user: TelegramUser, 
-        events: List[Event],
-        db: Session
-    ) -> int:
+    def _quiet_hours_end(self, user: TelegramUser) -> Optional[datetime]:
         """
-        Send notification about events to a user
+        End of user's current quiet hours
         
         Args:
             user: TelegramUser instance
-            events: List of relevant events
-            db: Database session
-        
-        Returns:
-            Number of notifications sent
-        """
-        try:
-            # Prepare notification message
-            message = self._format_notification_message(events)
-            
-            # Send message
-            await self.bot.send_message(
-                chat_id=user.chat_id,
-                text=message,
-                parse_mode='Markdown',
-                disable_web_page_preview=False
-            )
-            
-            # Record notifications in history
-            for event in events:
-                notification = NotificationHistory(
-                    user_id=user.id,
-                    event_id=event.id,
-                    notification_type='new_event'
-                )
-                db.add(notification)
-            
-            db.commit()
-            
-            logger.info(f"Sent notification to user {user.telegram_id} about {len(events)} events")
-            return len(events)
-            
-        except TelegramError as e:
-            logger.error(f"Telegram error sending notification to {user.telegram_id}: {e}")
-            
-            # Deactivate user if bot was blocked
-            if "bot was blocked" in str(e).lower() or "user is deactivated" in str(e).lower():
-                user.is_active = False
-                db.commit()
-                logger.info(f"Deactivated user {user.telegram_id} due to blocked bot")
-            
-            return 0
-        except Exception as e:
-            logger.error(f"Error sending notification to user {user.telegram_id}: {e}")
-            return 0
-    
-    def _format_notification_message(self, events: List[Event]) -> str:
-        """
-        Format notification message for events
-        
-        Args:
-            events: List of Event instances
-        
-        Returns:
-            Formatted message string
-        """
-        if len(events) == 1:
-            event = events[0]
-            message = "🔔 *Новое событие в вашем районе!*\n\n"
-            message += self._format_single_event(event)
-        else:
-            message = f"🔔 *{len(events)} новых событий в вашем районе!*\n\n"
-            for i, event in enumerate(events[:5], 1):  # Limit to 5 events
-                message += f"{i}. {self._format_single_event(event, compact=True)}\n"
-            
-            if len(events) > 5:
-                message += f"\n_...и еще {len(events) - 5} событий_"
-        
-        return message
-    
-    def _format_single_event(self, event: Event, compact: bool = False) -> str:
-        """
-        Format single event for notification
-        
-        Args:
-            event: Event instance
-            compact: If True, use compact format
         
         Returns:
-            Formatted event string
+            Datetime when quiet hours end, None if user is not in quiet hours
         """
-        event_emoji = {
-            'concert': '🎵',
-            'theater': '🎭',
-            'exhibition': '🖼️',
-            'sport': '⚽',
-            'festival': '🎪',
-            'repair': '🚧',
-            'accident': '🚗',
-            'city_event': '🏛️'
-        }.get(event.event_type, '📍')
-        
-        if compact:
-            text = f"{event_emoji} *{event.title}*"
-            if event.venue:
-                text += f" ({event.venue})"
-            text += f"\n   📅 {event.start_time.strftime('%d.%m.%Y %H:%M')}"
-        else:
-            text = f"{event_emoji} *{event.title}*\n"
-            if event.venue:
-                text += f"📍 {event.venue}\n"
-            text += f"📅 {event.start_time.strftime('%d.%m.%Y в %H:%M')}\n"
-            if event.price:
-                text += f"💰 {event.price}\n"
-            if event.description:
-                desc = event.description[:150]
-                if len(event.description) > 150:
-                    desc += "..."
-                text += f"\n{desc}\n"
-            if event.source_url:
-                text += f"\n🔗 [Подробнее]({event.source_url})"
+        if not self._is_quiet_hours(user):
+            return None
         
-        return text
+        now = datetime.now()
+        end = datetime.combine(now.date(), user.quiet_hours_end)
+        if end < now:
+            end += timedelta(days=1)
+        return end
 
 
-async def send_realtime_notifications(bot: Bot, event_ids: List[int]):
+async def send_realtime_notifications(bot: Optional[Bot], event_ids: List[int]):
     """
     Convenience function to send real-time notifications
     
     Args:
-        bot: Telegram Bot instance
+        bot: Telegram Bot instance (None only queues the notifications)
         event_ids: List of newly created event IDs
     """
     service = RealtimeNotificationService(bot)
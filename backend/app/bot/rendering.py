@@ -0,0 +1,222 @@
+"""
+Message Rendering
+Markdown templates of event messages shared by notifications and bot
+commands, with memoization: a fan-out renders every event block and every
+distinct multi-event message once, no matter how many users receive it.
+
+Event blocks are cached by (event id, last_updated, template), so an edited
+event is rendered again. Whole messages are cached by the ids and versions of
+their events plus the template parameters.
+"""
+import os
+import threading
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Hashable, List, Sequence
+
+from ..models import Event
+
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', '20000'))
+
+EVENT_EMOJI = {
+    'concert': '🎵',
+    'theater': '🎭',
+    'exhibition': '🖼️',
+    'sport': '⚽',
+    'festival': '🎪',
+    'repair': '🚧',
+    'accident': '🚗',
+    'city_event': '🏛️'
+}
+DEFAULT_EVENT_EMOJI = '📍'
+
+# Telegram allows 4096 characters per message, leave room for Markdown and the footer
+DIGEST_MAX_LENGTH = 3800
+
+
+class RenderCache:
+    """Thread-safe LRU cache of rendered strings"""
+
+    def __init__(self, max_size: int = RENDER_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key: Hashable, render: Callable[[], str]) -> str:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+
+        value = render()
+
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+render_cache = RenderCache()
+
+
+def event_emoji(event_type: str) -> str:
+    return EVENT_EMOJI.get(event_type, DEFAULT_EVENT_EMOJI)
+
+
+def _short(text: str, limit: int) -> str:
+    return text[:limit] + "..." if len(text) > limit else text
+
+
+def _time_range(event: Event) -> str:
+    text = f"🕐 {event.start_time.strftime('%H:%M')}"
+    if event.end_time:
+        text += f" - {event.end_time.strftime('%H:%M')}"
+    return text
+
+
+def _render_list_item(event: Event) -> str:
+    """Event in day lists: daily digest, /events, /tomorrow"""
+    text = f"{event_emoji(event.event_type)} *{event.title}*\n"
+    if event.venue:
+        text += f"   📍 {event.venue}\n"
+    text += f"   {_time_range(event)}\n"
+    if event.price:
+        text += f"   💰 {event.price}\n"
+    if event.description:
+        text += f"   {_short(event.description, 100)}\n"
+    if event.source_url:
+        text += f"   🔗 [Подробнее]({event.source_url})\n"
+    return text + "\n"
+
+
+def _render_week_item(event: Event) -> str:
+    """Event in the /week list: with date, without description"""
+    text = f"{event_emoji(event.event_type)} *{event.title}*\n"
+    text += f"   📅 {event.start_time.strftime('%d.%m.%Y')}\n"
+    if event.venue:
+        text += f"   📍 {event.venue}\n"
+    text += f"   {_time_range(event)}\n"
+    if event.price:
+        text += f"   💰 {event.price}\n"
+    if event.source_url:
+        text += f"   🔗 [Подробнее]({event.source_url})\n"
+    return text + "\n"
+
+
+def _render_alert(event: Event) -> str:
+    """Single new event in a real-time notification"""
+    text = f"{event_emoji(event.event_type)} *{event.title}*\n"
+    if event.venue:
+        text += f"📍 {event.venue}\n"
+    text += f"📅 {event.start_time.strftime('%d.%m.%Y в %H:%M')}\n"
+    if event.price:
+        text += f"💰 {event.price}\n"
+    if event.description:
+        text += f"\n{_short(event.description, 150)}\n"
+    if event.source_url:
+        text += f"\n🔗 [Подробнее]({event.source_url})"
+    return text
+
+
+def _render_alert_compact(event: Event) -> str:
+    """New event in a real-time notification about several events"""
+    text = f"{event_emoji(event.event_type)} *{event.title}*"
+    if event.venue:
+        text += f" ({event.venue})"
+    text += f"\n   📅 {event.start_time.strftime('%d.%m.%Y %H:%M')}"
+    return text
+
+
+def _render_announcement(event: Event) -> str:
+    """Standalone announcement of one event"""
+    text = f"🔔 *Новое событие!*\n\n"
+    text += f"{event_emoji(event.event_type)} *{event.title}*\n\n"
+    if event.venue:
+        text += f"📍 Место: {event.venue}\n"
+    text += f"📅 Дата: {event.start_time.strftime('%d.%m.%Y')}\n"
+    text += f"🕐 Время: {event.start_time.strftime('%H:%M')}"
+    if event.end_time:
+        text += f" - {event.end_time.strftime('%H:%M')}"
+    text += "\n"
+    if event.price:
+        text += f"💰 Цена: {event.price}\n"
+    if event.description:
+        text += f"\n{_short(event.description, 200)}\n"
+    if event.source_url:
+        text += f"\n🔗 [Подробнее]({event.source_url})\n"
+    return text
+
+
+EVENT_TEMPLATES = {
+    'list': _render_list_item,
+    'week': _render_week_item,
+    'alert': _render_alert,
+    'alert_compact': _render_alert_compact,
+    'announcement': _render_announcement
+}
+
+
+def _version(event: Event):
+    return event.id, event.last_updated
+
+
+def render_event(event: Event, template: str) -> str:
+    """Render one event with a template of EVENT_TEMPLATES, memoized per event version"""
+    return render_cache.get_or_render(
+        ('event', template) + _version(event),
+        lambda: EVENT_TEMPLATES[template](event)
+    )
+
+
+def render_new_events_message(events: Sequence[Event]) -> str:
+    """Real-time notification about one or several new events"""
+    def render() -> str:
+        if len(events) == 1:
+            return "🔔 *Новое событие в вашем районе!*\n\n" + render_event(events[0], 'alert')
+
+        message = f"🔔 *{len(events)} новых событий в вашем районе!*\n\n"
+        for i, event in enumerate(events[:5], 1):  # Limit to 5 events
+            message += f"{i}. {render_event(event, 'alert_compact')}\n"
+        if len(events) > 5:
+            message += f"\n_...и еще {len(events) - 5} событий_"
+        return message
+
+    return render_cache.get_or_render(
+        ('new_events', tuple(_version(event) for event in events)), render
+    )
+
+
+def render_daily_digest(day: date, events: Sequence[Event], max_length: int = DIGEST_MAX_LENGTH) -> str:
+    """Daily digest, events that do not fit max_length are counted"""
+    def render() -> str:
+        text = f"🌅 *Доброе утро!*\n\n"
+        text += f"📅 События на сегодня ({day.strftime('%d.%m.%Y')})\n\n"
+        footer = "Хорошего дня! 😊"
+
+        for shown, event in enumerate(events):
+            block = render_event(event, 'list')
+            if len(text) + len(block) + len(footer) > max_length:
+                text += f"_...и еще {len(events) - shown} событий_\n\n"
+                break
+            text += block
+
+        return text + footer
+
+    return render_cache.get_or_render(
+        ('digest', day, max_length, tuple(_version(event) for event in events)), render
+    )
+
+
+def render_event_list(header: str, events: List[Event], template: str = 'list') -> str:
+    """Event list of a bot command: header and one block per event"""
+    return header + "".join("\n" + render_event(event, template) for event in events)
@@ -3,18 +3,56 @@ Scheduler for automated tasks - event imports, cleanup, and notifications
 """
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
-from datetime import datetime, timedelta
+from apscheduler.triggers.interval import IntervalTrigger
+from collections import defaultdict
+from datetime import date, datetime, time as dt_time, timedelta
+from typing import List, Tuple
+from zoneinfo import ZoneInfo
 import logging
 import os
+import time
 import asyncio
-from ..scrapers.kudago import scrape_and_import_kudago_events
-from ..scrapers.yandex_afisha import scrape_and_import_yandex_events
-from ..cities_config import CITIES
+from ..scrapers.runner import IMPORT_SOURCES, DEFAULT_IMPORT_OPTIONS, PartialImportError, run_import_tasks
+from ..scrapers.import_schedule import RequestBudget, plan_import_tasks
+from ..scrapers.run_history import record_notify_duration
+from ..workers.import_queue import (
+    enqueue_import_tasks,
+    claim_unnotified_results,
+    requeue_stale_import_tasks
+)
+from ..cities_config import CITIES, get_city_timezone
 from .notifications import send_daily_notifications
 from .realtime_notifications import send_realtime_notifications
+from .outbox import drain_outbox, purge_outbox
+from .notification_history import maintain_notification_history
+from .subscriber_index import load_subscriber_index
 
 logger = logging.getLogger(__name__)
 
+# 'local' - run imports in this process, 'queue' - enqueue them for import workers
+IMPORT_MODE = os.getenv('IMPORT_MODE', 'local').lower()
+
+# 'adaptive' - per (source, city) intervals, 'fixed' - everything every 6 hours
+IMPORT_SCHEDULE = os.getenv('IMPORT_SCHEDULE', 'adaptive').lower()
+IMPORT_SCHEDULE_TICK_MINUTES = float(os.getenv('IMPORT_SCHEDULE_TICK_MINUTES', '5'))
+
+# How often the notification outbox is checked for due messages (retries, ended quiet hours)
+NOTIFICATION_OUTBOX_POLL_SECONDS = float(os.getenv('NOTIFICATION_OUTBOX_POLL_SECONDS', '15'))
+
+# Full reload of the in-memory subscriber index (picks up changes made outside the bot handlers)
+SUBSCRIBER_INDEX_RELOAD_MINUTES = float(os.getenv('SUBSCRIBER_INDEX_RELOAD_MINUTES', '10'))
+
+# Local time of the morning digest in every city and the window its sends are spread over
+NOTIFICATION_HOUR = int(os.getenv('NOTIFICATION_HOUR', '9'))
+NOTIFICATION_MINUTE = int(os.getenv('NOTIFICATION_MINUTE', '0'))
+DIGEST_WINDOW_MINUTES = float(os.getenv('DIGEST_WINDOW_MINUTES', '30'))
+
+# Shared HTTP request budget of scheduled imports
+_request_budget = RequestBudget()
+
+# Strong references to import runs started by the adaptive scheduler
+_running_imports = set()
+
 def setup_event_import_scheduler(scheduler: AsyncIOScheduler):
     """
     Setup scheduler for automatic event imports and maintenance tasks
@@ -29,6 +67,19 @@ def setup_event_import_scheduler(scheduler: AsyncIOScheduler):
     
     if not import_enabled:
         logger.info("Auto import is disabled")
+    elif IMPORT_SCHEDULE == 'adaptive':
+        # Check which (source, city) pairs are due every few minutes
+        scheduler.add_job(
+            adaptive_import_events_job,
+            trigger=IntervalTrigger(minutes=IMPORT_SCHEDULE_TICK_MINUTES),
+            id='auto_event_import',
+            name='Adaptive import of due (source, city) pairs',
+            replace_existing=True
+        )
+        logger.info(
+            f"Scheduled adaptive import every {IMPORT_SCHEDULE_TICK_MINUTES:g} minutes "
+            f"(mode: {IMPORT_MODE}, budget: {_request_budget.capacity:g} requests/hour)"
+        )
     else:
         # Schedule auto import every 6 hours
         scheduler.add_job(
@@ -38,7 +89,50 @@ def setup_event_import_scheduler(scheduler: AsyncIOScheduler):
             name='Auto import events from all sources',
             replace_existing=True
         )
-        logger.info("Scheduled auto import every 6 hours")
+        logger.info(f"Scheduled auto import every 6 hours (mode: {IMPORT_MODE})")
+    
+    if import_enabled and IMPORT_MODE == 'queue':
+        # Workers run imports, this process only sends notifications for their results
+        scheduler.add_job(
+            dispatch_import_results_job,
+            trigger=IntervalTrigger(minutes=1),
+            id='dispatch_import_results',
+            name='Notify about events imported by workers',
+            replace_existing=True
+        )
+        logger.info("Scheduled import results dispatch every minute")
+    
+    if notifications_enabled:
+        # Deliver queued notifications; imports also start a drain right after enqueueing
+        scheduler.add_job(
+            drain_notification_outbox_job,
+            trigger=IntervalTrigger(seconds=NOTIFICATION_OUTBOX_POLL_SECONDS),
+            id='drain_notification_outbox',
+            name='Deliver queued notifications',
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+        logger.info(f"Scheduled notification outbox drain every {NOTIFICATION_OUTBOX_POLL_SECONDS:g} seconds")
+        
+        scheduler.add_job(
+            reload_subscriber_index_job,
+            trigger=IntervalTrigger(minutes=SUBSCRIBER_INDEX_RELOAD_MINUTES),
+            id='reload_subscriber_index',
+            name='Reload in-memory subscriber index',
+            replace_existing=True
+        )
+        logger.info(f"Scheduled subscriber index reload every {SUBSCRIBER_INDEX_RELOAD_MINUTES:g} minutes")
+    
+    # Monthly partitions of notification_history: create ahead, drop after retention
+    scheduler.add_job(
+        maintain_notification_history,
+        trigger=CronTrigger(hour=3, minute=30),
+        id='maintain_notification_history',
+        name='Maintain notification history partitions',
+        replace_existing=True
+    )
+    logger.info("Scheduled notification history partition maintenance at 3:30 AM daily")
     
     if cleanup_enabled:
         # Schedule cleanup at 3:00 AM daily
@@ -52,74 +146,203 @@ def setup_event_import_scheduler(scheduler: AsyncIOScheduler):
         logger.info("Scheduled cleanup at 3:00 AM daily")
     
     if notifications_enabled:
-        # Schedule daily notifications at 9:00 AM
-        scheduler.add_job(
-            send_daily_notifications_job,
-            trigger=CronTrigger(hour=9, minute=0),
-            id='daily_notifications',
-            name='Send daily notifications',
-            replace_existing=True
-        )
-        logger.info("Scheduled daily notifications at 9:00 AM")
+        # Morning digest of every city at its local time, cities of one time zone take turns
+        for city, timezone, hour, minute, spread_seconds in plan_daily_digests():
+            scheduler.add_job(
+                send_city_digest_job,
+                trigger=CronTrigger(hour=hour, minute=minute, timezone=ZoneInfo(timezone)),
+                args=[city, spread_seconds],
+                id=f'daily_notifications_{city}',
+                name=f'Send daily notifications ({city})',
+                replace_existing=True
+            )
+            logger.info(f"Scheduled daily notifications for {city} at {hour:02d}:{minute:02d} {timezone}, "
+                        f"spread over {spread_seconds / 60:g} minutes")
 
 async def auto_import_events_job():
     """
     Job function to automatically import events from all sources for all cities
-    Now includes real-time notifications for new events
+    
+    Each (source, city) pair runs in the bounded import pool off the event loop,
+    so Telegram polling and bot handlers stay responsive. Real-time notifications
+    are sent as soon as each pair finishes, not after the slowest city.
     """
     try:
         logger.info("Starting automatic event import for all cities")
         
-        all_new_event_ids = []
-        
-        for city_slug in CITIES.keys():
-            try:
-                # Import from KudaGo
-                kudago_stats = scrape_and_import_kudago_events(
-                    city=city_slug,
-                    days_ahead=30,
-                    limit=100
-                )
-                logger.info(f"KudaGo import for {city_slug}: {kudago_stats}")
-                
-                # Collect new event IDs
-                if kudago_stats.get('new_event_ids'):
-                    all_new_event_ids.extend(kudago_stats['new_event_ids'])
-                
-                # Import from Yandex Afisha
-                yandex_stats = scrape_and_import_yandex_events(
-                    city=city_slug,
-                    days_ahead=30,
-                    limit_per_category=50
-                )
-                logger.info(f"Yandex Afisha import for {city_slug}: {yandex_stats}")
-                
-                # Collect new event IDs
-                if yandex_stats.get('new_event_ids'):
-                    all_new_event_ids.extend(yandex_stats['new_event_ids'])
-                
-            except Exception as e:
-                logger.error(f"Error importing events for city {city_slug}: {e}")
-                continue
+        tasks = [(source, city_slug) for city_slug in CITIES.keys() for source in IMPORT_SOURCES]
         
-        logger.info(f"Automatic event import completed for all cities. Total new events: {len(all_new_event_ids)}")
+        if IMPORT_MODE == 'queue':
+            enqueue_import_events(tasks)
+            return
         
-        # Send real-time notifications for new events
-        if all_new_event_ids:
-            try:
-                from .bot import get_bot_application
-                application = get_bot_application()
-                if application and application.bot:
-                    logger.info(f"Sending real-time notifications for {len(all_new_event_ids)} new events")
-                    await send_realtime_notifications(application.bot, all_new_event_ids)
-                else:
-                    logger.warning("Bot application not available for real-time notifications")
-            except Exception as e:
-                logger.error(f"Error sending real-time notifications: {e}")
+        await run_and_notify_imports(tasks)
         
     except Exception as e:
         logger.error(f"Error in auto import job: {e}")
 
+async def adaptive_import_events_job():
+    """
+    Job function to import (source, city) pairs that are due by the adaptive schedule
+    
+    Busy pairs are imported more often than quiet ones, runs are jittered and
+    limited by the shared request budget (see scrapers/import_schedule.py).
+    Imports are started in the background, so a slow city does not delay
+    the next tick.
+    """
+    from ..database import SessionLocal
+    
+    pairs = [(source, city_slug) for city_slug in CITIES.keys() for source in IMPORT_SOURCES]
+    
+    db = SessionLocal()
+    try:
+        tasks = plan_import_tasks(db, pairs, _request_budget)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error planning adaptive import: {e}")
+        return
+    finally:
+        db.close()
+    
+    if not tasks:
+        return
+    
+    logger.info(f"Adaptive import of {len(tasks)} due pairs: {tasks}")
+    
+    if IMPORT_MODE == 'queue':
+        enqueue_import_events(tasks)
+        return
+    
+    run = asyncio.ensure_future(run_and_notify_imports(tasks))
+    _running_imports.add(run)
+    run.add_done_callback(_running_imports.discard)
+
+async def run_and_notify_imports(tasks: list):
+    """
+    Run (source, city) imports in the import pool and notify about new events as each finishes
+    
+    Args:
+        tasks: List of (source, city) pairs
+    """
+    try:
+        total_new_events = 0
+        failed = 0
+        
+        async for (source, city_slug), stats, error in run_import_tasks(tasks, on_late_result=_notify_late_import):
+            if error is not None:
+                failed += 1
+                logger.error(f"Error importing {source} events for city {city_slug}: {error!r}")
+                # Batches committed before the failure created events too
+                if isinstance(error, PartialImportError) and error.new_event_ids:
+                    total_new_events += len(error.new_event_ids)
+                    await notify_about_new_events(error.new_event_ids, error.run_id)
+                continue
+            
+            logger.info(f"{source} import for {city_slug}: {stats}")
+            
+            new_event_ids = stats.get('new_event_ids') or []
+            if new_event_ids:
+                total_new_events += len(new_event_ids)
+                await notify_about_new_events(new_event_ids, stats.get('run_id'))
+        
+        logger.info(
+            f"Automatic event import completed. "
+            f"Total new events: {total_new_events}, failed tasks: {failed}/{len(tasks)}"
+        )
+        
+    except Exception as e:
+        logger.error(f"Error running imports: {e}")
+
+def _notify_late_import(task: tuple, stats: dict):
+    """Notify about events of an import that finished after its timeout"""
+    run = asyncio.ensure_future(notify_about_new_events(stats['new_event_ids'], stats.get('run_id')))
+    _running_imports.add(run)
+    run.add_done_callback(_running_imports.discard)
+
+def enqueue_import_events(tasks: list):
+    """
+    Put (source, city) import units into the shared task queue for import workers
+    
+    Args:
+        tasks: List of (source, city) pairs
+    """
+    from ..database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        requeue_stale_import_tasks(db)
+        enqueued = enqueue_import_tasks(db, tasks, DEFAULT_IMPORT_OPTIONS)
+        logger.info(f"Enqueued {enqueued} import tasks for workers")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error enqueuing import tasks: {e}")
+    finally:
+        db.close()
+
+async def dispatch_import_results_job():
+    """
+    Job function to send real-time notifications for imports finished by workers
+    """
+    from ..database import SessionLocal
+    
+    db = SessionLocal()
+    try:
+        results = claim_unnotified_results(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error fetching finished import tasks: {e}")
+        return
+    finally:
+        db.close()
+    
+    for result in results:
+        if result['new_event_ids']:
+            logger.info(f"Import task {result['id']} ({result['source']}/{result['city']}) "
+                        f"created {len(result['new_event_ids'])} events")
+            await notify_about_new_events(result['new_event_ids'], result['run_id'])
+
+async def notify_about_new_events(new_event_ids: list, run_id: int = None):
+    """
+    Queue real-time notifications for freshly imported events
+    
+    Args:
+        new_event_ids: IDs of created events
+        run_id: Import run that created them (enqueue time is added to its history)
+    """
+    try:
+        from .bot import get_bot_application
+        application = get_bot_application()
+        bot = application.bot if application else None
+        if bot is None:
+            logger.warning("Bot application not available, notifications stay queued")
+        logger.info(f"Queueing real-time notifications for {len(new_event_ids)} new events")
+        started = time.perf_counter()
+        await send_realtime_notifications(bot, new_event_ids)
+        record_notify_duration(run_id, time.perf_counter() - started)
+    except Exception as e:
+        logger.error(f"Error sending real-time notifications: {e}")
+
+async def drain_notification_outbox_job():
+    """
+    Job function to deliver due notifications from the outbox
+    """
+    try:
+        from .bot import get_bot_application
+        application = get_bot_application()
+        if application and application.bot:
+            await drain_outbox(application.bot)
+    except Exception as e:
+        logger.error(f"Error draining notification outbox: {e}")
+
+async def reload_subscriber_index_job():
+    """
+    Job function to rebuild the in-memory subscriber index
+    """
+    try:
+        await asyncio.to_thread(load_subscriber_index)
+    except Exception as e:
+        logger.error(f"Error reloading subscriber index: {e}")
+
 def cleanup_old_events_job():
     """
     Job function to cleanup old events
@@ -144,7 +367,12 @@ def cleanup_old_events_job():
         ).delete()
         
         db.commit()
-        logger.info(f"Cleanup completed: archived {archived_count}, deleted {deleted_count}")
+        
+        # Удалить доставленные и отброшенные уведомления из очереди
+        purged_count = purge_outbox(db)
+        
+        logger.info(f"Cleanup completed: archived {archived_count}, deleted {deleted_count}, "
+                    f"purged {purged_count} outbox notifications")
         
     except Exception as e:
         db.rollback()
@@ -152,19 +380,40 @@ def cleanup_old_events_job():
     finally:
         db.close()
 
-def send_daily_notifications_job():
+def plan_daily_digests() -> List[Tuple[str, str, int, int, float]]:
+    """
+    Local send times of the daily digest
+    
+    Cities of one time zone split DIGEST_WINDOW_MINUTES after the local
+    NOTIFICATION_HOUR:NOTIFICATION_MINUTE into equal slots, each city spreads
+    its sends over its slot.
+    
+    Returns:
+        List of (city, time zone, hour, minute, spread seconds)
+    """
+    by_timezone = defaultdict(list)
+    for city in CITIES:
+        by_timezone[get_city_timezone(city)].append(city)
+    
+    plan = []
+    for timezone, cities in by_timezone.items():
+        slot_minutes = DIGEST_WINDOW_MINUTES / len(cities)
+        for i, city in enumerate(cities):
+            start = datetime.combine(date.today(), dt_time(NOTIFICATION_HOUR, NOTIFICATION_MINUTE))
+            start += timedelta(minutes=int(i * slot_minutes))
+            plan.append((city, timezone, start.hour, start.minute, slot_minutes * 60))
+    return plan
+
+async def send_city_digest_job(city: str, spread_seconds: float):
     """
-    Job function to send daily notifications
+    Job function to send the daily digest of one city
     """
     try:
-        logger.info("Starting daily notifications")
-        # Get the bot application instance
         from .bot import get_bot_application
         application = get_bot_application()
-        if application:
-            send_daily_notifications(application.bot)
-            logger.info("Daily notifications completed")
+        if application and application.bot:
+            await send_daily_notifications(application.bot, city=city, spread_seconds=spread_seconds)
         else:
             logger.error("Bot application not available for notifications")
     except Exception as e:
-        logger.error(f"Error in daily notifications job: {e}")
\ No newline at end of file
+        logger.error(f"Error in daily notifications job for {city}: {e}")
\ No newline at end of file
@@ -0,0 +1,229 @@
+"""
+In-memory Subscriber Index
+Keeps notification-enabled users in process memory so new events are
+matched without scanning telegram_users:
+
+- users with a location are circles (point + notification radius) stored
+  in a per-city grid: every grid cell lists the circles that touch it, so an
+  event point only checks the circles of its own cell
+- users without a location are listed per preferred city
+- preferred event types are bitmasks, 0 means any type
+
+The index is loaded at bot startup, updated by the settings handlers and
+reloaded periodically to pick up changes made by other processes.
+"""
+import logging
+import math
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Grid cell size in degrees of latitude (~5.5 km); longitude step is scaled by latitude
+SUBSCRIBER_GRID_DEGREES = float(os.getenv('SUBSCRIBER_GRID_DEGREES', '0.05'))
+# Circles covering more cells than this are checked for every event instead
+_MAX_CELLS_PER_CIRCLE = 400
+
+METERS_PER_DEGREE = 111_320.0
+EARTH_RADIUS_M = 6_371_008.8
+
+_SUBSCRIBERS_SQL = """
+    SELECT id, chat_id, preferred_city, preferred_event_types, notification_radius,
+           ST_Y(user_location) AS lat, ST_X(user_location) AS lon
+    FROM telegram_users
+    WHERE notifications_enabled AND is_active AND notify_on_import
+"""
+
+
+class Subscriber(NamedTuple):
+    user_id: int
+    city: Optional[str]  # None - any city
+    type_mask: int  # 0 - any event type
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    radius: float = 0.0  # Metres, 0 - no location filter
+
+    @property
+    def has_circle(self) -> bool:
+        return self.lat is not None and self.lon is not None and self.radius > 0
+
+
+class IndexedEvent(NamedTuple):
+    id: int
+    city: str
+    event_type: str
+    lat: float
+    lon: float
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance in metres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+class SubscriberIndex:
+    """Per-city grid of subscriber circles plus per-city lists of users without location"""
+
+    def __init__(self, cell_degrees: float = SUBSCRIBER_GRID_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._type_bits: Dict[str, int] = {}
+        self._reset()
+
+    def _reset(self):
+        self._users: Dict[int, Subscriber] = {}
+        self._cells: Dict[Optional[str], Dict[Tuple[int, int], Set[int]]] = defaultdict(lambda: defaultdict(set))
+        self._wide: Dict[Optional[str], Set[int]] = defaultdict(set)
+        self._anywhere: Dict[Optional[str], Set[int]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def type_mask(self, event_types: Iterable[str]) -> int:
+        mask = 0
+        for event_type in event_types:
+            if event_type not in self._type_bits:
+                self._type_bits[event_type] = 1 << len(self._type_bits)
+            mask |= self._type_bits[event_type]
+        return mask
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def _circle_cells(self, subscriber: Subscriber) -> Optional[List[Tuple[int, int]]]:
+        """Grid cells touched by the bounding box of a circle, None if there are too many"""
+        d_lat = subscriber.radius / METERS_PER_DEGREE
+        d_lon = d_lat / max(math.cos(math.radians(subscriber.lat)), 0.01)
+        south, west = self._cell(subscriber.lat - d_lat, subscriber.lon - d_lon)
+        north, east = self._cell(subscriber.lat + d_lat, subscriber.lon + d_lon)
+        if (north - south + 1) * (east - west + 1) > _MAX_CELLS_PER_CIRCLE:
+            return None
+        return [(i, j) for i in range(south, north + 1) for j in range(west, east + 1)]
+
+    def _subscriber_from_row(self, row) -> Subscriber:
+        has_location = row.lat is not None and row.lon is not None and (row.notification_radius or 0) > 0
+        return Subscriber(
+            user_id=row.id,
+            city=row.preferred_city or None,
+            type_mask=self.type_mask(row.preferred_event_types or ()),
+            lat=row.lat if has_location else None,
+            lon=row.lon if has_location else None,
+            radius=float(row.notification_radius) if has_location else 0.0
+        )
+
+    def _add(self, subscriber: Subscriber):
+        self._users[subscriber.user_id] = subscriber
+        if not subscriber.has_circle:
+            self._anywhere[subscriber.city].add(subscriber.user_id)
+            return
+        cells = self._circle_cells(subscriber)
+        if cells is None:
+            self._wide[subscriber.city].add(subscriber.user_id)
+            return
+        grid = self._cells[subscriber.city]
+        for cell in cells:
+            grid[cell].add(subscriber.user_id)
+
+    def _remove(self, user_id: int):
+        subscriber = self._users.pop(user_id, None)
+        if subscriber is None:
+            return
+        if not subscriber.has_circle:
+            self._anywhere[subscriber.city].discard(user_id)
+            return
+        cells = self._circle_cells(subscriber)
+        if cells is None:
+            self._wide[subscriber.city].discard(user_id)
+            return
+        grid = self._cells[subscriber.city]
+        for cell in cells:
+            users = grid.get(cell)
+            if users is not None:
+                users.discard(user_id)
+                if not users:
+                    del grid[cell]
+
+    def load(self, db: Session) -> int:
+        """Rebuild the index from telegram_users, return number of subscribers"""
+        rows = db.execute(text(_SUBSCRIBERS_SQL)).all()
+        with self._lock:
+            self._reset()
+            for row in rows:
+                self._add(self._subscriber_from_row(row))
+            self.loaded = True
+        logger.info(f"Subscriber index loaded: {len(rows)} users")
+        return len(rows)
+
+    def refresh_user(self, db: Session, user_id: int):
+        """Re-read one user after its settings changed"""
+        row = db.execute(
+            text(_SUBSCRIBERS_SQL + " AND id = :user_id"), {"user_id": user_id}
+        ).first()
+        with self._lock:
+            self._remove(user_id)
+            if row is not None:
+                self._add(self._subscriber_from_row(row))
+
+    def remove(self, user_ids: Iterable[int]):
+        """Drop users that can no longer be notified (e.g. blocked the bot)"""
+        with self._lock:
+            for user_id in user_ids:
+                self._remove(user_id)
+
+    def match(self, event: IndexedEvent) -> List[int]:
+        """IDs of subscribers interested in an event"""
+        with self._lock:
+            bit = self._type_bits.get(event.event_type, 0)
+            cell = self._cell(event.lat, event.lon)
+            matched = []
+
+            for city in (event.city, None):
+                for user_id in self._anywhere.get(city, ()):
+                    subscriber = self._users[user_id]
+                    if not subscriber.type_mask or subscriber.type_mask & bit:
+                        matched.append(user_id)
+
+                grid = self._cells.get(city)
+                circles = list(grid.get(cell, ())) if grid else []
+                circles.extend(self._wide.get(city, ()))
+                for user_id in circles:
+                    subscriber = self._users[user_id]
+                    if subscriber.type_mask and not subscriber.type_mask & bit:
+                        continue
+                    if distance_m(subscriber.lat, subscriber.lon, event.lat, event.lon) <= subscriber.radius:
+                        matched.append(user_id)
+
+            return matched
+
+    def match_events(self, events: Iterable[IndexedEvent]) -> Dict[int, List[int]]:
+        """Subscriber id -> ids of matching events (in the given event order)"""
+        matches = defaultdict(list)
+        for event in events:
+            for user_id in self.match(event):
+                matches[user_id].append(event.id)
+        return matches
+
+
+# Process-wide index of the bot process
+subscriber_index = SubscriberIndex()
+
+
+def load_subscriber_index() -> int:
+    """Load the process-wide index in its own session (startup, periodic reload)"""
+    db = SessionLocal()
+    try:
+        return subscriber_index.load(db)
+    finally:
+        db.close()
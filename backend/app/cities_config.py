@@ -2,6 +2,8 @@
 Конфигурация городов России для карты событий
 """
 
+DEFAULT_TIMEZONE = "Europe/Moscow"
+
 CITIES = {
     "voronezh": {
         "name": "Воронеж",
@@ -9,6 +11,7 @@ CITIES = {
         "lat": 51.6606,
         "lon": 39.2003,
         "zoom": 13,
+        "timezone": "Europe/Moscow",
         "country": "Россия"
     },
     "moscow": {
@@ -17,6 +20,7 @@ CITIES = {
         "lat": 55.7558,
         "lon": 37.6173,
         "zoom": 11,
+        "timezone": "Europe/Moscow",
         "country": "Россия"
     },
     "spb": {
@@ -25,6 +29,7 @@ CITIES = {
         "lat": 59.9343,
         "lon": 30.3351,
         "zoom": 11,
+        "timezone": "Europe/Moscow",
         "country": "Россия"
     },
     "ekaterinburg": {
@@ -33,6 +38,7 @@ CITIES = {
         "lat": 56.8389,
         "lon": 60.6057,
         "zoom": 12,
+        "timezone": "Asia/Yekaterinburg",
         "country": "Россия"
     },
     "kazan": {
@@ -41,6 +47,7 @@ CITIES = {
         "lat": 55.7964,
         "lon": 49.1089,
         "zoom": 12,
+        "timezone": "Europe/Moscow",
         "country": "Россия"
     },
     "novosibirsk": {
@@ -49,6 +56,7 @@ CITIES = {
         "lat": 55.0084,
         "lon": 82.9357,
         "zoom": 12,
+        "timezone": "Asia/Novosibirsk",
         "country": "Россия"
     },
     "nizhny_novgorod": {
@@ -57,6 +65,7 @@ CITIES = {
         "lat": 56.3269,
         "lon": 44.0059,
         "zoom": 12,
+        "timezone": "Europe/Moscow",
         "country": "Россия"
     },
     "samara": {
@@ -65,6 +74,7 @@ CITIES = {
         "lat": 53.2001,
         "lon": 50.1500,
         "zoom": 12,
+        "timezone": "Europe/Samara",
         "country": "Россия"
     },
     "rostov": {
@@ -73,6 +83,7 @@ CITIES = {
         "lat": 47.2357,
         "lon": 39.7015,
         "zoom": 12,
+        "timezone": "Europe/Moscow",
         "country": "Россия"
     },
     "ufa": {
@@ -81,6 +92,7 @@ CITIES = {
         "lat": 54.7388,
         "lon": 55.9721,
         "zoom": 12,
+        "timezone": "Asia/Yekaterinburg",
         "country": "Россия"
     }
 }
@@ -89,6 +101,11 @@ def get_city_info(city_slug: str) -> dict:
     """Получить информацию о городе по slug"""
     return CITIES.get(city_slug.lower())
 
+def get_city_timezone(city_slug: str) -> str:
+    """Часовой пояс города (IANA), по умолчанию московский"""
+    info = get_city_info(city_slug)
+    return info.get("timezone", DEFAULT_TIMEZONE) if info else DEFAULT_TIMEZONE
+
 def get_all_cities() -> list:
     """Получить список всех городов"""
     return [
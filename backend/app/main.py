@@ -1,19 +1,37 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+import asyncio
 import logging
-from .routers import events
+from .routers import events, imports, districts
 from .bot import start_bot, stop_bot
 from .cities_config import get_all_cities
+from .database import SessionLocal
+from .utils.city_boundaries import load_city_boundaries
+from .utils.districts import load_districts
 
 logger = logging.getLogger(__name__)
 
+def _load_boundaries():
+    """Load city boundary and district polygons from GeoJSON files"""
+    db = SessionLocal()
+    try:
+        logger.info(f"City boundaries: {load_city_boundaries(db)}")
+        logger.info(f"Districts: {load_districts(db)}")
+    finally:
+        db.close()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Manage application lifespan - startup and shutdown"""
     # Startup
     logger.info("Starting application...")
     
+    try:
+        await asyncio.to_thread(_load_boundaries)
+    except Exception as e:
+        logger.error(f"Failed to load boundaries: {e}")
+    
     try:
         await start_bot()
         logger.info("Telegram bot started")
@@ -47,6 +65,8 @@ app.add_middleware(
 )
 
 app.include_router(events.router, prefix="/api", tags=["События"])
+app.include_router(imports.router, prefix="/api", tags=["Импорт"])
+app.include_router(districts.router, prefix="/api", tags=["Районы"])
 
 @app.get("/")
 def read_root():
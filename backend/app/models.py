@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, BigInteger, ForeignKey, Boolean, Time
+from sqlalchemy import Column, Integer, String, DateTime, Date, Text, BigInteger, ForeignKey, Boolean, Time, Float
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from geoalchemy2 import Geometry
 from datetime import datetime
@@ -24,6 +25,10 @@ class Event(Base):
     last_updated = Column(DateTime, default=datetime.utcnow)  # Время последнего обновления
     created_at = Column(DateTime, default=datetime.utcnow)
     is_archived = Column(Boolean, default=False)  # Мягкое удаление
+    canonical_event_id = Column(Integer, ForeignKey('events.id', ondelete='SET NULL'))  # Дубликат из другого источника
+    outside_city_bounds = Column(Boolean, default=False)  # Точка вне границы города (заполняет триггер)
+    district_id = Column(Integer, ForeignKey('districts.id', ondelete='SET NULL'))  # Район (заполняет триггер)
+    geohash = Column(String(12))  # Geohash точки, точность 9 (заполняет триггер)
 
 class TelegramUser(Base):
     __tablename__ = "telegram_users"
@@ -44,8 +49,8 @@ class TelegramUser(Base):
     user_location = Column(Geometry(geometry_type='POINT', srid=4326))
     preferred_city = Column(String(50))
     
-    # Event type preferences (JSON string)
-    preferred_event_types = Column(Text)  # JSON array as string
+    # Event type preferences, NULL or empty - any type
+    preferred_event_types = Column(ARRAY(Text))
     
     # Notification settings
     notify_on_import = Column(Boolean, default=True)
@@ -53,14 +58,148 @@ class TelegramUser(Base):
     quiet_hours_end = Column(Time)
 
 class NotificationHistory(Base):
-    __tablename__ = "notification_history"
+    __tablename__ = "notification_history"  # Partitioned by month of sent_at
     
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(BigInteger, primary_key=True)
+    sent_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey('telegram_users.id', ondelete='CASCADE'), nullable=False)
-    event_id = Column(Integer, ForeignKey('events.id', ondelete='CASCADE'), nullable=False)
-    sent_at = Column(DateTime, default=datetime.utcnow)
-    notification_type = Column(String(50), default='new_event')
+    event_id = Column(Integer, nullable=False)  # No FK: the log outlives deleted events
+    notification_type = Column(String(50), nullable=False, default='new_event')
     
     # Relationships
     user = relationship("TelegramUser")
-    event = relationship("Event")
\ No newline at end of file
+
+class NotificationDedup(Base):
+    __tablename__ = "notification_dedup"
+    
+    user_id = Column(Integer, ForeignKey('telegram_users.id', ondelete='CASCADE'), primary_key=True)
+    event_id = Column(Integer, ForeignKey('events.id', ondelete='CASCADE'), primary_key=True)
+    notification_type = Column(String(50), primary_key=True, default='new_event')
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class NotificationOutbox(Base):
+    __tablename__ = "notification_outbox"
+    
+    id = Column(BigInteger, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('telegram_users.id', ondelete='CASCADE'), nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
+    event_ids = Column(ARRAY(Integer), nullable=False)
+    notification_type = Column(String(50), nullable=False, default='new_event')
+    payload = Column(Text, nullable=False)  # Rendered message text
+    status = Column(String(20), nullable=False, default='pending')  # pending, sending, sent, skipped, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    next_attempt_at = Column(DateTime, nullable=False, default=datetime.now)
+    locked_by = Column(String(100))
+    locked_at = Column(DateTime)
+    sent_at = Column(DateTime)
+    error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ImportTask(Base):
+    __tablename__ = "import_tasks"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(50), nullable=False)  # kudago, yandex_afisha
+    city = Column(String(50), nullable=False)
+    options = Column(Text)  # JSON object with scraper options
+    status = Column(String(20), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = Column(String(100))
+    locked_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    result = Column(Text)  # JSON import statistics
+    error = Column(Text)
+    notified = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ImportWatermark(Base):
+    __tablename__ = "import_watermarks"
+    
+    source = Column(String(50), primary_key=True)
+    city = Column(String(50), primary_key=True)
+    last_publication_date = Column(DateTime)  # Newest publication time seen in the source
+    last_seen_ids = Column(Text)  # JSON array of ids published at last_publication_date
+    last_full_sync_at = Column(DateTime)  # Last full reconciliation pass
+    last_run_at = Column(DateTime)
+
+
+class ScraperEndpoint(Base):
+    __tablename__ = "scraper_endpoints"
+    
+    source = Column(String(50), primary_key=True)
+    city = Column(String(50), primary_key=True)
+    category = Column(String(50), primary_key=True)
+    endpoint = Column(String(50), nullable=False)  # Endpoint key, e.g. rubric, selection
+    last_success_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ImportSchedule(Base):
+    __tablename__ = "import_schedule"
+    
+    source = Column(String(50), primary_key=True)
+    city = Column(String(50), primary_key=True)
+    change_rate = Column(Float)  # EWMA of created/updated events per hour
+    failure_rate = Column(Float, nullable=False, default=0.0)  # EWMA of failed runs (0..1)
+    requests_per_run = Column(Float)  # EWMA of HTTP requests per run
+    interval_seconds = Column(Integer)
+    last_status = Column(String(20))  # ok, failed
+    last_run_at = Column(DateTime)
+    next_run_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+
+class ImportRun(Base):
+    __tablename__ = "import_runs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String(50), nullable=False)
+    city = Column(String(50), nullable=False)
+    trigger = Column(String(20), nullable=False)  # schedule, manual, worker
+    status = Column(String(20), nullable=False)  # completed, failed
+    started_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    duration_seconds = Column(Float)
+    fetch_seconds = Column(Float)  # Time spent waiting for source pages
+    parse_seconds = Column(Float)
+    write_seconds = Column(Float)
+    notify_seconds = Column(Float)
+    http_requests = Column(Integer, default=0)
+    http_bytes = Column(BigInteger, default=0)
+    total = Column(Integer, default=0)
+    created = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    unchanged = Column(Integer, default=0)
+    errors = Column(Integer, default=0)
+    peak_memory_bytes = Column(BigInteger)  # tracemalloc peak
+    error = Column(Text)
+
+class City(Base):
+    __tablename__ = "cities"
+    
+    slug = Column(String(50), primary_key=True)  # Key of CITIES in cities_config.py
+    name = Column(String(100), nullable=False)
+    boundary = Column(Geometry(geometry_type='MULTIPOLYGON', srid=4326), nullable=False)
+    source_hash = Column(String(64))  # SHA-256 of the loaded GeoJSON file
+    loaded_at = Column(DateTime, default=datetime.utcnow)
+
+class District(Base):
+    __tablename__ = "districts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    city = Column(String(50), nullable=False, index=True)
+    name = Column(String(255), nullable=False)
+    population = Column(Integer)
+    geom = Column(Geometry(geometry_type='MULTIPOLYGON', srid=4326), nullable=False)
+    source_hash = Column(String(64))  # SHA-256 of the loaded GeoJSON file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class DistrictEventStats(Base):
+    __tablename__ = "district_event_stats"
+    
+    district_id = Column(Integer, ForeignKey('districts.id', ondelete='CASCADE'), primary_key=True)
+    event_type = Column(String(50), primary_key=True)
+    day = Column(Date, primary_key=True)
+    events_count = Column(Integer, nullable=False, default=0)  # Maintained by trigger on events
@@ -0,0 +1,158 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+from collections import defaultdict
+import json
+import logging
+from ..database import get_db
+from ..models import Event, District, DistrictEventStats
+from ..schemas import EventResponse
+from ..cities_config import CITIES
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Районы города со статистикой событий (GeoJSON для хороплета)
+@router.get("/{city}/districts")
+def get_city_districts(
+    city: str,
+    date_from: Optional[date] = Query(None, description="Начало периода (по умолчанию сегодня)"),
+    date_to: Optional[date] = Query(None, description="Конец периода включительно (по умолчанию +30 дней)"),
+    event_type: Optional[str] = None,
+    simplify: float = Query(0.0005, ge=0, description="Допуск упрощения геометрии в градусах (0 - без упрощения)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Получить районы города с количеством событий за период
+
+    Количество берется из district_event_stats, который обновляется
+    триггером при изменении событий, а не считается по событиям на запрос.
+    """
+    if city not in CITIES:
+        raise HTTPException(status_code=404, detail=f"Город '{city}' не найден")
+
+    date_from = date_from or datetime.utcnow().date()
+    date_to = date_to or date_from + timedelta(days=30)
+
+    geometry = District.geom
+    if simplify > 0:
+        geometry = func.ST_SimplifyPreserveTopology(District.geom, simplify)
+
+    districts = db.query(
+        District.id,
+        District.name,
+        District.population,
+        func.ST_AsGeoJSON(geometry).label('geometry')
+    ).filter(District.city == city).order_by(District.name).all()
+
+    stats_query = db.query(
+        DistrictEventStats.district_id,
+        DistrictEventStats.event_type,
+        func.sum(DistrictEventStats.events_count).label('count')
+    ).join(District, District.id == DistrictEventStats.district_id).filter(
+        District.city == city,
+        DistrictEventStats.day >= date_from,
+        DistrictEventStats.day <= date_to,
+        DistrictEventStats.events_count > 0
+    )
+    if event_type:
+        stats_query = stats_query.filter(DistrictEventStats.event_type == event_type)
+
+    by_type = defaultdict(dict)
+    for row in stats_query.group_by(DistrictEventStats.district_id, DistrictEventStats.event_type):
+        by_type[row.district_id][row.event_type] = int(row.count)
+
+    features = []
+    for district in districts:
+        types = by_type.get(district.id, {})
+        total = sum(types.values())
+        features.append({
+            "type": "Feature",
+            "id": district.id,
+            "geometry": json.loads(district.geometry),
+            "properties": {
+                "id": district.id,
+                "name": district.name,
+                "population": district.population,
+                "events_count": total,
+                "events_by_type": types,
+                "events_per_100k": round(total / district.population * 100000, 2) if district.population else None
+            }
+        })
+
+    return {
+        "type": "FeatureCollection",
+        "city": city,
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "features": features
+    }
+
+# События района
+@router.get("/{city}/districts/{district_id}/events", response_model=List[EventResponse])
+def get_district_events(
+    city: str,
+    district_id: int,
+    event_type: Optional[str] = None,
+    upcoming_only: Optional[bool] = None,
+    db: Session = Depends(get_db)
+):
+    """Получить события района (по назначенному при импорте district_id)"""
+    if city not in CITIES:
+        raise HTTPException(status_code=404, detail=f"Город '{city}' не найден")
+
+    district = db.query(District.id).filter(District.id == district_id, District.city == city).first()
+    if not district:
+        raise HTTPException(status_code=404, detail=f"Район {district_id} не найден в городе '{city}'")
+
+    query = db.query(
+        Event.id,
+        Event.title,
+        Event.event_type,
+        Event.description,
+        func.ST_X(Event.geom).label('lon'),
+        func.ST_Y(Event.geom).label('lat'),
+        Event.start_time,
+        Event.end_time,
+        Event.source,
+        Event.source_url,
+        Event.image_url,
+        Event.price,
+        Event.venue,
+        Event.created_at
+    ).filter(
+        Event.district_id == district_id,
+        Event.is_archived == False,
+        Event.canonical_event_id.is_(None)
+    )
+
+    if upcoming_only is True:
+        query = query.filter(Event.start_time > datetime.utcnow())
+
+    if event_type:
+        query = query.filter(Event.event_type == event_type)
+
+    events = query.order_by(Event.start_time).all()
+
+    return [
+        EventResponse(
+            id=evt.id,
+            title=evt.title,
+            event_type=evt.event_type,
+            description=evt.description,
+            lat=evt.lat,
+            lon=evt.lon,
+            start_time=evt.start_time,
+            end_time=evt.end_time,
+            source=evt.source,
+            source_url=evt.source_url,
+            image_url=evt.image_url,
+            price=evt.price,
+            venue=evt.venue,
+            created_at=evt.created_at
+        )
+        for evt in events
+    ]
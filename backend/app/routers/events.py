@@ -6,13 +6,26 @@ from typing import List, Optional
 from datetime import datetime, timedelta
 import logging
 from ..database import get_db
-from ..models import Event
+from ..models import Event, City
 from ..schemas import EventResponse, EventCreate
+from ..scrapers.jobs import ImportJobConflict, import_jobs
+from ..utils.city_detector import UNKNOWN_CITY, detect_city_by_coordinates
+from ..utils.geohash import GEOHASH_PRECISION, bounds as geohash_bounds
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# Уровень ячеек geohash для масштаба карты Leaflet
+ZOOM_GEOHASH_PRECISION = {
+    **{z: 3 for z in range(0, 6)},
+    **{z: 4 for z in range(6, 9)},
+    **{z: 5 for z in range(9, 12)},
+    **{z: 6 for z in range(12, 14)},
+    **{z: 7 for z in range(14, 17)},
+    **{z: 8 for z in range(17, 21)}
+}
+
 # Получить все события (устаревший endpoint - рекомендуется использовать /{city}/events)
 @router.get("/events", response_model=List[EventResponse])
 def get_events(
@@ -38,7 +51,7 @@ def get_events(
         Event.price,
         Event.venue,
         Event.created_at
-    ).filter(Event.is_archived == False)
+    ).filter(Event.is_archived == False, Event.canonical_event_id.is_(None))
     
     if event_type:
         query = query.filter(Event.event_type == event_type)
@@ -78,6 +91,24 @@ def get_events(
         for evt in events
     ]
 
+def _resolve_city(db: Session, lat: float, lon: float) -> Optional[str]:
+    """
+    Город точки: ближайший центр в пределах CITY_MAX_DISTANCE_KM, иначе загруженная граница
+
+    Если загружена граница, триггер уточнит город по ST_Contains.
+
+    Returns:
+        Slug города или None, если точка вне поддерживаемых городов
+    """
+    city = detect_city_by_coordinates(lat, lon)
+    if city != UNKNOWN_CITY:
+        return city
+    point = func.ST_SetSRID(func.ST_MakePoint(lon, lat), 4326)
+    return db.query(City.slug).filter(
+        func.ST_Contains(City.boundary, point)
+    ).order_by(func.ST_Area(City.boundary)).limit(1).scalar()
+
+
 # Создать новое событие
 @router.post("/events", response_model=EventResponse)
 def create_event(
@@ -85,11 +116,16 @@ def create_event(
     db: Session = Depends(get_db)
 ):
     """Создать новое событие"""
+    point = func.ST_SetSRID(func.ST_MakePoint(event.lon, event.lat), 4326)
+    city = _resolve_city(db, event.lat, event.lon)
+    if city is None:
+        raise HTTPException(status_code=400, detail="Координаты события вне поддерживаемых городов")
+    
     new_event = Event(
         title=event.title,
         event_type=event.event_type,
         description=event.description,
-        geom=func.ST_SetSRID(func.ST_MakePoint(event.lon, event.lat), 4326),
+        geom=point,
         start_time=event.start_time,
         end_time=event.end_time,
         source=event.source or 'manual',
@@ -97,7 +133,7 @@ def create_event(
         image_url=event.image_url,
         price=event.price,
         venue=event.venue,
-        city='moscow'  # Временно, пока не будет передачи города в схеме
+        city=city
     )
     
     db.add(new_event)
@@ -192,6 +228,7 @@ def get_nearby_events(
         ).label('distance')
     ).filter(
         Event.is_archived == False,
+        Event.canonical_event_id.is_(None),
         func.ST_DWithin(
             func.ST_Transform(Event.geom, 3857),
             func.ST_Transform(user_point, 3857),
@@ -343,116 +380,82 @@ def get_event_types(db: Session = Depends(get_db)):
     ]
 
 # Импорт событий из KudaGo
-@router.post("/events/import/kudago")
+@router.post("/events/import/kudago", status_code=202)
 async def import_kudago_events(
     city: str = Query("voronezh", description="Город для импорта"),
     categories: Optional[List[str]] = Query(None, description="Категории событий"),
     days_ahead: int = Query(30, description="Дней вперед"),
-    limit: int = Query(500, description="Максимальное количество событий для импорта"),
-    db: Session = Depends(get_db)
+    limit: int = Query(500, description="Максимальное количество событий для импорта")
 ):
     """
-    Импортировать события из KudaGo
+    Запустить фоновый импорт событий из KudaGo
     
     Параметры:
     - city: Город (voronezh, moscow, spb и т.д.)
     - categories: Список категорий (concert, theater, exhibition, sport, festival)
     - days_ahead: Количество дней вперед для импорта
     - limit: Максимальное количество событий (по умолчанию 500)
-    """
-    from ..scrapers.kudago import scrape_and_import_kudago_events
-    from ..bot.realtime_notifications import send_realtime_notifications
-    from ..bot import get_bot
     
-    try:
-        stats = scrape_and_import_kudago_events(
-            city=city,
-            categories=categories,
-            days_ahead=days_ahead,
-            limit=limit
-        )
-        # Calculate imported as created + updated
-        imported = stats.get('created', 0) + stats.get('updated', 0)
-        
-        # Send notifications about new events
-        new_event_ids = stats.get('new_event_ids', [])
-        if new_event_ids:
-            try:
-                bot = get_bot()
-                if bot:
-                    await send_realtime_notifications(bot, new_event_ids)
-                    logger.info(f"Sent notifications for {len(new_event_ids)} new events")
-            except Exception as e:
-                logger.error(f"Error sending notifications: {e}")
-                # Don't fail the import if notifications fail
-        
-        return {
-            "status": "success",
-            "source": "kudago",
-            "statistics": {
-                **stats,
-                "imported": imported
-            },
-            "message": f"Импортировано {imported} событий из KudaGo"
-        }
-    except Exception as e:
-        logger.error(f"KudaGo import error: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка импорта из KudaGo: {str(e)}")
+    Возвращает id задачи сразу, прогресс доступен через /api/import/jobs/{id}.
+    Повторный запрос для того же города с теми же параметрами присоединяется к уже
+    идущей задаче, с другими параметрами - получает 409.
+    """
+    return _submit_import_job(
+        'kudago',
+        city,
+        categories=categories,
+        days_ahead=days_ahead,
+        limit=limit
+    )
 
 # Импорт событий из Яндекс.Афиши
-@router.post("/events/import/yandex")
+@router.post("/events/import/yandex", status_code=202)
 async def import_yandex_events(
     city: str = Query("voronezh", description="Город для импорта"),
     categories: Optional[List[str]] = Query(None, description="Категории событий"),
-    days_ahead: int = Query(30, description="Дней вперед"),
-    db: Session = Depends(get_db)
+    days_ahead: int = Query(30, description="Дней вперед")
 ):
     """
-    Импортировать события из Яндекс.Афиши
+    Запустить фоновый импорт событий из Яндекс.Афиши
     
     Параметры:
     - city: Город (voronezh, moscow, spb и т.д.)
     - categories: Список категорий (concert, theater, exhibition, sport, festival)
     - days_ahead: Количество дней вперед для импорта
-    """
-    from ..scrapers.yandex_afisha import scrape_and_import_yandex_events
-    from ..bot.realtime_notifications import send_realtime_notifications
-    from ..bot import get_bot
     
+    Возвращает id задачи сразу, прогресс доступен через /api/import/jobs/{id}.
+    Повторный запрос для того же города с теми же параметрами присоединяется к уже
+    идущей задаче, с другими параметрами - получает 409.
+    """
+    return _submit_import_job(
+        'yandex_afisha',
+        city,
+        categories=categories,
+        days_ahead=days_ahead,
+        limit_per_category=50
+    )
+
+def _submit_import_job(source: str, city: str, **options) -> dict:
+    """Запустить задачу импорта или присоединиться к идущей с теми же параметрами"""
     try:
-        stats = scrape_and_import_yandex_events(
-            city=city,
-            categories=categories,
-            days_ahead=days_ahead,
-            limit_per_category=50
+        job, created = import_jobs.submit(source, city, **options)
+    except ImportJobConflict as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Импорт {source} для города '{city}' уже идет с другими параметрами (задача {e.job.id})"
         )
-        # Calculate imported as created + updated
-        imported = stats.get('created', 0) + stats.get('updated', 0)
-        
-        # Send notifications about new events
-        new_event_ids = stats.get('new_event_ids', [])
-        if new_event_ids:
-            try:
-                bot = get_bot()
-                if bot:
-                    await send_realtime_notifications(bot, new_event_ids)
-                    logger.info(f"Sent notifications for {len(new_event_ids)} new events")
-            except Exception as e:
-                logger.error(f"Error sending notifications: {e}")
-                # Don't fail the import if notifications fail
-        
-        return {
-            "status": "success",
-            "source": "yandex_afisha",
-            "statistics": {
-                **stats,
-                "imported": imported
-            },
-            "message": f"Импортировано {imported} событий из Яндекс.Афиши"
-        }
-    except Exception as e:
-        logger.error(f"Yandex Afisha import error: {e}")
-        raise HTTPException(status_code=500, detail=f"Ошибка импорта из Яндекс.Афиши: {str(e)}")
+    return _import_job_response(job, created)
+
+def _import_job_response(job, created: bool) -> dict:
+    """Ответ на запуск фоновой задачи импорта"""
+    return {
+        "status": "accepted",
+        "job_id": job.id,
+        "coalesced": not created,
+        "status_url": f"/api/import/jobs/{job.id}",
+        "events_url": f"/api/import/jobs/{job.id}/events",
+        "job": job.to_dict()
+    }
 
 # Импорт тестовых данных для Москвы
 @router.post("/events/import/test-moscow")
@@ -548,7 +551,8 @@ async def import_test_moscow_events(db: Session = Depends(get_db)):
                     image_url=None,
                     price=random.choice(['Бесплатно', 'от 500 ₽', '300-800 ₽', 'от 1000 ₽', '1500-3000 ₽']),
                     venue=venue['name'],
-                    city='moscow'
+                    city=(_resolve_city(db, venue['lat'], venue['lon'])
+                          or detect_city_by_coordinates(venue['lat'], venue['lon'], max_distance_km=None))
                 )
             
                 db.add(new_event)
@@ -680,7 +684,8 @@ async def import_test_spb_events(db: Session = Depends(get_db)):
                     image_url=None,
                     price=random.choice(['Бесплатно', 'от 500 ₽', '300-800 ₽', 'от 1000 ₽', '1500-3000 ₽']),
                     venue=venue['name'],
-                    city='spb'
+                    city=(_resolve_city(db, venue['lat'], venue['lon'])
+                          or detect_city_by_coordinates(venue['lat'], venue['lon'], max_distance_km=None))
                 )
             
                 db.add(new_event)
@@ -752,19 +757,25 @@ def get_city_events(
         Event.created_at
     ).filter(
         Event.city == city,
-        Event.is_archived == False
+        Event.is_archived == False,
+        Event.canonical_event_id.is_(None)
     )
     
     # Фильтр по видимой области карты
     if bounds:
         try:
             north, south, east, west = map(float, bounds.split(','))
-            query = query.filter(
-                func.ST_Within(
-                    Event.geom,
-                    func.ST_MakeEnvelope(west, south, east, north, 4326)
-                )
-            )
+            envelope = func.ST_MakeEnvelope(west, south, east, north, 4326)
+
+            # Видимая область не пересекает границу города - события не ищем
+            outside_city = db.query(City.slug).filter(
+                City.slug == city,
+                ~func.ST_Intersects(City.boundary, envelope)
+            ).first()
+            if outside_city:
+                return []
+
+            query = query.filter(func.ST_Within(Event.geom, envelope))
         except ValueError:
             pass  # Невалидные bounds - игнорируем
     
@@ -796,6 +807,76 @@ def get_city_events(
         for evt in events
     ]
 
+# Кластеры событий города по ячейкам geohash
+@router.get("/{city}/events/clusters")
+def get_city_event_clusters(
+    city: str,
+    zoom: Optional[int] = Query(None, ge=0, le=20, description="Масштаб карты для выбора уровня ячеек"),
+    precision: Optional[int] = Query(None, ge=1, le=GEOHASH_PRECISION, description="Уровень ячеек geohash"),
+    event_type: Optional[str] = None,
+    upcoming_only: Optional[bool] = None,
+    bounds: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Получить количество событий по ячейкам geohash
+
+    Группировка идет по префиксу сохраненного events.geohash, без
+    пространственных вычислений на запрос.
+    """
+    from ..cities_config import CITIES
+    if city not in CITIES:
+        raise HTTPException(status_code=404, detail=f"Город '{city}' не найден")
+
+    if precision is None:
+        precision = ZOOM_GEOHASH_PRECISION.get(zoom, 6) if zoom is not None else 6
+
+    cell = func.left(Event.geohash, precision).label('cell')
+    query = db.query(
+        cell,
+        func.count(Event.id).label('count'),
+        func.avg(func.ST_Y(Event.geom)).label('lat'),
+        func.avg(func.ST_X(Event.geom)).label('lon')
+    ).filter(
+        Event.city == city,
+        Event.is_archived == False,
+        Event.canonical_event_id.is_(None),
+        Event.geohash.isnot(None)
+    )
+
+    if bounds:
+        try:
+            north, south, east, west = map(float, bounds.split(','))
+            query = query.filter(
+                func.ST_Within(Event.geom, func.ST_MakeEnvelope(west, south, east, north, 4326))
+            )
+        except ValueError:
+            pass  # Невалидные bounds - игнорируем
+
+    if upcoming_only is True:
+        query = query.filter(Event.start_time > datetime.utcnow())
+
+    if event_type:
+        query = query.filter(Event.event_type == event_type)
+
+    rows = query.group_by(cell).all()
+
+    return {
+        "city": city,
+        "precision": precision,
+        "count": len(rows),
+        "clusters": [
+            {
+                "cell": row.cell,
+                "count": row.count,
+                "lat": row.lat,
+                "lon": row.lon,
+                "bounds": geohash_bounds(row.cell)  # south, west, north, east
+            }
+            for row in rows
+        ]
+    }
+
 # События в радиусе для конкретного города
 @router.get("/{city}/events/nearby")
 def get_city_nearby_events(
@@ -830,6 +911,7 @@ def get_city_nearby_events(
     ).filter(
         Event.city == city,
         Event.is_archived == False,
+        Event.canonical_event_id.is_(None),
         func.ST_DWithin(
             func.ST_Transform(Event.geom, 3857),
             func.ST_Transform(user_point, 3857),
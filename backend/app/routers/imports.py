@@ -0,0 +1,82 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Optional
+import logging
+from ..database import get_db
+from ..scrapers.jobs import import_jobs
+from ..scrapers.circuit_breaker import get_breaker_states
+from ..scrapers.import_schedule import get_schedule_states
+from ..scrapers.run_history import get_import_runs
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Список фоновых задач импорта
+@router.get("/import/jobs")
+def get_import_jobs():
+    """Получить список фоновых задач импорта (активных и недавно завершенных)"""
+    jobs = import_jobs.list_jobs()
+    return {
+        "count": len(jobs),
+        "jobs": [job.to_dict() for job in jobs]
+    }
+
+# Состояние задачи импорта
+@router.get("/import/jobs/{job_id}")
+def get_import_job(job_id: str):
+    """Получить фазу, счетчики прогресса и тайминги задачи импорта"""
+    job = import_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job.to_dict()
+
+# Поток прогресса задачи импорта (Server-Sent Events)
+@router.get("/import/jobs/{job_id}/events")
+def stream_import_job(job_id: str):
+    """Получить прогресс задачи импорта в виде потока Server-Sent Events"""
+    if not import_jobs.get(job_id):
+        raise HTTPException(status_code=404, detail="Import job not found")
+
+    return StreamingResponse(
+        import_jobs.stream(job_id),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # Отключить буферизацию в nginx
+        }
+    )
+
+# Состояние circuit breaker'ов источников
+@router.get("/import/breakers")
+def get_import_breakers():
+    """Получить состояние circuit breaker'ов источников и их эндпоинтов"""
+    breakers = get_breaker_states()
+    return {
+        "count": len(breakers),
+        "open": [b["name"] for b in breakers if b["state"] != "closed"],
+        "breakers": breakers
+    }
+
+# Адаптивное расписание импорта
+@router.get("/import/schedule")
+def get_import_schedule(db: Session = Depends(get_db)):
+    """Получить интервалы, частоту изменений и ошибок и время следующего импорта для пар (источник, город)"""
+    pairs = get_schedule_states(db)
+    return {
+        "count": len(pairs),
+        "pairs": pairs
+    }
+
+# История запусков импорта
+@router.get("/import/runs")
+def get_import_run_history(
+    source: Optional[str] = None,
+    city: Optional[str] = None,
+    hours: int = Query(24, ge=1, le=24 * 90, description="Окно агрегации в часах"),
+    limit: int = Query(50, ge=1, le=500, description="Максимум запусков в ответе"),
+    db: Session = Depends(get_db)
+):
+    """Получить последние запуски импорта с таймингами этапов, HTTP-трафиком и пиком памяти, а также агрегаты по (источник, город)"""
+    return get_import_runs(db, source=source, city=city, hours=hours, limit=limit)
@@ -0,0 +1,139 @@
+"""
+Circuit Breakers for scraper sources
+A breaker opens after consecutive failures and rejects calls for an
+exponentially growing backoff period. After the backoff a single probe
+request is let through (half-open): success closes the breaker, failure
+re-opens it with a longer backoff. Dead sources then cost milliseconds
+instead of a timeout per request.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_FAILURES', '3'))
+BASE_BACKOFF = float(os.getenv('CIRCUIT_BREAKER_BACKOFF', '60'))
+MAX_BACKOFF = float(os.getenv('CIRCUIT_BREAKER_MAX_BACKOFF', '3600'))
+
+
+class CircuitBreaker:
+    """Thread-safe circuit breaker with exponential backoff and half-open probing"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str,
+                 failure_threshold: int = FAILURE_THRESHOLD,
+                 base_backoff: float = BASE_BACKOFF,
+                 max_backoff: float = MAX_BACKOFF):
+        """
+        Args:
+            name: Breaker name (e.g. 'kudago' or 'yandex_afisha:rubric')
+            failure_threshold: Consecutive failures that open the breaker
+            base_backoff: First open period in seconds
+            max_backoff: Upper bound of the open period in seconds
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.times_opened = 0
+        self.open_until = 0.0
+        self.total_successes = 0
+        self.total_failures = 0
+        self.total_rejected = 0
+        self.last_error = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a call may go through
+
+        Returns:
+            False while the breaker is open or a half-open probe is already running
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() >= self.open_until:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            self.total_rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.total_successes += 1
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit breaker '{self.name}' closed")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self.times_opened = 0
+            self._probe_in_flight = False
+
+    def record_failure(self, error: str = None):
+        with self._lock:
+            self.total_failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+            self._probe_in_flight = False
+
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                backoff = min(self.base_backoff * (2 ** self.times_opened), self.max_backoff)
+                self.times_opened += 1
+                self.state = self.OPEN
+                self.open_until = time.monotonic() + backoff
+                logger.warning(f"Circuit breaker '{self.name}' opened for {backoff:.0f}s: {error}")
+
+    def release_probe(self):
+        """Give back a half-open probe that made no call, the next request probes instead"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            retry_in = max(0.0, self.open_until - time.monotonic()) if self.state == self.OPEN else 0.0
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "retry_in_seconds": round(retry_in, 1),
+                "total_successes": self.total_successes,
+                "total_failures": self.total_failures,
+                "total_rejected": self.total_rejected,
+                "last_error": self.last_error
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Get (or create) process-wide breaker by name"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def get_breaker_states() -> List[Dict]:
+    """Get state of all known breakers"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return [breaker.to_dict() for breaker in sorted(breakers, key=lambda b: b.name)]
@@ -0,0 +1,224 @@
+"""
+Cross-Source Duplicate Detection
+The same event often comes from both KudaGo and Yandex Afisha. Freshly
+imported events are matched against events of other sources and linked to
+a canonical copy via events.canonical_event_id.
+
+Matching stays near-linear: candidates are blocked by (geohash cell,
+start day), so each event is only compared with the few events in its own
+and the neighbouring cells of the same and adjacent days (listings that
+straddle midnight), then scored by trigram
+similarity of normalized titles. Cells are prefixes of the stored
+events.geohash column, so no geometry is read or computed.
+"""
+import logging
+import os
+import re
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import func, text, update
+from sqlalchemy.orm import Session
+
+from ..models import Event
+from ..utils import geohash
+from .venue_gazetteer import trigrams
+
+logger = logging.getLogger(__name__)
+
+# Geohash level of blocking cells (6 ~ 1.2 x 0.6 km)
+CELL_PRECISION = int(os.getenv('DEDUP_CELL_PRECISION', '6'))
+# Minimal Jaccard similarity of title trigrams to treat events as the same
+TITLE_SIMILARITY_THRESHOLD = float(os.getenv('DEDUP_TITLE_SIMILARITY', '0.6'))
+# Maximal start time difference of duplicates
+MAX_START_DIFFERENCE = timedelta(hours=3)
+
+# Words that differ between sources for the same event
+TITLE_STOP_WORDS = {
+    'концерт', 'спектакль', 'выставка', 'шоу', 'фестиваль',
+    'в', 'на', 'и', 'с'
+}
+
+_NON_WORD_RE = re.compile(r'[^\w\s]+', re.UNICODE)
+_SPACES_RE = re.compile(r'\s+')
+
+
+class MatchRecord(NamedTuple):
+    id: int
+    source: str
+    start_time: datetime
+    cell: str
+    grams: Set[str]
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """
+    Normalize event title for comparison
+
+    Lowercases, replaces 'ё', strips quotes/punctuation and genre words
+    that one source puts into the title and the other does not.
+    """
+    if not title:
+        return ''
+
+    text_ = title.lower().replace('ё', 'е')
+    text_ = _NON_WORD_RE.sub(' ', text_)
+    words = [w for w in _SPACES_RE.split(text_) if w and w not in TITLE_STOP_WORDS]
+    return ' '.join(words)
+
+
+def title_similarity(a: Set[str], b: Set[str]) -> float:
+    """Jaccard similarity of two trigram sets"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def cell_with_neighbors(cell: str) -> List[str]:
+    """Geohash cell and the cells around it"""
+    return [cell] + geohash.neighbors(cell)
+
+
+class DuplicateIndex:
+    """Blocking index of events by (geohash cell, start day)"""
+
+    def __init__(self):
+        self._blocks: Dict[Tuple[str, date], List[MatchRecord]] = defaultdict(list)
+
+    def add(self, record: MatchRecord):
+        self._blocks[(record.cell, record.start_time.date())].append(record)
+
+    def candidates(self, record: MatchRecord) -> Iterable[MatchRecord]:
+        """
+        Events in the same and neighbouring cells starting on the same or an adjacent day
+
+        MAX_START_DIFFERENCE is shorter than a day, so a duplicate across
+        midnight (23:30 vs 00:30) is always in one of the adjacent days.
+        """
+        day = record.start_time.date()
+        days = (day - timedelta(days=1), day, day + timedelta(days=1))
+        for cell in cell_with_neighbors(record.cell):
+            for block_day in days:
+                yield from self._blocks.get((cell, block_day), ())
+
+    def best_match(self, record: MatchRecord) -> Tuple[Optional[MatchRecord], float]:
+        """Most similar event of another source, if it passes the threshold"""
+        best, best_score = None, 0.0
+        for candidate in self.candidates(record):
+            if candidate.source == record.source or candidate.id == record.id:
+                continue
+            if abs(candidate.start_time - record.start_time) > MAX_START_DIFFERENCE:
+                continue
+            score = title_similarity(record.grams, candidate.grams)
+            if score > best_score:
+                best, best_score = candidate, score
+
+        if best_score >= TITLE_SIMILARITY_THRESHOLD:
+            return best, best_score
+        return None, best_score
+
+
+def _load_records(query) -> List[MatchRecord]:
+    return [
+        MatchRecord(
+            id=row.id,
+            source=row.source,
+            start_time=row.start_time,
+            cell=row.cell,
+            grams=trigrams(normalize_title(row.title))
+        )
+        for row in query
+    ]
+
+
+def _cell_column():
+    return func.left(Event.geohash, CELL_PRECISION)
+
+
+def _record_query(db: Session):
+    return db.query(
+        Event.id,
+        Event.source,
+        Event.title,
+        Event.start_time,
+        _cell_column().label('cell')
+    )
+
+
+def link_cross_source_duplicates(db: Session, event_ids: List[int]) -> int:
+    """
+    Link freshly imported events to canonical events of other sources
+
+    The event that was known first stays canonical, the new one gets
+    canonical_event_id pointing to it.
+
+    Args:
+        db: Database session
+        event_ids: IDs of newly created events
+
+    Returns:
+        Number of events linked as duplicates
+    """
+    if not event_ids:
+        return 0
+
+    new_by_city = defaultdict(list)
+    for row in _record_query(db).add_columns(Event.city).filter(Event.id.in_(event_ids)):
+        new_by_city[row.city].append(row)
+
+    links = []
+    for city, rows in new_by_city.items():
+        new_records = [r for r in _load_records(rows) if r.cell]
+        if not new_records:
+            continue
+        cells = {cell for r in new_records for cell in cell_with_neighbors(r.cell)}
+        first_day = min(r.start_time for r in new_records) - MAX_START_DIFFERENCE
+        last_day = max(r.start_time for r in new_records) + MAX_START_DIFFERENCE
+
+        # One query per city: canonical events of the covered cells and time range
+        index = DuplicateIndex()
+        candidates = _record_query(db).filter(
+            Event.city == city,
+            _cell_column().in_(cells),
+            Event.is_archived == False,
+            Event.canonical_event_id.is_(None),
+            Event.start_time.between(first_day, last_day),
+            ~Event.id.in_(event_ids)
+        )
+        for record in _load_records(candidates):
+            index.add(record)
+
+        for record in new_records:
+            match, score = index.best_match(record)
+            if match is not None:
+                links.append({'id': record.id, 'canonical_event_id': match.id})
+                logger.debug(f"Event {record.id} duplicates {match.id} (similarity {score:.2f})")
+
+    if links:
+        db.execute(update(Event), links)
+        db.commit()
+        logger.info(f"Linked {len(links)} cross-source duplicates")
+    return len(links)
+
+
+def unlink_archived_canonicals(db: Session) -> int:
+    """
+    Release duplicates whose canonical event got archived
+
+    Such duplicates become visible again instead of disappearing together
+    with the canonical copy.
+
+    Returns:
+        Number of released events
+    """
+    result = db.execute(text("""
+        UPDATE events AS dup
+        SET canonical_event_id = NULL
+        FROM events AS canonical
+        WHERE dup.canonical_event_id = canonical.id
+          AND canonical.is_archived = TRUE
+          AND dup.is_archived = FALSE
+    """))
+    db.commit()
+    return result.rowcount
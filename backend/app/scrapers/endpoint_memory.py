@@ -0,0 +1,64 @@
+"""
+Endpoint Memory
+Persists which API endpoint worked for each (source, city, category), so the
+next run tries it first instead of walking through known dead URLs.
+"""
+import logging
+from datetime import datetime
+from typing import Dict
+
+from ..database import SessionLocal
+from ..models import ScraperEndpoint
+
+logger = logging.getLogger(__name__)
+
+
+def load_preferred_endpoints(source: str, city: str) -> Dict[str, str]:
+    """
+    Load remembered endpoints for a city
+
+    Args:
+        source: Import source
+        city: City slug
+
+    Returns:
+        Mapping of category -> endpoint key (empty if nothing is known or DB is unavailable)
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(ScraperEndpoint.category, ScraperEndpoint.endpoint).filter(
+            ScraperEndpoint.source == source,
+            ScraperEndpoint.city == city
+        ).all()
+        return {row.category: row.endpoint for row in rows}
+    except Exception as e:
+        logger.error(f"Error loading preferred endpoints for {source}/{city}: {e}")
+        return {}
+    finally:
+        db.close()
+
+
+def remember_endpoint(source: str, city: str, category: str, endpoint: str):
+    """
+    Store endpoint that returned events for (source, city, category)
+    """
+    db = SessionLocal()
+    try:
+        row = db.query(ScraperEndpoint).filter(
+            ScraperEndpoint.source == source,
+            ScraperEndpoint.city == city,
+            ScraperEndpoint.category == category
+        ).first()
+
+        if row is None:
+            row = ScraperEndpoint(source=source, city=city, category=category)
+            db.add(row)
+
+        row.endpoint = endpoint
+        row.last_success_at = datetime.utcnow()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error remembering endpoint for {source}/{city}/{category}: {e}")
+    finally:
+        db.close()
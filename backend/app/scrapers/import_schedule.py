@@ -0,0 +1,234 @@
+"""
+Adaptive Import Schedule
+Each (source, city) pair gets its own import interval instead of one fixed
+cron for everything:
+
+- change rate: EWMA of created/updated events per hour. Busy pairs (Moscow
+  on KudaGo) are polled often, quiet ones (a small city on Yandex) rarely.
+- failure rate: EWMA of failed runs. Failing pairs back off.
+- jitter: every planned run is shifted randomly, so pairs drift apart
+  instead of all firing at the same instant.
+- budget: a global token bucket of HTTP requests per hour. Due pairs that
+  do not fit are deferred to a later tick.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import ImportSchedule
+
+logger = logging.getLogger(__name__)
+
+MIN_INTERVAL = timedelta(minutes=float(os.getenv('IMPORT_MIN_INTERVAL_MINUTES', '60')))
+MAX_INTERVAL = timedelta(hours=float(os.getenv('IMPORT_MAX_INTERVAL_HOURS', '24')))
+DEFAULT_INTERVAL = timedelta(hours=6)
+
+# Interval is chosen so that a run picks up about this many changed events
+TARGET_CHANGES_PER_RUN = float(os.getenv('IMPORT_TARGET_CHANGES_PER_RUN', '20'))
+IMPORT_REQUESTS_PER_HOUR = float(os.getenv('IMPORT_REQUESTS_PER_HOUR', '600'))
+JITTER = float(os.getenv('IMPORT_SCHEDULE_JITTER', '0.15'))
+EWMA_ALPHA = 0.3
+
+# Cost estimate of pairs that never ran (HTTP requests per run)
+DEFAULT_REQUESTS_PER_RUN = {'kudago': 2, 'yandex_afisha': 10}
+
+
+def ewma(previous: Optional[float], value: float, alpha: float = EWMA_ALPHA) -> float:
+    """Exponentially weighted moving average step"""
+    if previous is None:
+        return value
+    return alpha * value + (1 - alpha) * previous
+
+
+def compute_interval(change_rate: Optional[float], failure_rate: float) -> timedelta:
+    """
+    Interval until the next run of a pair
+
+    Args:
+        change_rate: Changed events per hour (None if unknown)
+        failure_rate: Share of recent failed runs (0..1)
+    """
+    if change_rate is None:
+        interval = DEFAULT_INTERVAL
+    elif change_rate <= 0:
+        interval = MAX_INTERVAL
+    else:
+        interval = timedelta(hours=TARGET_CHANGES_PER_RUN / change_rate)
+
+    # Failing sources are polled less, circuit breakers handle short outages
+    interval *= 1 + 3 * (failure_rate or 0.0)
+    return max(MIN_INTERVAL, min(interval, MAX_INTERVAL))
+
+
+def with_jitter(interval: timedelta) -> timedelta:
+    """Randomly stretch or shrink interval by up to JITTER"""
+    return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+class RequestBudget:
+    """Token bucket of HTTP requests per hour shared by scheduled imports"""
+
+    def __init__(self, requests_per_hour: float = IMPORT_REQUESTS_PER_HOUR):
+        self.capacity = requests_per_hour
+        self.tokens = requests_per_hour
+        self._refill_per_second = requests_per_hour / 3600
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self._refill_per_second)
+        self._updated = now
+
+    def try_acquire(self, cost: float) -> bool:
+        """Take `cost` requests from the budget if available"""
+        with self._lock:
+            self._refill()
+            # A run costlier than the whole bucket still goes when the bucket is full
+            cost = min(cost, self.capacity)
+            if self.tokens < cost:
+                return False
+            self.tokens -= cost
+            return True
+
+    @property
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+def _ensure_rows(db: Session, pairs: Iterable[Tuple[str, str]], now: datetime):
+    """Create schedule rows for new pairs, spreading their first runs"""
+    known = {(row.source, row.city) for row in db.query(ImportSchedule.source, ImportSchedule.city)}
+    for source, city in pairs:
+        if (source, city) not in known:
+            db.add(ImportSchedule(
+                source=source,
+                city=city,
+                failure_rate=0.0,
+                next_run_at=now + MIN_INTERVAL * random.random()
+            ))
+    db.flush()
+
+
+def plan_import_tasks(db: Session, pairs: Iterable[Tuple[str, str]],
+                      budget: RequestBudget, now: Optional[datetime] = None) -> List[Tuple[str, str]]:
+    """
+    Pick pairs that are due and fit into the request budget
+
+    Picked pairs get a provisional next run time, so a slow import is not
+    picked again before record_import_outcome() replaces it.
+
+    Args:
+        db: Database session
+        pairs: All (source, city) pairs that may be imported
+        budget: Shared request budget
+        now: Current time (UTC)
+
+    Returns:
+        List of (source, city) pairs to import now
+    """
+    now = now or datetime.utcnow()
+    pairs = list(pairs)
+    _ensure_rows(db, pairs, now)
+
+    allowed = set(pairs)
+    due = db.query(ImportSchedule).filter(
+        ImportSchedule.next_run_at <= now
+    ).order_by(ImportSchedule.next_run_at).with_for_update(skip_locked=True).all()
+
+    selected = []
+    for row in due:
+        if (row.source, row.city) not in allowed:
+            continue
+
+        cost = row.requests_per_run or DEFAULT_REQUESTS_PER_RUN.get(row.source, 10)
+        if not budget.try_acquire(cost):
+            # Keep order: most overdue pairs go first once the budget refills
+            logger.info("Import request budget exhausted, deferring remaining due pairs")
+            break
+
+        interval = timedelta(seconds=row.interval_seconds) if row.interval_seconds else DEFAULT_INTERVAL
+        row.next_run_at = now + with_jitter(interval)
+        selected.append((row.source, row.city))
+
+    db.commit()
+    return selected
+
+
+def record_import_outcome(source: str, city: str,
+                          stats: Optional[Dict] = None,
+                          error: Optional[BaseException] = None):
+    """
+    Update change/failure rates of a pair after an import and plan its next run
+
+    Never raises: scheduling state must not break the import itself.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        row = db.query(ImportSchedule).filter(
+            ImportSchedule.source == source,
+            ImportSchedule.city == city
+        ).with_for_update().first()
+        if row is None:
+            row = ImportSchedule(source=source, city=city, failure_rate=0.0)
+            db.add(row)
+
+        stats = stats or {}
+        failed = error is not None or bool(stats.get('fetch_failed'))
+
+        if not failed:
+            # Manual runs right after a scheduled one must not inflate the rate
+            elapsed = (now - row.last_run_at) if row.last_run_at else DEFAULT_INTERVAL
+            hours = max(elapsed, MIN_INTERVAL).total_seconds() / 3600
+            changes = stats.get('created', 0) + stats.get('updated', 0)
+            row.change_rate = ewma(row.change_rate, changes / hours)
+
+        row.failure_rate = ewma(row.failure_rate or 0.0, 1.0 if failed else 0.0)
+        if stats.get('http_requests'):
+            row.requests_per_run = ewma(row.requests_per_run, float(stats['http_requests']))
+
+        interval = compute_interval(row.change_rate, row.failure_rate)
+        row.interval_seconds = int(interval.total_seconds())
+        row.last_status = 'failed' if failed else 'ok'
+        row.last_run_at = now
+        row.next_run_at = now + with_jitter(interval)
+        db.commit()
+
+        logger.info(
+            f"Next {source}/{city} import in {interval} "
+            f"(change rate {row.change_rate or 0:.1f}/h, failure rate {row.failure_rate:.2f})"
+        )
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error recording import outcome for {source}/{city}: {e}")
+    finally:
+        db.close()
+
+
+def get_schedule_states(db: Session) -> List[Dict]:
+    """Current schedule of all pairs, soonest first"""
+    rows = db.query(ImportSchedule).order_by(ImportSchedule.next_run_at).all()
+    return [
+        {
+            "source": row.source,
+            "city": row.city,
+            "change_rate": round(row.change_rate, 2) if row.change_rate is not None else None,
+            "failure_rate": round(row.failure_rate or 0.0, 2),
+            "requests_per_run": round(row.requests_per_run, 1) if row.requests_per_run is not None else None,
+            "interval_seconds": row.interval_seconds,
+            "last_status": row.last_status,
+            "last_run_at": row.last_run_at.isoformat() if row.last_run_at else None,
+            "next_run_at": row.next_run_at.isoformat() if row.next_run_at else None
+        }
+        for row in rows
+    ]
@@ -0,0 +1,333 @@
+"""
+Background Import Jobs
+Runs manual (API triggered) imports as background jobs with progress tracking.
+Duplicate requests for the same (source, city) and options are coalesced
+into one job; a request with other options while a job runs is a conflict.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from .runner import IMPORT_TASK_TIMEOUT, PartialImportError, get_import_executor, run_import
+from .run_history import record_notify_duration
+
+logger = logging.getLogger(__name__)
+
+# Human readable source names used in result messages
+SOURCE_NAMES = {
+    'kudago': 'KudaGo',
+    'yandex_afisha': 'Яндекс.Афиши',
+}
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+class ImportJobConflict(Exception):
+    """A job for the same (source, city) with different options is already running"""
+
+    def __init__(self, job: 'ImportJob'):
+        super().__init__(f"Import job {job.id} for {job.source}/{job.city} is running with other options")
+        self.job = job
+
+
+def _normalize_options(options: Dict) -> Dict:
+    """Options in comparable form: no empty values, category lists sorted"""
+    normalized = {}
+    for name, value in options.items():
+        if value is None or value == []:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = sorted(value)
+        normalized[name] = value
+    return normalized
+
+
+class ImportJob:
+    """
+    State of a single background import
+
+    Progress is updated from the import thread, so every mutation goes
+    through a lock and bumps `version` for change detection by streams.
+    """
+
+    def __init__(self, source: str, city: str, options: Dict):
+        self.id = uuid.uuid4().hex
+        self.source = source
+        self.city = city
+        self.options = options
+        self.status = 'queued'  # queued, running, completed, failed
+        self.phase = 'queued'   # queued, fetching, importing, cancelling, notifying, done
+        self.progress: Dict = {}
+        self.stats: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.phase_durations: Dict[str, float] = {}
+        self.version = 0
+        self.cancel_event = threading.Event()
+        self._phase_started = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def set_phase(self, phase: str, **counters):
+        """Switch to a new phase, accounting time spent in the previous one"""
+        with self._lock:
+            now = time.monotonic()
+            if phase != self.phase:
+                self.phase_durations[self.phase] = round(
+                    self.phase_durations.get(self.phase, 0.0) + now - self._phase_started, 3
+                )
+                self._phase_started = now
+                self.phase = phase
+            if counters:
+                self.progress.update(counters)
+            self.version += 1
+
+    def update_progress(self, phase: str, counters: Dict):
+        """Progress callback passed to the scrapers (called from the import thread)"""
+        self.set_phase(phase, **counters)
+
+    def start(self):
+        with self._lock:
+            self.status = 'running'
+            self.started_at = datetime.utcnow()
+            self.version += 1
+
+    def finish(self, stats: Optional[Dict] = None, error: Optional[str] = None):
+        self.set_phase('done')
+        with self._lock:
+            self.stats = stats
+            self.error = error
+            self.status = 'failed' if error else 'completed'
+            self.finished_at = datetime.utcnow()
+            self.version += 1
+
+    def result(self) -> Optional[Dict]:
+        """Result in the same shape the synchronous import endpoints used to return"""
+        if self.stats is None:
+            return None
+
+        imported = self.stats.get('created', 0) + self.stats.get('updated', 0)
+        return {
+            "status": "success",
+            "source": self.source,
+            "statistics": {
+                **self.stats,
+                "imported": imported
+            },
+            "message": f"Импортировано {imported} событий из {SOURCE_NAMES.get(self.source, self.source)}"
+        }
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            if self.started_at:
+                end = self.finished_at or datetime.utcnow()
+                elapsed = round((end - self.started_at).total_seconds(), 3)
+            else:
+                elapsed = None
+
+            return {
+                "id": self.id,
+                "source": self.source,
+                "city": self.city,
+                "options": self.options,
+                "status": self.status,
+                "phase": self.phase,
+                "progress": dict(self.progress),
+                "timings": {
+                    "created_at": self.created_at.isoformat(),
+                    "started_at": self.started_at.isoformat() if self.started_at else None,
+                    "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+                    "elapsed_seconds": elapsed,
+                    "phases": dict(self.phase_durations)
+                },
+                "error": self.error,
+                "result": self.result()
+            }
+
+
+class ImportJobManager:
+    """In-process registry and executor of background import jobs"""
+
+    # How long finished jobs stay queryable
+    RETENTION_SECONDS = 3600
+    # Poll interval of progress streams
+    STREAM_INTERVAL = 0.5
+
+    def __init__(self):
+        self._jobs: Dict[str, ImportJob] = {}
+        self._active: Dict[Tuple[str, str], str] = {}
+        self._tasks = set()  # Strong references to running asyncio tasks
+        self._lock = threading.Lock()
+
+    def submit(self, source: str, city: str, **options) -> Tuple[ImportJob, bool]:
+        """
+        Submit an import job, coalescing with a running job for the same (source, city) and options
+
+        Must be called from the event loop.
+
+        Args:
+            source: Import source ('kudago' or 'yandex_afisha')
+            city: City slug
+            **options: Import options passed to the scraper
+
+        Returns:
+            Tuple of (job, created) - created is False when an existing job was reused
+
+        Raises:
+            ImportJobConflict: A job for (source, city) with other options is running
+        """
+        key = (source, city)
+        with self._lock:
+            self._prune()
+
+            active_id = self._active.get(key)
+            if active_id and not self._jobs[active_id].is_finished:
+                active = self._jobs[active_id]
+                if _normalize_options(active.options) != _normalize_options(options):
+                    raise ImportJobConflict(active)
+                return active, False
+
+            job = ImportJob(source, city, options)
+            self._jobs[job.id] = job
+            self._active[key] = job.id
+
+        task = asyncio.get_running_loop().create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        logger.info(f"Submitted import job {job.id} for {source}/{city}")
+        return job, True
+
+    def get(self, job_id: str) -> Optional[ImportJob]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[ImportJob]:
+        return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    async def stream(self, job_id: str) -> AsyncIterator[str]:
+        """
+        Stream job progress as Server-Sent Events until the job finishes
+
+        Args:
+            job_id: Job ID
+
+        Yields:
+            SSE formatted messages
+        """
+        job = self.get(job_id)
+        if job is None:
+            return
+
+        last_version = -1
+        while True:
+            if job.version != last_version:
+                last_version = job.version
+                payload = json.dumps(job.to_dict(), ensure_ascii=False, default=str)
+                event = 'done' if job.is_finished else 'progress'
+                yield f"event: {event}\ndata: {payload}\n\n"
+
+            if job.is_finished:
+                return
+
+            await asyncio.sleep(self.STREAM_INTERVAL)
+
+    async def _run(self, job: ImportJob):
+        """Execute job in the shared import pool and notify about new events"""
+        job.start()
+        job.set_phase('fetching')
+
+        future = get_import_executor().submit(
+            partial(
+                run_import,
+                job.source,
+                job.city,
+                job.cancel_event,
+                job.update_progress,
+                **job.options
+            )
+        )
+        try:
+            # shield: a timeout must not detach the job from the still running thread
+            stats = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)),
+                                           timeout=IMPORT_TASK_TIMEOUT)
+        except asyncio.TimeoutError:
+            error = f"Import timed out after {IMPORT_TASK_TIMEOUT:.0f}s"
+            job.cancel_event.set()
+            if not future.cancel():
+                # The thread stops at its next checkpoint; until then the job stays
+                # active, so a resubmit joins it instead of importing concurrently
+                job.set_phase('cancelling')
+                logger.warning(f"Import job {job.id} timed out, waiting for the import to stop")
+                await self._finish_late(job, future)
+            job.finish(error=error)
+            logger.warning(f"Import job {job.id} timed out")
+            return
+        except Exception as e:
+            await self._notify_partial(job, e)
+            job.finish(error=str(e))
+            logger.error(f"Import job {job.id} failed: {e}")
+            return
+
+        new_event_ids = stats.get('new_event_ids') or []
+        if new_event_ids:
+            job.set_phase('notifying', new_events=len(new_event_ids))
+            started = time.perf_counter()
+            await self._notify(new_event_ids)
+            record_notify_duration(stats.get('run_id'), time.perf_counter() - started)
+
+        job.finish(stats=stats)
+        logger.info(f"Import job {job.id} completed: {stats}")
+
+    async def _finish_late(self, job: ImportJob, future):
+        """Wait for a cancelled import thread and notify about events it created"""
+        try:
+            stats = await asyncio.wrap_future(future)
+        except Exception as e:
+            await self._notify_partial(job, e)
+            return
+        if stats.get('new_event_ids'):
+            await self._notify(stats['new_event_ids'])
+
+    async def _notify_partial(self, job: ImportJob, error: BaseException):
+        """Notify about events committed before the import failed"""
+        if isinstance(error, PartialImportError) and error.new_event_ids:
+            job.set_phase('notifying', new_events=len(error.new_event_ids))
+            await self._notify(error.new_event_ids)
+
+    async def _notify(self, new_event_ids: List[int]):
+        """Queue real-time notifications, never failing the job because of them"""
+        from ..bot.realtime_notifications import send_realtime_notifications
+        from ..bot import get_bot
+
+        try:
+            # Without a bot the notifications stay queued for the outbox drain
+            await send_realtime_notifications(get_bot(), new_event_ids)
+            logger.info(f"Queued notifications for {len(new_event_ids)} new events")
+        except Exception as e:
+            logger.error(f"Error sending notifications: {e}")
+
+    def _prune(self):
+        """Forget finished jobs older than retention (called under lock)"""
+        cutoff = datetime.utcnow().timestamp() - self.RETENTION_SECONDS
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.is_finished and job.finished_at.timestamp() < cutoff
+        ]
+        for job_id in expired:
+            job = self._jobs.pop(job_id)
+            if self._active.get((job.source, job.city)) == job_id:
+                del self._active[(job.source, job.city)]
+
+
+# Process-wide job manager
+import_jobs = ImportJobManager()
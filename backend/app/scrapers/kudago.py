@@ -5,16 +5,28 @@ API Documentation: https://docs.kudago.com/
 """
 import requests
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from typing import Callable, Iterator, List, Dict, Optional
 import logging
+import os
 import time
+import threading
 from sqlalchemy.orm import Session
-from sqlalchemy import func
 from ..models import Event
 from ..database import SessionLocal
+from .venue_gazetteer import get_venue_gazetteer
+from .watermarks import get_watermark, get_seen_ids, save_watermark
+from .circuit_breaker import get_circuit_breaker
+from .pipeline import ImportPipeline
+from .dedup import unlink_archived_canonicals
 
 logger = logging.getLogger(__name__)
 
+# How often an incremental import is replaced by a full reconciliation pass
+FULL_SYNC_INTERVAL = timedelta(hours=float(os.getenv('KUDAGO_FULL_SYNC_HOURS', '24')))
+
+# Pause between API pages (rate limiting)
+PAGE_DELAY = float(os.getenv('KUDAGO_PAGE_DELAY', '0.5'))
+
 
 class KudaGoScraper:
     """
@@ -24,6 +36,8 @@ class KudaGoScraper:
     API is more reliable and structured than Yandex Afisha.
     """
     
+    SOURCE = 'kudago'
+    
     # API endpoints
     API_BASE = "https://kudago.com/public-api/v1.4"
     
@@ -66,14 +80,19 @@ class KudaGoScraper:
         'rostov': 'rnd'
     }
     
-    def __init__(self, city: str = "voronezh"):
+    def __init__(self, city: str = "voronezh", cancel_event: Optional[threading.Event] = None,
+                 progress_callback: Optional[Callable[[str, Dict], None]] = None):
         """
         Initialize scraper for a specific city
         
         Args:
             city: City name (e.g., 'voronezh', 'moscow', 'spb')
+            cancel_event: Event that asks a running scrape/import to stop early
+            progress_callback: Called with (phase, counters) as the scrape/import advances
         """
         self.city = city
+        self.cancel_event = cancel_event
+        self.progress_callback = progress_callback
         self.city_slug = self.CITY_MAPPING.get(city.lower(), 'vrn')
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
@@ -81,25 +100,79 @@ class KudaGoScraper:
         }
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        self.session.hooks['response'].append(self._count_response)
+        self.http_requests = 0
+        self.http_bytes = 0
+        
+        # State of the last fetch, used for watermarks and reconciliation
+        self.seen_source_ids = set()
+        self.max_publication_date = None
+        self.max_publication_ids = set()
+        self.fetch_complete = False
+        self.fetch_limited = False
+        self.fetch_failed = False
+    
+    def _is_cancelled(self) -> bool:
+        """Check whether the caller asked to stop"""
+        return self.cancel_event is not None and self.cancel_event.is_set()
+    
+    def _count_response(self, response, *args, **kwargs):
+        """Session hook counting HTTP requests and response bytes of this scraper"""
+        self.http_requests += 1
+        self.http_bytes += len(response.content or b'')
+    
+    def _report_progress(self, phase: str, **counters):
+        """Report progress to the caller, never failing the import because of it"""
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(phase, counters)
+        except Exception as e:
+            logger.debug(f"Progress callback failed: {e}")
     
     def scrape_events(self, 
                      categories: Optional[List[str]] = None,
                      days_ahead: int = 30,
-                     limit: int = 100) -> List[Dict]:
+                     limit: int = 100,
+                     since: Optional[datetime] = None,
+                     seen_ids: Optional[set] = None) -> List[Dict]:
         """
         Scrape events from KudaGo API
         
+        Events are requested newest publication first, so an incremental
+        scrape stops paging as soon as it reaches the watermark.
+        
         Args:
             categories: List of categories to scrape (e.g., ['concert', 'theater', 'exhibition'])
                        If None, scrapes all available categories
             days_ahead: Number of days ahead to fetch events for
             limit: Maximum total events to fetch
+            since: Publication watermark (UTC), None for a full scrape
+            seen_ids: Source ids already imported at exactly the watermark time
         
         Returns:
             List of event dictionaries with all required fields
         """
-        all_events = []
+        raw_items = self.iter_raw_items(categories, days_ahead, limit, since, seen_ids)
+        all_events = [event for event in map(self.parse_item, raw_items) if event]
+        logger.info(f"Successfully scraped {len(all_events)} events from KudaGo")
+        return all_events
+    
+    def iter_raw_items(self,
+                       categories: Optional[List[str]] = None,
+                       days_ahead: int = 30,
+                       limit: int = 100,
+                       since: Optional[datetime] = None,
+                       seen_ids: Optional[set] = None) -> Iterator[Dict]:
+        """
+        Stream raw event items from KudaGo API page by page
+        
+        Used as the fetch stage of the import pipeline; takes the same
+        arguments as scrape_events().
         
+        Yields:
+            Raw event data dictionaries
+        """
         try:
             logger.info(f"Fetching events from KudaGo API for {self.city}")
             
@@ -114,9 +187,9 @@ class KudaGoScraper:
                 'actual_since': actual_since,
                 'actual_until': actual_until,
                 'page_size': min(limit, 100),  # API max is 100 per page
-                'fields': 'id,title,description,body_text,location,place,dates,price,is_free,images,site_url,categories',
+                'fields': 'id,title,description,body_text,location,place,dates,price,is_free,images,site_url,categories,publication_date',
                 'expand': 'place,location',
-                'order_by': 'publication_date'
+                'order_by': '-publication_date'
             }
             
             # Add category filter if specified
@@ -129,41 +202,50 @@ class KudaGoScraper:
                 if kudago_categories:
                     params['categories'] = ','.join(kudago_categories)
             
-            # Fetch events from API
-            events = self._fetch_events_paginated(params, limit)
-            
-            # Parse events
-            for event_data in events:
-                try:
-                    event = self._parse_event(event_data)
-                    if event:
-                        all_events.append(event)
-                except Exception as e:
-                    logger.error(f"Error parsing event: {e}", exc_info=True)
-                    continue
-            
-            logger.info(f"Successfully scraped {len(all_events)} events from KudaGo")
+            yield from self._iter_event_pages(params, limit, since, seen_ids or set())
             
         except Exception as e:
+            self.fetch_failed = True
             logger.error(f"Error fetching events from KudaGo: {e}", exc_info=True)
-        
-        return all_events
     
-    def _fetch_events_paginated(self, params: Dict, max_events: int) -> List[Dict]:
+    def parse_item(self, data: Dict) -> Optional[Dict]:
+        """Parse stage of the import pipeline"""
+        return self._parse_event(data)
+    
+    def _iter_event_pages(self, params: Dict, max_events: int,
+                          since: Optional[datetime] = None,
+                          seen_ids: Optional[set] = None) -> Iterator[Dict]:
         """
-        Fetch events with pagination support
+        Fetch events with pagination support, yielding items as pages arrive
         
         Args:
-            params: API request parameters
+            params: API request parameters (ordered by -publication_date)
             max_events: Maximum number of events to fetch
+            since: Stop at events published before this time (UTC)
+            seen_ids: Ids published exactly at `since` that were already imported
         
-        Returns:
-            List of event data dictionaries
+        Yields:
+            Event data dictionaries
         """
-        all_events = []
+        fetched = 0
         page = 1
+        seen_ids = seen_ids or set()
+        self.fetch_complete = False
+        self.fetch_limited = False
+        self.fetch_failed = False
+        breaker = get_circuit_breaker('kudago')
         
-        while len(all_events) < max_events:
+        while fetched < max_events:
+            if self._is_cancelled():
+                logger.warning(f"KudaGo fetch for {self.city} cancelled on page {page}")
+                self.fetch_failed = True
+                break
+            
+            if not breaker.allow_request():
+                logger.warning(f"KudaGo circuit is open, skipping fetch for {self.city}")
+                self.fetch_failed = True
+                break
+            
             try:
                 params['page'] = page
                 
@@ -173,30 +255,88 @@ class KudaGoScraper:
                     timeout=10
                 )
                 
+                # Server errors and throttling mean the source is unhealthy
+                if response.status_code >= 500 or response.status_code == 429:
+                    breaker.record_failure(f"HTTP {response.status_code}")
+                else:
+                    breaker.record_success()
+                
                 if response.status_code != 200:
                     logger.warning(f"API returned status {response.status_code}")
+                    self.fetch_failed = True
                     break
                 
                 data = response.json()
-                results = data.get('results', [])
-                
-                if not results:
-                    break
-                
-                all_events.extend(results)
-                
-                # Check if there are more pages
-                if not data.get('next'):
-                    break
-                
-                page += 1
-                time.sleep(0.5)  # Rate limiting
-                
+            except requests.exceptions.RequestException as e:
+                breaker.record_failure(str(e))
+                logger.error(f"Error fetching page {page}: {e}")
+                self.fetch_failed = True
+                break
             except Exception as e:
                 logger.error(f"Error fetching page {page}: {e}")
+                self.fetch_failed = True
+                break
+            
+            results = data.get('results', [])
+            if not results:
+                self.fetch_complete = True
+                break
+            
+            reached_watermark = False
+            for item in results:
+                if fetched >= max_events:
+                    break
+                published = self._publication_date(item)
+                if since is not None and published is not None:
+                    if published < since or (published == since and str(item.get('id')) in seen_ids):
+                        reached_watermark = True
+                        break
+                self._remember_fetched(item, published)
+                fetched += 1
+                yield item
+            
+            self._report_progress('fetching', pages=page, fetched=fetched)
+            
+            if reached_watermark:
+                logger.info(f"KudaGo fetch for {self.city} reached watermark on page {page}")
+                self.fetch_complete = True
+                break
+            
+            # The newest max_events items were taken, older pages were not fetched
+            if fetched >= max_events:
+                self.fetch_limited = True
+                break
+            
+            # Check if there are more pages
+            if not data.get('next'):
+                self.fetch_complete = True
                 break
+            
+            page += 1
+            time.sleep(PAGE_DELAY)  # Rate limiting
+    
+    def _publication_date(self, item: Dict) -> Optional[datetime]:
+        """Publication time of a raw API item as naive UTC datetime"""
+        timestamp = item.get('publication_date')
+        if not timestamp:
+            return None
+        try:
+            return datetime.utcfromtimestamp(int(timestamp))
+        except (TypeError, ValueError, OverflowError):
+            return None
+    
+    def _remember_fetched(self, item: Dict, published: Optional[datetime]):
+        """Track fetched ids and the newest publication time for the watermark"""
+        source_id = str(item.get('id'))
+        self.seen_source_ids.add(source_id)
         
-        return all_events[:max_events]
+        if published is None:
+            return
+        if self.max_publication_date is None or published > self.max_publication_date:
+            self.max_publication_date = published
+            self.max_publication_ids = {source_id}
+        elif published == self.max_publication_date:
+            self.max_publication_ids.add(source_id)
     
     def _parse_event(self, data: Dict) -> Optional[Dict]:
         """
@@ -254,6 +394,9 @@ class KudaGoScraper:
                 logger.debug(f"Skipping event without coordinates: {title}")
                 return None
             
+            # KudaGo coordinates are reliable - remember venue for other sources
+            get_venue_gazetteer().add(self.city, venue_name, lat, lon)
+            
             # Extract image
             image_url = self._extract_image_url(data)
             
@@ -400,136 +543,116 @@ class KudaGoScraper:
         Returns:
             Dictionary with import statistics
         """
-        if db is None:
-            db = SessionLocal()
-            close_db = True
-        else:
-            close_db = False
+        return ImportPipeline(self, db).write(events)
+    
+    def archive_missing_events(self, db: Session, seen_source_ids: set) -> int:
+        """
+        Archive upcoming KudaGo events of the city that disappeared from the API
         
-        try:
-            stats = {
-                'total': len(events),
-                'created': 0,
-                'updated': 0,
-                'duplicates': 0,
-                'errors': 0,
-                'skipped_no_coords': 0
-            }
-            
-            for event_data in events:
-                try:
-                    # Validate required fields
-                    if not event_data.get('title'):
-                        logger.warning("Skipping event without title")
-                        stats['errors'] += 1
-                        continue
-                    
-                    # Skip events without coordinates
-                    if not event_data.get('lat') or not event_data.get('lon'):
-                        logger.warning(f"Skipping event without coordinates: {event_data.get('title')}")
-                        stats['skipped_no_coords'] += 1
-                        continue
-                    
-                    # Check for duplicates by source_id
-                    existing = None
-                    if event_data.get('source_id'):
-                        existing = db.query(Event).filter(
-                            Event.source_id == event_data['source_id'],
-                            Event.source == 'kudago'
-                        ).first()
-                    
-                    # Fallback to old deduplication if no source_id
-                    if not existing:
-                        existing = db.query(Event).filter(
-                            Event.title == event_data['title'],
-                            Event.source == 'kudago',
-                            func.date(Event.start_time) == func.date(event_data['start_time'])
-                        ).first()
-                    
-                    if existing:
-                        # Update existing event
-                        existing.description = event_data.get('description', existing.description)
-                        existing.image_url = event_data.get('image_url', existing.image_url)
-                        existing.price = event_data.get('price', existing.price)
-                        existing.last_updated = datetime.utcnow()
-                        stats['updated'] += 1
-                        logger.info(f"Updated event: {event_data['title']}")
-                    else:
-                        # Create new event
-                        new_event = Event(
-                            title=event_data['title'],
-                            event_type=event_data['event_type'],
-                            description=event_data.get('description'),
-                            geom=func.ST_SetSRID(
-                                func.ST_MakePoint(event_data['lon'], event_data['lat']),
-                                4326
-                            ),
-                            start_time=event_data['start_time'],
-                            end_time=event_data.get('end_time'),
-                            source='kudago',
-                            source_id=event_data.get('source_id'),
-                            source_url=event_data.get('source_url'),
-                            image_url=event_data.get('image_url'),
-                            price=event_data.get('price'),
-                            venue=event_data.get('venue'),
-                            city=event_data.get('city', self.city)
-                        )
-                        
-                        db.add(new_event)
-                        stats['created'] += 1
-                        logger.info(f"Created event: {event_data['title']}")
-                    
-                    db.commit()
-                    
-                except Exception as e:
-                    logger.error(f"Error importing event {event_data.get('title')}: {e}", exc_info=True)
-                    db.rollback()
-                    stats['errors'] += 1
-                    continue
-            
-            logger.info(f"KudaGo import completed: {stats}")
-            return stats
-            
-        finally:
-            if close_db:
-                db.close()
+        Must only be called after a complete full scrape, otherwise events
+        that simply were not fetched would be archived.
+        
+        Args:
+            db: Database session
+            seen_source_ids: All source ids returned by the full scrape
+        
+        Returns:
+            Number of archived events
+        """
+        if not seen_source_ids:
+            return 0
+        
+        archived = db.query(Event).filter(
+            Event.source == 'kudago',
+            Event.city == self.city,
+            Event.is_archived == False,
+            Event.start_time >= datetime.now(),
+            Event.source_id.isnot(None),
+            ~Event.source_id.in_(seen_source_ids)
+        ).update({'is_archived': True, 'last_updated': datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        
+        if archived:
+            logger.info(f"Archived {archived} KudaGo events in {self.city} missing from the API")
+            unlink_archived_canonicals(db)
+        return archived
 
 
 def scrape_and_import_kudago_events(
     city: str = "voronezh",
     categories: Optional[List[str]] = None,
     days_ahead: int = 30,
-    limit: int = 100
+    limit: int = 100,
+    cancel_event: Optional[threading.Event] = None,
+    progress_callback: Optional[Callable[[str, Dict], None]] = None,
+    incremental: bool = True
 ) -> Dict:
     """
     Convenience function to scrape and import KudaGo events in one call
     
+    With incremental=True only events published since the stored watermark
+    are fetched. Every KUDAGO_FULL_SYNC_HOURS a full pass runs instead, which
+    also archives upcoming events that disappeared from KudaGo (only when the
+    pass reaches the end of the feed, not when `limit` cuts it short).
+    
     Args:
         city: City name (e.g., 'voronezh', 'moscow', 'spb')
         categories: List of categories to scrape
         days_ahead: Number of days ahead to fetch events
         limit: Maximum number of events to fetch
+        cancel_event: Event that asks the import to stop early
+        progress_callback: Called with (phase, counters) as the import advances
+        incremental: Use per-city watermark to fetch only new events
     
     Returns:
         Dictionary with import statistics
     """
-    scraper = KudaGoScraper(city=city)
-    events = scraper.scrape_events(
-        categories=categories,
-        days_ahead=days_ahead,
-        limit=limit
-    )
+    scraper = KudaGoScraper(city=city, cancel_event=cancel_event,
+                            progress_callback=progress_callback)
+    # Watermarks are only valid for the unfiltered event stream
+    incremental = incremental and not categories
     
-    if not events:
-        logger.warning("No events found to import from KudaGo")
-        return {
-            'total': 0,
-            'imported': 0,
-            'duplicates': 0,
-            'errors': 0,
-            'skipped_no_coords': 0
-        }
+    db = SessionLocal()
+    try:
+        watermark = get_watermark(db, 'kudago', city) if incremental else None
+        full_sync = (
+            watermark is None or
+            watermark.last_publication_date is None or
+            watermark.last_full_sync_at is None or
+            datetime.utcnow() - watermark.last_full_sync_at >= FULL_SYNC_INTERVAL
+        )
+        since = None if full_sync else watermark.last_publication_date
+        
+        logger.info(f"KudaGo import for {city}: {'full' if full_sync else f'incremental since {since}'}")
+        stats = ImportPipeline(scraper, db).run(
+            categories=categories,
+            days_ahead=days_ahead,
+            limit=limit,
+            since=since,
+            seen_ids=get_seen_ids(watermark)
+        )
+        if not stats['total']:
+            logger.warning("No events found to import from KudaGo")
+        stats['mode'] = 'full' if full_sync else 'incremental'
+        
+        # The feed is newest first. An incremental fetch cut short by the limit, an
+        # error or a cancel has a gap before the old watermark, so that is kept.
+        # A full pass capped by the limit starts from scratch: its newest items are
+        # a valid watermark, but unfetched older events must not be archived.
+        fetched_ok = not scraper.fetch_failed and not scraper._is_cancelled()
+        if incremental and fetched_ok and (scraper.fetch_complete or (full_sync and scraper.fetch_limited)):
+            if full_sync and scraper.fetch_complete:
+                stats['archived'] = scraper.archive_missing_events(db, scraper.seen_source_ids)
+            save_watermark(
+                db, 'kudago', city,
+                scraper.max_publication_date,
+                scraper.max_publication_ids,
+                full_sync=full_sync
+            )
+        elif incremental:
+            logger.warning(f"KudaGo fetch for {city} incomplete, watermark not advanced")
+    finally:
+        db.close()
     
-    stats = scraper.import_events_to_db(events)
     logger.info(f"KudaGo scraping and import completed: {stats}")
     return stats
\ No newline at end of file
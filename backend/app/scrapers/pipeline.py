@@ -0,0 +1,409 @@
+"""
+Streaming Import Pipeline
+Ingestion as a chain of generator stages:
+
+    fetch pages -> parse -> normalize -> dedupe -> batch -> write
+
+Every stage pulls from the previous one, so memory is bounded by the batch
+size. Fetching and parsing run in a producer thread with a bounded queue
+(backpressure), letting DB writes overlap with network requests.
+
+Any scraper plugs in as a source by providing:
+    SOURCE          - source name stored in Event.source
+    city            - city slug
+    iter_raw_items(**options) - generator of raw API items
+    parse_item(raw)           - raw item -> event dict or None
+    _is_cancelled(), _report_progress(phase, **counters)
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models import Event
+from ..database import SessionLocal
+from .dedup import link_cross_source_duplicates
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '100'))
+IMPORT_PREFETCH_BATCHES = int(os.getenv('IMPORT_PREFETCH_BATCHES', '2'))
+
+DESCRIPTION_MAX_LENGTH = 500
+
+# Fields refreshed on existing events
+UPDATABLE_FIELDS = ('description', 'image_url', 'price')
+
+
+def new_import_stats() -> Dict:
+    """Empty statistics dictionary shared by all import paths"""
+    return {
+        'total': 0,
+        'created': 0,
+        'updated': 0,
+        'unchanged': 0,
+        'duplicates': 0,
+        'cross_source_duplicates': 0,
+        'errors': 0,
+        'skipped_no_coords': 0,
+        'new_event_ids': []
+    }
+
+
+def batched(items: Iterable, size: int) -> Iterator[List]:
+    """Group stream into lists of at most `size` items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_DONE = object()
+
+
+def prefetch(items: Iterable, max_pending: int) -> Iterator:
+    """
+    Run the upstream generator in a producer thread, buffering at most `max_pending` items
+
+    The producer blocks when the buffer is full, so a slow consumer throttles
+    fetching instead of letting memory grow. Exceptions of the producer are
+    re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=max(1, max_pending))
+    stop = threading.Event()
+    error: List[BaseException] = []
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as e:
+            error.append(e)
+        finally:
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, name='import-prefetch', daemon=True)
+    producer.start()
+
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                break
+            yield item
+        if error:
+            raise error[0]
+    finally:
+        stop.set()
+        producer.join(timeout=5)
+
+
+class EventBatchWriter:
+    """
+    Writes events in batches: one lookup query and one commit per batch
+
+    A batch that fails as a whole is retried event by event, so a single
+    bad row does not lose the rest of the batch.
+    """
+
+    def __init__(self, scraper, db: Session, stats: Dict):
+        """
+        Args:
+            scraper: Source scraper (provides SOURCE, city, cancellation and progress)
+            db: Database session
+            stats: Statistics dictionary to update
+        """
+        self.scraper = scraper
+        self.source = scraper.SOURCE
+        self.db = db
+        self.stats = stats
+
+    def write_batch(self, events: List[Dict]):
+        """Write one batch of normalized events"""
+        created_before = len(self.stats['new_event_ids'])
+        # _write counts updates while staging, a rolled back batch must not count them
+        counted_before = {key: self.stats[key] for key in ('updated', 'unchanged')}
+        try:
+            created = self._write(events)
+            self.db.commit()
+            self._account_created(created)
+        except Exception as e:
+            self.db.rollback()
+            self.stats.update(counted_before)
+            logger.warning(f"Batch write of {len(events)} events failed, retrying one by one: {e}")
+            for event_data in events:
+                counted_before = {key: self.stats[key] for key in ('updated', 'unchanged')}
+                try:
+                    created = self._write([event_data])
+                    self.db.commit()
+                    self._account_created(created)
+                except Exception as e:
+                    logger.error(f"Error importing event {event_data.get('title')}: {e}", exc_info=True)
+                    self.db.rollback()
+                    self.stats.update(counted_before)
+                    self.stats['errors'] += 1
+
+        new_ids = self.stats['new_event_ids'][created_before:]
+        self._link_duplicates(new_ids)
+
+        self.scraper._report_progress(
+            'importing',
+            processed=self.stats['total'],
+            created=self.stats['created'],
+            updated=self.stats['updated'],
+            unchanged=self.stats['unchanged'],
+            errors=self.stats['errors']
+        )
+
+    def _write(self, events: List[Dict]) -> List[Event]:
+        """Stage inserts/updates for events, return newly created ORM objects"""
+        existing_by_id = self._load_existing(events)
+        created = []
+
+        for event_data in events:
+            existing = existing_by_id.get(event_data.get('source_id'))
+
+            # Fallback to old deduplication if no source_id
+            if existing is None and not event_data.get('source_id'):
+                existing = self.db.query(Event).filter(
+                    Event.title == event_data['title'],
+                    Event.source == self.source,
+                    func.date(Event.start_time) == func.date(event_data['start_time'])
+                ).first()
+
+            if existing is not None:
+                self._update(existing, event_data)
+            else:
+                new_event = self._build(event_data)
+                self.db.add(new_event)
+                created.append(new_event)
+
+        self.db.flush()  # Flush to get IDs of new events
+        return created
+
+    def _load_existing(self, events: List[Dict]) -> Dict[str, Event]:
+        """Fetch already stored events of the batch in one query"""
+        source_ids = [e['source_id'] for e in events if e.get('source_id')]
+        if not source_ids:
+            return {}
+
+        rows = self.db.query(Event).filter(
+            Event.source == self.source,
+            Event.source_id.in_(source_ids)
+        ).all()
+        return {row.source_id: row for row in rows}
+
+    def _update(self, existing: Event, event_data: Dict):
+        """Refresh updatable fields, skipping the write when nothing changed"""
+        changed = False
+        for field in UPDATABLE_FIELDS:
+            value = event_data.get(field, getattr(existing, field))
+            if getattr(existing, field) != value:
+                setattr(existing, field, value)
+                changed = True
+
+        if changed:
+            existing.last_updated = datetime.utcnow()
+            self.stats['updated'] += 1
+            logger.debug(f"Updated event: {event_data['title']}")
+        else:
+            self.stats['unchanged'] += 1
+
+    def _build(self, event_data: Dict) -> Event:
+        return Event(
+            title=event_data['title'],
+            event_type=event_data['event_type'],
+            description=event_data.get('description'),
+            geom=func.ST_SetSRID(
+                func.ST_MakePoint(event_data['lon'], event_data['lat']),
+                4326
+            ),
+            start_time=event_data['start_time'],
+            end_time=event_data.get('end_time'),
+            source=self.source,
+            source_id=event_data.get('source_id'),
+            source_url=event_data.get('source_url'),
+            image_url=event_data.get('image_url'),
+            price=event_data.get('price'),
+            venue=event_data.get('venue'),
+            city=event_data.get('city') or self.scraper.city
+        )
+
+    def _link_duplicates(self, event_ids: List[int]):
+        """Link new events to the same events imported from other sources"""
+        try:
+            self.stats['cross_source_duplicates'] += link_cross_source_duplicates(self.db, event_ids)
+        except Exception as e:
+            # Import result stays valid even if matching fails
+            logger.error(f"Cross-source duplicate matching failed: {e}", exc_info=True)
+            self.db.rollback()
+
+    def _account_created(self, created: List[Event]):
+        self.stats['created'] += len(created)
+        self.stats['new_event_ids'].extend(event.id for event in created)
+
+
+class ImportPipeline:
+    """Streaming scrape-and-import of one source for one city"""
+
+    def __init__(self, scraper, db: Session = None,
+                 batch_size: int = IMPORT_BATCH_SIZE,
+                 prefetch_batches: int = IMPORT_PREFETCH_BATCHES):
+        """
+        Args:
+            scraper: Source scraper (KudaGoScraper, YandexAfishaScraper)
+            db: Database session (optional, will create new if not provided)
+            batch_size: Events per DB write batch
+            prefetch_batches: Batches fetched ahead of the writer
+        """
+        self.scraper = scraper
+        self.db = db
+        self.batch_size = batch_size
+        self.prefetch_batches = prefetch_batches
+        self.stats = new_import_stats()
+        # Seconds spent in each stage; fetch/parse run in the prefetch thread
+        # concurrently with write, so they may add up to more than wall time
+        self.timings = {'fetch': 0.0, 'parse': 0.0, 'write': 0.0}
+
+    def fetch(self, raw_items: Iterable) -> Iterator:
+        """Fetch stage: pass raw items through, accounting time spent waiting for them"""
+        iterator = iter(raw_items)
+        while True:
+            started = time.perf_counter()
+            try:
+                raw = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.timings['fetch'] += time.perf_counter() - started
+            yield raw
+
+    def parse(self, raw_items: Iterable) -> Iterator[Dict]:
+        """Parse stage: raw API items -> event dicts"""
+        for raw in raw_items:
+            started = time.perf_counter()
+            try:
+                event = self.scraper.parse_item(raw)
+            except Exception as e:
+                logger.error(f"Error parsing event: {e}", exc_info=True)
+                continue
+            finally:
+                self.timings['parse'] += time.perf_counter() - started
+            if event:
+                yield event
+
+    def normalize(self, events: Iterable[Dict]) -> Iterator[Dict]:
+        """Normalize stage: validate required fields and clean values"""
+        for event in events:
+            self.stats['total'] += 1
+
+            title = (event.get('title') or '').strip()
+            if not title:
+                logger.warning("Skipping event without title")
+                self.stats['errors'] += 1
+                continue
+
+            if not event.get('lat') or not event.get('lon'):
+                logger.debug(f"Skipping event without coordinates: {title}")
+                self.stats['skipped_no_coords'] += 1
+                continue
+
+            event['title'] = title[:255]
+            if event.get('description'):
+                event['description'] = event['description'][:DESCRIPTION_MAX_LENGTH]
+            event['lat'] = float(event['lat'])
+            event['lon'] = float(event['lon'])
+            event['city'] = event.get('city') or self.scraper.city
+            yield event
+
+    def dedupe(self, events: Iterable[Dict]) -> Iterator[Dict]:
+        """Dedupe stage: drop repeats of the same event within this run"""
+        seen = set()
+        for event in events:
+            if event.get('source_id'):
+                key = ('id', event['source_id'])
+            else:
+                key = ('title', event['title'], event['start_time'].date())
+
+            if key in seen:
+                self.stats['duplicates'] += 1
+                continue
+            seen.add(key)
+            yield event
+
+    def write(self, events: Iterable[Dict]) -> Dict:
+        """
+        Write stage: batch-write already parsed events
+
+        Args:
+            events: Iterable of parsed event dicts
+
+        Returns:
+            Import statistics
+        """
+        return self._consume(batched(self.dedupe(self.normalize(events)), self.batch_size))
+
+    def run(self, **fetch_options) -> Dict:
+        """
+        Run the whole pipeline: fetch -> parse -> normalize -> dedupe -> batch -> write
+
+        Args:
+            **fetch_options: Passed to scraper.iter_raw_items()
+
+        Returns:
+            Import statistics
+        """
+        raw_items = self.fetch(self.scraper.iter_raw_items(**fetch_options))
+        events = self.dedupe(self.normalize(self.parse(raw_items)))
+        batches = prefetch(batched(events, self.batch_size), self.prefetch_batches)
+        return self._consume(batches)
+
+    def _consume(self, batches: Iterable[List[Dict]]) -> Dict:
+        close_db = self.db is None
+        db = self.db or SessionLocal()
+
+        try:
+            writer = EventBatchWriter(self.scraper, db, self.stats)
+            for batch in batches:
+                if self.scraper._is_cancelled():
+                    logger.warning(f"{self.scraper.SOURCE} import for {self.scraper.city} cancelled")
+                    break
+                started = time.perf_counter()
+                writer.write_batch(batch)
+                self.timings['write'] += time.perf_counter() - started
+
+            self.stats['http_requests'] = getattr(self.scraper, 'http_requests', 0)
+            self.stats['http_bytes'] = getattr(self.scraper, 'http_bytes', 0)
+            self.stats['timings'] = {stage: round(seconds, 3) for stage, seconds in self.timings.items()}
+            self.stats['fetch_failed'] = bool(getattr(self.scraper, 'fetch_failed', False))
+
+            logger.info(f"{self.scraper.SOURCE} import for {self.scraper.city} completed: "
+                        f"{ {k: v for k, v in self.stats.items() if k not in ('new_event_ids', 'timings')} }")
+            return self.stats
+        finally:
+            # Stop the prefetch thread if writing ended early
+            close = getattr(batches, 'close', None)
+            if close is not None:
+                close()
+            if close_db:
+                db.close()
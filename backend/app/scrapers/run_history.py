@@ -0,0 +1,238 @@
+"""
+Import Run History
+Every (source, city) import is stored in import_runs with per-stage
+timings, HTTP traffic, event counters and peak memory, so slowdowns show up
+in GET /api/import/runs instead of only in the logs.
+"""
+import logging
+import os
+import threading
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import Integer, cast, func
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from ..models import ImportRun
+
+logger = logging.getLogger(__name__)
+
+# tracemalloc slows down every allocation of the process (API and bot included),
+# so memory tracing of imports is opt-in
+IMPORT_TRACE_MEMORY = os.getenv('IMPORT_TRACE_MEMORY', 'false').lower() == 'true'
+
+
+class MemoryTracker:
+    """
+    tracemalloc session of one import at a time
+
+    Only the import that starts tracing gets a peak, with the peak reset at
+    its start. Imports overlapping it are not measured (peak None), since the
+    process-wide peak would mix their allocations.
+    """
+
+    def __init__(self, enabled: bool = IMPORT_TRACE_MEMORY):
+        self.enabled = enabled
+        self._owner = None
+        self._lock = threading.Lock()
+
+    def start(self) -> bool:
+        """Start tracing for the calling import, False if another import is traced"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            if self._owner is not None or tracemalloc.is_tracing():
+                return False
+            self._owner = threading.get_ident()
+            tracemalloc.start()
+            tracemalloc.reset_peak()
+            return True
+
+    def stop(self, traced: bool) -> Optional[int]:
+        """Stop tracing started by start(), return peak traced memory in bytes"""
+        if not traced:
+            return None
+        with self._lock:
+            peak = tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None
+            tracemalloc.stop()
+            self._owner = None
+            return peak
+
+
+memory_tracker = MemoryTracker()
+
+
+def record_import_run(source: str, city: str, trigger: str,
+                      started_at: datetime, duration: float,
+                      stats: Optional[Dict] = None,
+                      error: Optional[BaseException] = None,
+                      peak_memory: Optional[int] = None) -> Optional[int]:
+    """
+    Store one finished import run
+
+    Never raises: history must not break the import itself.
+
+    Returns:
+        ID of the stored run or None if it could not be stored
+    """
+    stats = stats or {}
+    timings = stats.get('timings') or {}
+
+    db = SessionLocal()
+    try:
+        run = ImportRun(
+            source=source,
+            city=city,
+            trigger=trigger,
+            status='failed' if error is not None or stats.get('fetch_failed') else 'completed',
+            started_at=started_at,
+            duration_seconds=duration,
+            fetch_seconds=timings.get('fetch'),
+            parse_seconds=timings.get('parse'),
+            write_seconds=timings.get('write'),
+            http_requests=stats.get('http_requests', 0),
+            http_bytes=stats.get('http_bytes', 0),
+            total=stats.get('total', 0),
+            created=stats.get('created', 0),
+            updated=stats.get('updated', 0),
+            unchanged=stats.get('unchanged', 0),
+            errors=stats.get('errors', 0),
+            peak_memory_bytes=peak_memory,
+            error=repr(error) if error is not None else None
+        )
+        db.add(run)
+        db.commit()
+        return run.id
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error recording import run for {source}/{city}: {e}")
+        return None
+    finally:
+        db.close()
+
+
+def record_notify_duration(run_id: Optional[int], seconds: float):
+    """Add duration of sending notifications about events of a run"""
+    if run_id is None:
+        return
+
+    db = SessionLocal()
+    try:
+        db.query(ImportRun).filter(ImportRun.id == run_id).update(
+            {'notify_seconds': func.coalesce(ImportRun.notify_seconds, 0) + seconds},
+            synchronize_session=False
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error recording notify duration of import run {run_id}: {e}")
+    finally:
+        db.close()
+
+
+def _run_to_dict(run: ImportRun) -> Dict:
+    return {
+        "id": run.id,
+        "source": run.source,
+        "city": run.city,
+        "trigger": run.trigger,
+        "status": run.status,
+        "started_at": run.started_at.isoformat() if run.started_at else None,
+        "duration_seconds": run.duration_seconds,
+        "timings": {
+            "fetch": run.fetch_seconds,
+            "parse": run.parse_seconds,
+            "write": run.write_seconds,
+            "notify": run.notify_seconds
+        },
+        "http_requests": run.http_requests,
+        "http_bytes": run.http_bytes,
+        "total": run.total,
+        "created": run.created,
+        "updated": run.updated,
+        "unchanged": run.unchanged,
+        "errors": run.errors,
+        "peak_memory_bytes": run.peak_memory_bytes,
+        "error": run.error
+    }
+
+
+def get_import_runs(db: Session, source: Optional[str] = None, city: Optional[str] = None,
+                    hours: int = 24, limit: int = 50) -> Dict:
+    """
+    Recent runs and per (source, city) aggregates
+
+    Args:
+        db: Database session
+        source: Filter by source
+        city: Filter by city
+        hours: Aggregation window
+        limit: Maximum number of returned runs
+
+    Returns:
+        Dictionary with 'runs' (newest first) and 'aggregates'
+    """
+    since = datetime.utcnow() - timedelta(hours=hours)
+    filters = [ImportRun.started_at >= since]
+    if source:
+        filters.append(ImportRun.source == source)
+    if city:
+        filters.append(ImportRun.city == city)
+
+    runs = db.query(ImportRun).filter(*filters).order_by(ImportRun.started_at.desc()).limit(limit).all()
+
+    rows = db.query(
+        ImportRun.source,
+        ImportRun.city,
+        func.count(ImportRun.id).label('runs'),
+        func.sum(cast(ImportRun.status == 'failed', Integer)).label('failed'),
+        func.avg(ImportRun.duration_seconds).label('avg_duration'),
+        func.percentile_cont(0.95).within_group(ImportRun.duration_seconds).label('p95_duration'),
+        func.avg(ImportRun.fetch_seconds).label('avg_fetch'),
+        func.avg(ImportRun.parse_seconds).label('avg_parse'),
+        func.avg(ImportRun.write_seconds).label('avg_write'),
+        func.avg(ImportRun.notify_seconds).label('avg_notify'),
+        func.sum(ImportRun.total).label('events'),
+        func.sum(ImportRun.created).label('created'),
+        func.sum(ImportRun.http_requests).label('http_requests'),
+        func.sum(ImportRun.http_bytes).label('http_bytes'),
+        func.max(ImportRun.peak_memory_bytes).label('max_peak_memory'),
+        func.sum(ImportRun.duration_seconds).label('busy_seconds')
+    ).filter(*filters).group_by(ImportRun.source, ImportRun.city).order_by(
+        func.sum(ImportRun.duration_seconds).desc()
+    ).all()
+
+    def rounded(value, digits=3):
+        return round(float(value), digits) if value is not None else None
+
+    aggregates = [
+        {
+            "source": row.source,
+            "city": row.city,
+            "runs": row.runs,
+            "failed": int(row.failed or 0),
+            "avg_duration_seconds": rounded(row.avg_duration),
+            "p95_duration_seconds": rounded(row.p95_duration),
+            "avg_timings": {
+                "fetch": rounded(row.avg_fetch),
+                "parse": rounded(row.avg_parse),
+                "write": rounded(row.avg_write),
+                "notify": rounded(row.avg_notify)
+            },
+            "events": int(row.events or 0),
+            "created": int(row.created or 0),
+            "events_per_second": rounded((row.events or 0) / row.busy_seconds, 1) if row.busy_seconds else None,
+            "http_requests": int(row.http_requests or 0),
+            "http_bytes": int(row.http_bytes or 0),
+            "max_peak_memory_bytes": row.max_peak_memory
+        }
+        for row in rows
+    ]
+
+    return {
+        "hours": hours,
+        "runs": [_run_to_dict(run) for run in runs],
+        "aggregates": aggregates
+    }
@@ -0,0 +1,251 @@
+"""
+Import Runner
+Executes blocking scrape-and-import units in a bounded thread pool, so the
+asyncio event loop (FastAPI, Telegram polling, scheduler) never freezes
+while a city is being imported.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from ..database import SessionLocal
+from ..models import Event
+from .kudago import scrape_and_import_kudago_events
+from .yandex_afisha import scrape_and_import_yandex_events
+from .import_schedule import record_import_outcome
+from .run_history import memory_tracker, record_import_run
+
+logger = logging.getLogger(__name__)
+
+# Supported import sources in the order they are scheduled
+IMPORT_SOURCES = ('kudago', 'yandex_afisha')
+
+# Default options per source (same as the scheduler used before)
+DEFAULT_IMPORT_OPTIONS = {
+    'kudago': {'days_ahead': 30, 'limit': 100},
+    'yandex_afisha': {'days_ahead': 30, 'limit_per_category': 50},
+}
+
+IMPORT_MAX_WORKERS = int(os.getenv('IMPORT_MAX_WORKERS', '4'))
+IMPORT_TASK_TIMEOUT = float(os.getenv('IMPORT_TASK_TIMEOUT', '600'))
+IMPORT_RUN_DEADLINE = float(os.getenv('IMPORT_RUN_DEADLINE', '3600'))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+class PartialImportError(Exception):
+    """
+    Import failed after some batches were already committed
+
+    Carries the events those batches created, so they still get notified.
+    """
+
+    def __init__(self, error: BaseException, new_event_ids: List[int], run_id: Optional[int]):
+        super().__init__(str(error))
+        self.error = error
+        self.new_event_ids = new_event_ids
+        self.run_id = run_id
+
+
+def created_event_ids(source: str, city: str, since: datetime) -> List[int]:
+    """IDs of events of (source, city) created since a moment (UTC), never raises"""
+    db = SessionLocal()
+    try:
+        return [
+            row.id for row in db.query(Event.id).filter(
+                Event.source == source,
+                Event.city == city,
+                Event.created_at >= since
+            ).order_by(Event.id)
+        ]
+    except Exception as e:
+        logger.error(f"Could not look up events created by {source}/{city}: {e}")
+        return []
+    finally:
+        db.close()
+
+
+def get_import_executor() -> ThreadPoolExecutor:
+    """Get shared bounded thread pool for imports"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=IMPORT_MAX_WORKERS,
+                thread_name_prefix='import'
+            )
+        return _executor
+
+
+def shutdown_import_executor():
+    """Stop the import pool, dropping tasks that have not started yet"""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+
+def run_import(source: str, city: str,
+               cancel_event: Optional[threading.Event] = None,
+               progress_callback: Optional[Callable[[str, Dict], None]] = None,
+               trigger: str = 'manual',
+               **options) -> Dict:
+    """
+    Run one (source, city) scrape-and-import unit synchronously
+
+    The run is stored in import_runs; its id is returned as stats['run_id'].
+
+    Args:
+        source: Import source ('kudago' or 'yandex_afisha')
+        city: City slug
+        cancel_event: Event that asks the import to stop early
+        progress_callback: Called with (phase, counters) as the import advances
+        trigger: What started the run ('schedule', 'manual' or 'worker')
+        **options: Overrides for source specific options
+
+    Returns:
+        Dictionary with import statistics
+
+    Raises:
+        PartialImportError: The import failed; carries events created before the failure
+    """
+    if source not in DEFAULT_IMPORT_OPTIONS:
+        raise ValueError(f"Unknown import source: {source}")
+
+    params = {**DEFAULT_IMPORT_OPTIONS[source], **options}
+
+    if source == 'kudago':
+        import_function = scrape_and_import_kudago_events
+    else:
+        import_function = scrape_and_import_yandex_events
+
+    started_at = datetime.utcnow()
+    started = time.perf_counter()
+    traced = memory_tracker.start()
+    try:
+        stats = import_function(
+            city=city,
+            cancel_event=cancel_event,
+            progress_callback=progress_callback,
+            **params
+        )
+    except Exception as e:
+        peak_memory = memory_tracker.stop(traced)
+        run_id = record_import_run(source, city, trigger, started_at, time.perf_counter() - started,
+                                   error=e, peak_memory=peak_memory)
+        record_import_outcome(source, city, error=e)
+        # Batches committed before the failure stay in the database
+        raise PartialImportError(e, created_event_ids(source, city, started_at), run_id) from e
+
+    peak_memory = memory_tracker.stop(traced)
+    stats['run_id'] = record_import_run(source, city, trigger, started_at, time.perf_counter() - started,
+                                        stats=stats, peak_memory=peak_memory)
+
+    # Every run (scheduled, manual or by a worker) feeds the adaptive schedule
+    record_import_outcome(source, city, stats)
+    return stats
+
+
+async def run_import_tasks(
+    tasks: List[Tuple[str, str]],
+    max_workers: Optional[int] = None,
+    task_timeout: Optional[float] = None,
+    deadline: Optional[float] = None,
+    trigger: str = 'schedule',
+    on_late_result: Optional[Callable[[Tuple[str, str], Dict], None]] = None
+) -> AsyncIterator[Tuple[Tuple[str, str], Optional[Dict], Optional[BaseException]]]:
+    """
+    Run (source, city) import units off the event loop, yielding results as they complete
+
+    Results are yielded in completion order, so callers can start sending
+    notifications before the slowest city finishes.
+
+    Args:
+        tasks: List of (source, city) pairs
+        max_workers: Maximum concurrently running imports
+        task_timeout: Per-task timeout in seconds
+        deadline: Whole run deadline in seconds
+        trigger: What started the runs, stored in import history
+        on_late_result: Called in the event loop with ((source, city), stats) when a
+            timed out or cancelled import thread finishes later having created events
+
+    Yields:
+        Tuples of ((source, city), stats, error) - exactly one of stats/error is set
+    """
+    loop = asyncio.get_running_loop()
+    executor = get_import_executor()
+    semaphore = asyncio.Semaphore(max_workers or IMPORT_MAX_WORKERS)
+    task_timeout = task_timeout or IMPORT_TASK_TIMEOUT
+    deadline = deadline or IMPORT_RUN_DEADLINE
+    cancel_events = {task: threading.Event() for task in tasks}
+
+    def watch_late_result(task: Tuple[str, str], future):
+        """Pass events created by an abandoned import thread to on_late_result"""
+        def done(future):
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is None:
+                stats = future.result()
+            elif isinstance(error, PartialImportError):
+                stats = {'new_event_ids': error.new_event_ids, 'run_id': error.run_id}
+            else:
+                return
+            if stats.get('new_event_ids'):
+                logger.info(f"Late import {task[0]}/{task[1]} created {len(stats['new_event_ids'])} events")
+                try:
+                    loop.call_soon_threadsafe(on_late_result, task, stats)
+                except RuntimeError:
+                    logger.warning(f"Event loop closed, late events of {task[0]}/{task[1]} not notified")
+
+        if on_late_result is not None:
+            future.add_done_callback(done)
+
+    async def run_one(task: Tuple[str, str]):
+        source, city = task
+        async with semaphore:
+            future = executor.submit(
+                partial(run_import, source, city, cancel_events[task], trigger=trigger)
+            )
+            try:
+                stats = await asyncio.wait_for(asyncio.wrap_future(future), timeout=task_timeout)
+                return task, stats, None
+            except asyncio.TimeoutError as e:
+                # The thread cannot be killed, ask the scraper to stop at next checkpoint
+                cancel_events[task].set()
+                watch_late_result(task, future)
+                logger.warning(f"Import {source}/{city} timed out after {task_timeout}s")
+                return task, None, e
+            except asyncio.CancelledError:
+                cancel_events[task].set()
+                watch_late_result(task, future)
+                raise
+            except Exception as e:
+                logger.error(f"Import {source}/{city} failed: {e}")
+                return task, None, e
+
+    started = time.monotonic()
+    pending = [asyncio.ensure_future(run_one(task)) for task in tasks]
+
+    try:
+        for next_done in asyncio.as_completed(pending, timeout=deadline):
+            yield await next_done
+    except asyncio.TimeoutError:
+        logger.warning(
+            f"Import run deadline of {deadline}s exceeded after {time.monotonic() - started:.0f}s, "
+            f"cancelling {sum(1 for p in pending if not p.done())} unfinished tasks"
+        )
+    finally:
+        for future in pending:
+            if not future.done():
+                future.cancel()
+        for cancel_event in cancel_events.values():
+            cancel_event.set()
@@ -0,0 +1,248 @@
+"""
+Venue Gazetteer
+Local in-memory index of venue coordinates built from events we already know.
+KudaGo always ships place.coords, so its venues are used to resolve
+coordinate-less events from other sources without calling a remote geocoder.
+"""
+import logging
+import re
+import threading
+import time
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from ..models import Event
+from ..database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Generic words that do not help to tell venues apart
+STOP_WORDS = {
+    'г', 'ул', 'пр', 'пл', 'наб', 'д', 'им', 'имени',
+    'дк', 'кц', 'тц', 'трц', 'клуб', 'зал'
+}
+
+_NON_WORD_RE = re.compile(r'[^\w\s]+', re.UNICODE)
+_SPACES_RE = re.compile(r'\s+')
+
+
+def normalize_venue_name(name: Optional[str]) -> str:
+    """
+    Normalize venue name for lookups
+
+    Lowercases, replaces 'ё', strips quotes/punctuation and generic words.
+
+    Args:
+        name: Raw venue name
+
+    Returns:
+        Normalized name (empty string if nothing meaningful is left)
+    """
+    if not name:
+        return ''
+
+    text = name.lower().replace('ё', 'е')
+    text = _NON_WORD_RE.sub(' ', text)
+    words = [w for w in _SPACES_RE.split(text) if w and w not in STOP_WORDS]
+    return ' '.join(words)
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+    Build set of character trigrams for a normalized string
+    """
+    if not text:
+        return set()
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class VenueGazetteer:
+    """
+    In-memory venue index per city
+
+    Venues are indexed by exact normalized name and by trigram, so both
+    exact and fuzzy (e.g. 'Филармония' vs 'Воронежская филармония') lookups
+    are answered locally in microseconds.
+    """
+
+    # Minimal Jaccard similarity of trigram sets for a fuzzy match
+    MIN_SIMILARITY = 0.5
+
+    # Sources whose coordinates are trusted to seed the gazetteer
+    TRUSTED_SOURCES = ('kudago', 'manual')
+
+    def __init__(self, ttl_seconds: int = 3600):
+        """
+        Initialize empty gazetteer
+
+        Args:
+            ttl_seconds: How long loaded data is considered fresh
+        """
+        self.ttl_seconds = ttl_seconds
+        self._exact: Dict[str, Dict[str, Tuple[float, float]]] = {}
+        self._trigram_index: Dict[str, Dict[str, Set[str]]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return sum(len(venues) for venues in self._exact.values())
+
+    @property
+    def is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl_seconds
+
+    def add(self, city: str, venue_name: Optional[str], lat: float, lon: float) -> bool:
+        """
+        Add (or replace) venue coordinates
+
+        Args:
+            city: City slug
+            venue_name: Venue name as received from the source
+            lat: Latitude
+            lon: Longitude
+
+        Returns:
+            True if the venue was indexed
+        """
+        key = normalize_venue_name(venue_name)
+        if not city or not key or lat is None or lon is None:
+            return False
+
+        with self._lock:
+            city_venues = self._exact.setdefault(city, {})
+            is_new = key not in city_venues
+            city_venues[key] = (float(lat), float(lon))
+
+            if is_new:
+                city_trigrams = self._trigram_index.setdefault(city, {})
+                for gram in trigrams(key):
+                    city_trigrams.setdefault(gram, set()).add(key)
+
+        return True
+
+    def resolve(self, city: str, venue_name: Optional[str],
+                address: Optional[str] = None) -> Optional[Tuple[float, float]]:
+        """
+        Resolve venue coordinates in the given city
+
+        Tries exact normalized name first, then the best trigram match
+        of the venue name and finally of the address.
+
+        Args:
+            city: City slug
+            venue_name: Venue name
+            address: Venue address (optional)
+
+        Returns:
+            Tuple of (latitude, longitude) or None if venue is unknown
+        """
+        city_venues = self._exact.get(city)
+        if not city_venues:
+            return None
+
+        for candidate in (venue_name, address):
+            key = normalize_venue_name(candidate)
+            if not key:
+                continue
+
+            coords = city_venues.get(key)
+            if coords:
+                return coords
+
+            coords = self._fuzzy_lookup(city, key)
+            if coords:
+                return coords
+
+        return None
+
+    def _fuzzy_lookup(self, city: str, key: str) -> Optional[Tuple[float, float]]:
+        """
+        Find the most similar venue by trigram Jaccard similarity
+        """
+        city_trigrams = self._trigram_index.get(city, {})
+        query_grams = trigrams(key)
+
+        # Count shared trigrams per candidate using the inverted index
+        shared: Dict[str, int] = {}
+        for gram in query_grams:
+            for candidate in city_trigrams.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        best_key = None
+        best_score = 0.0
+        for candidate, common in shared.items():
+            union = len(query_grams) + len(trigrams(candidate)) - common
+            score = common / union if union else 0.0
+            if score > best_score:
+                best_key, best_score = candidate, score
+
+        if best_key and best_score >= self.MIN_SIMILARITY:
+            return self._exact[city][best_key]
+
+        return None
+
+    def load_from_db(self, db: Session = None) -> int:
+        """
+        (Re)load venues from events stored in the database
+
+        Args:
+            db: Database session (optional, will create new if not provided)
+
+        Returns:
+            Number of indexed venues
+        """
+        if db is None:
+            db = SessionLocal()
+            close_db = True
+        else:
+            close_db = False
+
+        try:
+            rows = db.query(
+                Event.city,
+                Event.venue,
+                func.avg(func.ST_Y(Event.geom)).label('lat'),
+                func.avg(func.ST_X(Event.geom)).label('lon')
+            ).filter(
+                Event.venue.isnot(None),
+                Event.venue != '',
+                Event.source.in_(self.TRUSTED_SOURCES)
+            ).group_by(Event.city, Event.venue).all()
+
+            with self._lock:
+                self._exact = {}
+                self._trigram_index = {}
+                for row in rows:
+                    self.add(row.city, row.venue, row.lat, row.lon)
+                self._loaded_at = time.monotonic()
+
+            logger.info(f"Venue gazetteer loaded: {len(self)} venues in {len(self._exact)} cities")
+            return len(self)
+
+        except Exception as e:
+            logger.error(f"Error loading venue gazetteer: {e}")
+            # Do not hammer the database on every lookup, retry after TTL
+            self._loaded_at = time.monotonic()
+            return len(self)
+        finally:
+            if close_db:
+                db.close()
+
+
+# Process-wide gazetteer shared by all scrapers
+_gazetteer = VenueGazetteer()
+
+
+def get_venue_gazetteer(refresh: bool = False) -> VenueGazetteer:
+    """
+    Get shared gazetteer, loading it from the database when stale
+
+    Args:
+        refresh: Force reload from the database
+    """
+    if refresh or _gazetteer.is_stale:
+        _gazetteer.load_from_db()
+    return _gazetteer
@@ -0,0 +1,78 @@
+"""
+Import Watermarks
+Remembers how far an incremental import got for each (source, city), so the
+next run only fetches what was published since then.
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Iterable, Optional
+
+from sqlalchemy.orm import Session
+
+from ..models import ImportWatermark
+
+logger = logging.getLogger(__name__)
+
+
+def get_watermark(db: Session, source: str, city: str) -> Optional[ImportWatermark]:
+    """Get watermark for (source, city) or None if the pair was never imported"""
+    return db.query(ImportWatermark).filter(
+        ImportWatermark.source == source,
+        ImportWatermark.city == city
+    ).first()
+
+
+def get_seen_ids(watermark: Optional[ImportWatermark]) -> set:
+    """Decode ids published exactly at the watermark time"""
+    if not watermark or not watermark.last_seen_ids:
+        return set()
+    try:
+        return set(json.loads(watermark.last_seen_ids))
+    except ValueError:
+        return set()
+
+
+def save_watermark(
+    db: Session,
+    source: str,
+    city: str,
+    last_publication_date: Optional[datetime],
+    last_seen_ids: Iterable[str],
+    full_sync: bool = False
+) -> ImportWatermark:
+    """
+    Advance watermark for (source, city)
+
+    The watermark never moves backwards: if nothing newer was seen, the
+    previous publication date and ids are kept.
+
+    Args:
+        db: Database session
+        source: Import source
+        city: City slug
+        last_publication_date: Newest publication time seen in this run
+        last_seen_ids: Source ids published exactly at last_publication_date
+        full_sync: Whether this run was a full reconciliation pass
+    """
+    watermark = get_watermark(db, source, city)
+    if watermark is None:
+        watermark = ImportWatermark(source=source, city=city)
+        db.add(watermark)
+
+    if last_publication_date is not None:
+        previous = watermark.last_publication_date
+        if previous is None or last_publication_date > previous:
+            watermark.last_publication_date = last_publication_date
+            watermark.last_seen_ids = json.dumps(sorted(set(last_seen_ids)))
+        elif last_publication_date == previous:
+            merged = get_seen_ids(watermark) | set(last_seen_ids)
+            watermark.last_seen_ids = json.dumps(sorted(merged))
+
+    now = datetime.utcnow()
+    watermark.last_run_at = now
+    if full_sync:
+        watermark.last_full_sync_at = now
+
+    db.commit()
+    return watermark
@@ -4,17 +4,23 @@ Scrapes events from Yandex Afisha using their internal API endpoints
 """
 import requests
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
 import logging
+import os
 import time
 import random
+import threading
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from ..models import Event
-from ..database import SessionLocal
+from .venue_gazetteer import get_venue_gazetteer
+from .circuit_breaker import get_circuit_breaker
+from .endpoint_memory import load_preferred_endpoints, remember_endpoint
+from .pipeline import ImportPipeline
 
 logger = logging.getLogger(__name__)
 
+# Pause between category requests (rate limiting)
+CATEGORY_DELAY = float(os.getenv('YANDEX_AFISHA_CATEGORY_DELAY', '1'))
+
 
 class YandexAfishaScraper:
     """
@@ -24,7 +30,10 @@ class YandexAfishaScraper:
     which is more reliable than HTML parsing for SPA applications.
     """
     
+    SOURCE = 'yandex_afisha'
+    
     # API endpoints discovered through browser DevTools
+    SITE_BASE = "https://afisha.yandex.ru"
     API_BASE = "https://afisha.yandex.ru/api"
     GEOCODER_API = "https://geocode-maps.yandex.ru/1.x/"
     
@@ -40,15 +49,21 @@ class YandexAfishaScraper:
         'party': 'festival'
     }
     
-    def __init__(self, city: str = "voronezh", geocoder_api_key: Optional[str] = None):
+    def __init__(self, city: str = "voronezh", geocoder_api_key: Optional[str] = None,
+                 cancel_event: Optional[threading.Event] = None,
+                 progress_callback: Optional[Callable[[str, Dict], None]] = None):
         """
         Initialize scraper for a specific city
         
         Args:
             city: City name in URL format (e.g., 'voronezh', 'moscow', 'spb')
             geocoder_api_key: Yandex Geocoder API key (optional, for address geocoding)
+            cancel_event: Event that asks a running scrape/import to stop early
+            progress_callback: Called with (phase, counters) as the scrape/import advances
         """
         self.city = city
+        self.cancel_event = cancel_event
+        self.progress_callback = progress_callback
         self.geocoder_api_key = geocoder_api_key
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
@@ -57,9 +72,36 @@ class YandexAfishaScraper:
         }
         self.session = requests.Session()
         self.session.headers.update(self.headers)
+        self.session.hooks['response'].append(self._count_response)
+        self.http_requests = 0
+        self.http_bytes = 0
+        
+        # Set when a category could not be fetched from any endpoint
+        self.fetch_failed = False
         
         # Cache for geocoding results to avoid repeated API calls
         self._geocode_cache = {}
+        
+        # Endpoint that worked last time per category
+        self._preferred_endpoints = load_preferred_endpoints('yandex_afisha', city)
+    
+    def _is_cancelled(self) -> bool:
+        """Check whether the caller asked to stop"""
+        return self.cancel_event is not None and self.cancel_event.is_set()
+    
+    def _count_response(self, response, *args, **kwargs):
+        """Session hook counting HTTP requests and response bytes of this scraper"""
+        self.http_requests += 1
+        self.http_bytes += len(response.content or b'')
+    
+    def _report_progress(self, phase: str, **counters):
+        """Report progress to the caller, never failing the import because of it"""
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(phase, counters)
+        except Exception as e:
+            logger.debug(f"Progress callback failed: {e}")
     
     def scrape_events(self, 
                      categories: Optional[List[str]] = None,
@@ -77,47 +119,106 @@ class YandexAfishaScraper:
         Returns:
             List of event dictionaries with all required fields
         """
+        raw_items = self.iter_raw_items(categories, days_ahead, limit_per_category)
+        all_events = [event for event in map(self.parse_item, raw_items) if event]
+        logger.info(f"Total events scraped: {len(all_events)}")
+        return all_events
+    
+    def iter_raw_items(self,
+                       categories: Optional[List[str]] = None,
+                       days_ahead: int = 30,
+                       limit_per_category: int = 50) -> Iterator[Tuple[Dict, str]]:
+        """
+        Stream raw event items category by category
+        
+        Used as the fetch stage of the import pipeline; takes the same
+        arguments as scrape_events().
+        
+        Yields:
+            Tuples of (raw item, category)
+        """
         if categories is None:
             categories = ['concert', 'theatre', 'exhibition', 'sport', 'festival']
         
-        all_events = []
+        fetched = 0
         
-        for category in categories:
+        for done, category in enumerate(categories, start=1):
+            if self._is_cancelled():
+                logger.warning(f"Yandex Afisha scrape for {self.city} cancelled")
+                break
+            
             try:
                 logger.info(f"Fetching {category} events from Yandex Afisha API")
-                events = self._fetch_category_events(category, days_ahead, limit_per_category)
-                all_events.extend(events)
-                logger.info(f"Found {len(events)} {category} events")
-                
-                # Rate limiting to be respectful to the API
-                time.sleep(1)
-                
+                items = self._fetch_category_items(category, days_ahead, limit_per_category)
+                logger.info(f"Found {len(items)} {category} events")
             except Exception as e:
                 logger.error(f"Error fetching {category} events: {e}", exc_info=True)
                 continue
-        
-        logger.info(f"Total events scraped: {len(all_events)}")
-        return all_events
+            
+            for item in items:
+                yield item, category
+            
+            fetched += len(items)
+            self._report_progress(
+                'fetching',
+                categories_done=done,
+                categories_total=len(categories),
+                fetched=fetched
+            )
+            
+            # Rate limiting to be respectful to the API
+            time.sleep(CATEGORY_DELAY)
+    
+    def parse_item(self, raw: Tuple[Dict, str]) -> Optional[Dict]:
+        """Parse stage of the import pipeline"""
+        item, category = raw
+        return self._parse_event_item(item, category)
     
-    def _fetch_category_events(self, category: str, days_ahead: int, limit: int) -> List[Dict]:
+    def _endpoint_urls(self, category: str) -> Dict[str, str]:
         """
-        Fetch events for a specific category using Yandex API
+        Candidate API endpoints for a category, keyed by endpoint name
+        """
+        return {
+            'rubric': f"{self.API_BASE}/events/rubric/{category}",
+            'selection': f"{self.API_BASE}/events/selection/{category}",
+            'city_rubric': f"{self.SITE_BASE}/{self.city}/api/events/rubric/{category}"
+        }
+    
+    def _fetch_category_items(self, category: str, days_ahead: int, limit: int) -> List[Dict]:
+        """
+        Fetch raw event items for a specific category using Yandex API
         
         The API structure may vary, this implementation tries multiple approaches:
         1. Direct category API endpoint
         2. Selection/rubric endpoints
         3. Search endpoint with filters
+        
+        The endpoint that worked last time for this (city, category) is tried
+        first, and endpoints/source with an open circuit breaker are skipped.
         """
-        events = []
+        items = []
+        source_breaker = get_circuit_breaker('yandex_afisha')
         
-        # Try different API endpoint patterns with shorter timeout
-        endpoints_to_try = [
-            f"{self.API_BASE}/events/rubric/{category}",
-            f"{self.API_BASE}/events/selection/{category}",
-            f"https://afisha.yandex.ru/{self.city}/api/events/rubric/{category}"
-        ]
+        if not source_breaker.allow_request():
+            logger.info(f"Yandex Afisha circuit is open, skipping {category} for {self.city}")
+            self.fetch_failed = True
+            return items
+        
+        endpoints = self._endpoint_urls(category)
+        preferred = self._preferred_endpoints.get(category)
+        order = sorted(endpoints, key=lambda name: name != preferred)
         
-        for endpoint in endpoints_to_try:
+        any_endpoint_alive = False
+        last_error = None
+        
+        # Try different API endpoint patterns with shorter timeout
+        for name in order:
+            endpoint = endpoints[name]
+            breaker = get_circuit_breaker(f"yandex_afisha:{name}")
+            if not breaker.allow_request():
+                logger.debug(f"Circuit for endpoint {name} is open, skipping")
+                continue
+            
             try:
                 params = {
                     'city': self.city,
@@ -129,53 +230,65 @@ class YandexAfishaScraper:
                 
                 if response.status_code == 200:
                     data = response.json()
-                    events = self._parse_api_response(data, category)
-                    if events:
+                    breaker.record_success()
+                    any_endpoint_alive = True
+                    items = self._extract_items(data)
+                    if items:
                         logger.info(f"Successfully fetched from {endpoint}")
+                        if name != preferred:
+                            remember_endpoint('yandex_afisha', self.city, category, name)
+                            self._preferred_endpoints[category] = name
                         break
+                else:
+                    last_error = f"HTTP {response.status_code}"
+                    breaker.record_failure(f"{last_error} for {endpoint}")
                         
             except requests.exceptions.Timeout:
+                last_error = "timeout"
+                breaker.record_failure(f"Timeout for {endpoint}")
                 logger.warning(f"Timeout for endpoint {endpoint}")
                 continue
             except requests.exceptions.RequestException as e:
+                last_error = str(e)
+                breaker.record_failure(str(e))
                 logger.debug(f"Endpoint {endpoint} failed: {e}")
                 continue
             except Exception as e:
+                last_error = str(e)
+                breaker.record_failure(str(e))
                 logger.error(f"Unexpected error for {endpoint}: {e}")
                 continue
         
+        if any_endpoint_alive:
+            source_breaker.record_success()
+        elif last_error:
+            source_breaker.record_failure(f"All endpoints failed for {category}: {last_error}")
+            self.fetch_failed = True
+        else:
+            # Every endpoint circuit is open: nothing was called, so the source
+            # probe (if this was one) proved nothing and must not stay taken
+            logger.info(f"All Yandex Afisha endpoint circuits are open, skipping {category} for {self.city}")
+            source_breaker.release_probe()
+            self.fetch_failed = True
+        
         # If no events found from API, just return empty list
-        if not events:
+        if not items:
             logger.warning(f"No events fetched from API for category {category}")
         
-        return events
+        return items
     
-    def _parse_api_response(self, data: Dict, category: str) -> List[Dict]:
+    def _extract_items(self, data: Dict) -> List[Dict]:
         """
-        Parse JSON response from Yandex API
+        Extract raw event items from JSON response of Yandex API
         
         The response structure may vary, this handles common patterns
         """
-        events = []
-        
-        # Try different response structures
-        items = (
+        return (
             data.get('data', {}).get('items', []) or
             data.get('events', []) or
             data.get('items', []) or
             []
         )
-        
-        for item in items:
-            try:
-                event = self._parse_event_item(item, category)
-                if event:
-                    events.append(event)
-            except Exception as e:
-                logger.error(f"Error parsing event item: {e}")
-                continue
-        
-        return events
     
     def _parse_event_item(self, item: Dict, category: str) -> Optional[Dict]:
         """
@@ -218,8 +331,8 @@ class YandexAfishaScraper:
             if coords and isinstance(coords, (list, tuple)) and len(coords) >= 2:
                 lat, lon = float(coords[1]), float(coords[0])  # Note: Yandex uses [lon, lat]
             else:
-                # Try geocoding the address
-                lat, lon = self._geocode_address(address, venue_name)
+                # Try known venues first, remote geocoding is the last resort
+                lat, lon = self._resolve_venue(venue_name, address)
             
             # Extract image
             image_url = self._extract_image_url(item)
@@ -353,7 +466,28 @@ class YandexAfishaScraper:
         
         return None
     
-    def _geocode_address(self, address: str, venue_name: str = '') -> Tuple[float, float]:
+    def _resolve_venue(self, venue_name: str, address: str) -> Tuple[Optional[float], Optional[float]]:
+        """
+        Resolve venue coordinates via local gazetteer, falling back to geocoder
+        
+        Args:
+            venue_name: Venue name
+            address: Address string
+        
+        Returns:
+            Tuple of (latitude, longitude), (None, None) if venue is unknown
+        """
+        gazetteer = get_venue_gazetteer()
+        coords = gazetteer.resolve(self.city, venue_name, address)
+        if coords:
+            return coords
+        
+        lat, lon = self._geocode_address(address, venue_name)
+        if lat is not None and lon is not None:
+            gazetteer.add(self.city, venue_name, lat, lon)
+        return lat, lon
+    
+    def _geocode_address(self, address: str, venue_name: str = '') -> Tuple[Optional[float], Optional[float]]:
         """
         Convert address to coordinates using Yandex Geocoder API
         
@@ -362,10 +496,11 @@ class YandexAfishaScraper:
             venue_name: Venue name for better geocoding
         
         Returns:
-            Tuple of (latitude, longitude)
+            Tuple of (latitude, longitude), (None, None) if geocoding is not possible.
+            Events without coordinates are skipped on import instead of being
+            placed into some city centre.
         """
-        # Default coordinates for Voronezh city center
-        default_coords = (51.6605, 39.2005)
+        default_coords = (None, None)
         
         if not address and not venue_name:
             return default_coords
@@ -379,7 +514,12 @@ class YandexAfishaScraper:
         
         # If no API key, return default
         if not self.geocoder_api_key:
-            logger.debug(f"No geocoder API key, using default coordinates for: {search_query}")
+            logger.debug(f"No geocoder API key, cannot resolve coordinates for: {search_query}")
+            return default_coords
+        
+        breaker = get_circuit_breaker('yandex_geocoder')
+        if not breaker.allow_request():
+            logger.debug(f"Geocoder circuit is open, skipping: {search_query}")
             return default_coords
         
         try:
@@ -392,7 +532,10 @@ class YandexAfishaScraper:
             
             response = requests.get(self.GEOCODER_API, params=params, timeout=5)
             
-            if response.status_code == 200:
+            if response.status_code != 200:
+                breaker.record_failure(f"HTTP {response.status_code}")
+            else:
+                breaker.record_success()
                 data = response.json()
                 geo_objects = data.get('response', {}).get('GeoObjectCollection', {}).get('featureMember', [])
                 
@@ -406,6 +549,7 @@ class YandexAfishaScraper:
                         return coords
             
         except Exception as e:
+            breaker.record_failure(str(e))
             logger.error(f"Geocoding error for '{search_query}': {e}")
         
         return default_coords
@@ -422,102 +566,7 @@ class YandexAfishaScraper:
         Returns:
             Dictionary with import statistics including new_event_ids
         """
-        if db is None:
-            db = SessionLocal()
-            close_db = True
-        else:
-            close_db = False
-        
-        try:
-            stats = {
-                'total': len(events),
-                'created': 0,
-                'updated': 0,
-                'duplicates': 0,
-                'errors': 0,
-                'skipped_no_coords': 0,
-                'new_event_ids': []  # Track IDs of newly created events
-            }
-            
-            for event_data in events:
-                try:
-                    # Validate required fields
-                    if not event_data.get('title'):
-                        logger.warning("Skipping event without title")
-                        stats['errors'] += 1
-                        continue
-                    
-                    # Skip events without coordinates
-                    if not event_data.get('lat') or not event_data.get('lon'):
-                        logger.warning(f"Skipping event without coordinates: {event_data.get('title')}")
-                        stats['skipped_no_coords'] += 1
-                        continue
-                    
-                    # Check for duplicates by source_id
-                    existing = None
-                    if event_data.get('source_id'):
-                        existing = db.query(Event).filter(
-                            Event.source_id == event_data['source_id'],
-                            Event.source == 'yandex_afisha'
-                        ).first()
-                    
-                    # Fallback to old deduplication if no source_id
-                    if not existing:
-                        existing = db.query(Event).filter(
-                            Event.title == event_data['title'],
-                            Event.source == 'yandex_afisha',
-                            func.date(Event.start_time) == func.date(event_data['start_time'])
-                        ).first()
-                    
-                    if existing:
-                        # Update existing event
-                        existing.description = event_data.get('description', existing.description)
-                        existing.image_url = event_data.get('image_url', existing.image_url)
-                        existing.price = event_data.get('price', existing.price)
-                        existing.last_updated = datetime.utcnow()
-                        stats['updated'] += 1
-                        logger.info(f"Updated event: {event_data['title']}")
-                    else:
-                        # Create new event
-                        new_event = Event(
-                            title=event_data['title'],
-                            event_type=event_data['event_type'],
-                            description=event_data.get('description'),
-                            geom=func.ST_SetSRID(
-                                func.ST_MakePoint(event_data['lon'], event_data['lat']),
-                                4326
-                            ),
-                            start_time=event_data['start_time'],
-                            end_time=event_data.get('end_time'),
-                            source=event_data.get('source', 'yandex_afisha'),
-                            source_id=event_data.get('source_id'),
-                            source_url=event_data.get('source_url'),
-                            image_url=event_data.get('image_url'),
-                            price=event_data.get('price'),
-                            venue=event_data.get('venue'),
-                            city=event_data.get('city', self.city)
-                        )
-                        
-                        db.add(new_event)
-                        db.flush()  # Flush to get the ID
-                        stats['created'] += 1
-                        stats['new_event_ids'].append(new_event.id)  # Track new event ID
-                        logger.info(f"Created event: {event_data['title']}")
-                    
-                    db.commit()
-                    
-                except Exception as e:
-                    logger.error(f"Error importing event {event_data.get('title')}: {e}", exc_info=True)
-                    db.rollback()
-                    stats['errors'] += 1
-                    continue
-            
-            logger.info(f"Import completed: {stats}")
-            return stats
-            
-        finally:
-            if close_db:
-                db.close()
+        return ImportPipeline(self, db).write(events)
 
 
 def scrape_and_import_yandex_events(
@@ -525,7 +574,9 @@ def scrape_and_import_yandex_events(
     categories: Optional[List[str]] = None,
     geocoder_api_key: Optional[str] = None,
     days_ahead: int = 30,
-    limit_per_category: int = 50
+    limit_per_category: int = 50,
+    cancel_event: Optional[threading.Event] = None,
+    progress_callback: Optional[Callable[[str, Dict], None]] = None
 ) -> Dict:
     """
     Convenience function to scrape and import events in one call
@@ -536,27 +587,23 @@ def scrape_and_import_yandex_events(
         geocoder_api_key: Yandex Geocoder API key for address geocoding
         days_ahead: Number of days ahead to fetch events
         limit_per_category: Maximum events per category
+        cancel_event: Event that asks the import to stop early
+        progress_callback: Called with (phase, counters) as the import advances
     
     Returns:
         Dictionary with import statistics
     """
-    scraper = YandexAfishaScraper(city=city, geocoder_api_key=geocoder_api_key)
-    events = scraper.scrape_events(
+    scraper = YandexAfishaScraper(city=city, geocoder_api_key=geocoder_api_key,
+                                  cancel_event=cancel_event,
+                                  progress_callback=progress_callback)
+    stats = ImportPipeline(scraper).run(
         categories=categories,
         days_ahead=days_ahead,
         limit_per_category=limit_per_category
     )
     
-    if not events:
+    if not stats['total']:
         logger.warning("No events found to import")
-        return {
-            'total': 0,
-            'imported': 0,
-            'duplicates': 0,
-            'errors': 0,
-            'skipped_no_coords': 0
-        }
     
-    stats = scraper.import_events_to_db(events)
     logger.info(f"Scraping and import completed: {stats}")
-    return stats
\ No newline at end of file
+    return stats
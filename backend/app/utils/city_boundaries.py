@@ -0,0 +1,155 @@
+"""
+Загрузка границ городов из GeoJSON
+
+Файлы лежат в CITY_BOUNDARIES_DIR и называются по slug города из
+cities_config.py: moscow.geojson, spb.geojson и т.д. Поддерживаются
+Feature, FeatureCollection и голая геометрия (Polygon/MultiPolygon).
+
+Границы хранятся в таблице cities; город события назначает триггер
+trg_events_assign_city через ST_Contains по GiST-индексу. Города без файла
+границы продолжают использовать город, указанный при импорте.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..cities_config import CITIES
+
+logger = logging.getLogger(__name__)
+
+CITY_BOUNDARIES_DIR = os.getenv(
+    'CITY_BOUNDARIES_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'cities')
+)
+
+
+def _extract_geometries(document: Dict) -> List[Dict]:
+    """Список геометрий из GeoJSON-документа любого поддерживаемого типа"""
+    doc_type = document.get('type')
+    if doc_type == 'FeatureCollection':
+        return [f['geometry'] for f in document.get('features', []) if f.get('geometry')]
+    if doc_type == 'Feature':
+        return [document['geometry']] if document.get('geometry') else []
+    if doc_type in ('Polygon', 'MultiPolygon', 'GeometryCollection'):
+        return [document]
+    raise ValueError(f"Неподдерживаемый тип GeoJSON: {doc_type}")
+
+
+def load_city_boundaries(db: Session, directory: Optional[str] = None) -> Dict[str, int]:
+    """
+    Загрузить границы городов из GeoJSON-файлов
+
+    Неизмененные файлы (совпадает SHA-256) пропускаются, поэтому загрузку
+    можно вызывать при каждом старте приложения.
+
+    Args:
+        db: Сессия базы данных
+        directory: Каталог с файлами (по умолчанию CITY_BOUNDARIES_DIR)
+
+    Returns:
+        Словарь со статистикой: loaded, unchanged, errors и reassigned
+    """
+    directory = directory or CITY_BOUNDARIES_DIR
+    stats = {'loaded': 0, 'unchanged': 0, 'errors': 0, 'reassigned': 0}
+
+    if not os.path.isdir(directory):
+        logger.info(f"Каталог границ городов {directory} не найден, границы не загружаются")
+        return stats
+
+    known_hashes = dict(db.execute(text("SELECT slug, source_hash FROM cities")).all())
+
+    for filename in sorted(os.listdir(directory)):
+        slug, ext = os.path.splitext(filename)
+        if ext.lower() not in ('.geojson', '.json'):
+            continue
+        if slug not in CITIES:
+            logger.warning(f"Файл границы {filename}: город '{slug}' отсутствует в cities_config")
+            stats['errors'] += 1
+            continue
+
+        path = os.path.join(directory, filename)
+        try:
+            with open(path, 'rb') as f:
+                raw = f.read()
+            source_hash = hashlib.sha256(raw).hexdigest()
+            if known_hashes.get(slug) == source_hash:
+                stats['unchanged'] += 1
+                continue
+
+            geometries = _extract_geometries(json.loads(raw))
+            if not geometries:
+                raise ValueError("файл не содержит геометрий")
+
+            db.execute(
+                text("""
+                    INSERT INTO cities (slug, name, boundary, source_hash, loaded_at)
+                    VALUES (
+                        :slug, :name,
+                        ST_Multi(ST_CollectionExtract(ST_MakeValid(ST_UnaryUnion(
+                            ST_SetSRID(ST_GeomFromGeoJSON(:geometry), 4326)
+                        )), 3)),
+                        :source_hash, CURRENT_TIMESTAMP
+                    )
+                    ON CONFLICT (slug) DO UPDATE
+                    SET name = EXCLUDED.name,
+                        boundary = EXCLUDED.boundary,
+                        source_hash = EXCLUDED.source_hash,
+                        loaded_at = EXCLUDED.loaded_at
+                """),
+                {
+                    'slug': slug,
+                    'name': CITIES[slug]['name'],
+                    'geometry': json.dumps({'type': 'GeometryCollection', 'geometries': geometries}),
+                    'source_hash': source_hash
+                }
+            )
+            db.commit()
+            stats['loaded'] += 1
+            logger.info(f"Загружена граница города {slug} из {filename}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Ошибка загрузки границы из {filename}: {e}")
+            stats['errors'] += 1
+
+    if stats['loaded']:
+        stats['reassigned'] = reassign_event_cities(db)
+
+    return stats
+
+
+def reassign_event_cities(db: Session) -> int:
+    """
+    Переназначить города существующих событий по границам
+
+    Два set-based UPDATE вместо обхода событий: первый переносит точки в
+    содержащий их город, второй помечает точки вне границы своего города.
+    Колонка geom не меняется, поэтому триггер при этом не срабатывает.
+
+    Returns:
+        Количество измененных событий
+    """
+    assigned = db.execute(text("""
+        UPDATE events e
+        SET city = c.slug, outside_city_bounds = FALSE, last_updated = CURRENT_TIMESTAMP
+        FROM cities c
+        WHERE ST_Contains(c.boundary, e.geom)
+          AND (e.city <> c.slug OR e.outside_city_bounds)
+    """)).rowcount
+
+    flagged = db.execute(text("""
+        UPDATE events e
+        SET outside_city_bounds = TRUE
+        WHERE NOT e.outside_city_bounds
+          AND EXISTS (SELECT 1 FROM cities c WHERE c.slug = e.city)
+          AND NOT EXISTS (SELECT 1 FROM cities c WHERE ST_Contains(c.boundary, e.geom))
+    """)).rowcount
+
+    db.commit()
+    logger.info(f"Города событий по границам: переназначено {assigned}, вне границ {flagged}")
+    return assigned + flagged
+
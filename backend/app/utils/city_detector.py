@@ -1,84 +1,161 @@
 """
 Утилита для определения города по координатам
 """
+import os
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text
+
 from ..cities_config import CITIES
 
-def detect_city_by_coordinates(lat: float, lon: float) -> str:
+# Город, к которому не удалось отнести точку
+UNKNOWN_CITY = 'unknown'
+
+# Точки дальше этого расстояния от центра любого города считаются вне городов
+CITY_MAX_DISTANCE_KM = float(os.getenv('CITY_MAX_DISTANCE_KM', '50'))
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Размер блока точек: матрица расстояний блок x города не должна расти с числом точек
+_CHUNK_SIZE = 100_000
+
+
+def _city_centres() -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Slug'и городов и координаты их центров в радианах"""
+    slugs = np.array(list(CITIES.keys()))
+    lats = np.radians([info['lat'] for info in CITIES.values()])
+    lons = np.radians([info['lon'] for info in CITIES.values()])
+    return slugs, lats, lons
+
+
+def haversine_km(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """
+    Расстояние по большому кругу в километрах (все аргументы в радианах, с broadcasting)
+    """
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def detect_cities_batch(lats: Sequence[float], lons: Sequence[float],
+                        max_distance_km: Optional[float] = CITY_MAX_DISTANCE_KM) -> np.ndarray:
+    """
+    Определить города для массива точек за один векторизованный проход
+
+    Расстояния до всех центров городов считаются сразу матрицей
+    (точки x города), без цикла по точкам в Python.
+
+    Args:
+        lats: Широты
+        lons: Долготы
+        max_distance_km: Максимальное расстояние до центра города (None - без ограничения)
+
+    Returns:
+        Массив slug'ов городов; 'unknown' для точек дальше max_distance_km от всех городов
+    """
+    point_lats = np.radians(np.asarray(lats, dtype=np.float64))
+    point_lons = np.radians(np.asarray(lons, dtype=np.float64))
+    slugs, city_lats, city_lons = _city_centres()
+
+    result = np.empty(point_lats.shape[0], dtype=object)
+
+    for start in range(0, point_lats.shape[0], _CHUNK_SIZE):
+        chunk = slice(start, start + _CHUNK_SIZE)
+        distances = haversine_km(
+            point_lats[chunk, np.newaxis], point_lons[chunk, np.newaxis],
+            city_lats[np.newaxis, :], city_lons[np.newaxis, :]
+        )
+        nearest = distances.argmin(axis=1)
+        cities = slugs[nearest].astype(object)
+
+        if max_distance_km is not None:
+            too_far = distances[np.arange(nearest.shape[0]), nearest] > max_distance_km
+            cities[too_far] = UNKNOWN_CITY
+
+        result[chunk] = cities
+
+    return result
+
+
+def detect_city_by_coordinates(lat: float, lon: float,
+                               max_distance_km: Optional[float] = CITY_MAX_DISTANCE_KM) -> str:
     """
     Определить город по координатам
-    
+
     Args:
         lat: Широта
         lon: Долгота
-        
+        max_distance_km: Максимальное расстояние до центра города (None - без ограничения)
+
     Returns:
-        Строка с slug города (например, 'moscow', 'voronezh')
+        Строка с slug города (например, 'moscow', 'voronezh') или 'unknown'
     """
-    closest_city = None
-    min_distance = float('inf')
-    
-    for city_slug, city_info in CITIES.items():
-        city_lat = city_info['lat']
-        city_lon = city_info['lon']
-        
-        # Простое евклидово расстояние (для демонстрации)
-        # В реальном проекте можно использовать более точные алгоритмы
-        distance = ((lat - city_lat) ** 2 + (lon - city_lon) ** 2) ** 0.5
-        
-        if distance < min_distance:
-            min_distance = distance
-            closest_city = city_slug
-    
-    return closest_city or 'voronezh'  # fallback
-
-def migrate_existing_events(db):
+    return str(detect_cities_batch([lat], [lon], max_distance_km)[0])
+
+
+def migrate_existing_events(db, max_distance_km: Optional[float] = CITY_MAX_DISTANCE_KM):
     """
     Мигрировать существующие события - определить город по координатам
-    
+
+    Весь пересчет выполняется одним UPDATE в базе: центры городов передаются
+    как VALUES, ближайший выбирается через DISTINCT ON по сферическому
+    расстоянию, строки с уже верным городом не перезаписываются. События,
+    точка которых лежит внутри загруженной границы города, пропускаются:
+    их город уже назначил триггер по ST_Contains.
+
     Args:
         db: Сессия базы данных
+        max_distance_km: Максимальное расстояние до центра города (None - без ограничения)
+
+    Returns:
+        Кортеж (обновлено событий, событий вне городов)
     """
-    from ..models import Event
-    from sqlalchemy import text
-    
-    # Получить все существующие события
-    events = db.query(Event).all()
-    
-    migrated = 0
-    errors = 0
-    
-    for event in events:
-        try:
-            # Получить координаты события
-            result = db.execute(
-                text("SELECT ST_Y(geom) as lat, ST_X(geom) as lon FROM events WHERE id = :id"),
-                {"id": event.id}
-            ).first()
-            
-            if result and result.lat and result.lon:
-                city = detect_city_by_coordinates(result.lat, result.lon)
-                
-                # Обновить город
-                db.execute(
-                    text("UPDATE events SET city = :city, last_updated = CURRENT_TIMESTAMP WHERE id = :id"),
-                    {"city": city, "id": event.id}
+    params = {"max_distance_m": max_distance_km * 1000 if max_distance_km is not None else None,
+              "unknown": UNKNOWN_CITY}
+    values = []
+    for i, (slug, info) in enumerate(CITIES.items()):
+        values.append(f"(:slug_{i}, :lat_{i}, :lon_{i})")
+        params.update({f"slug_{i}": slug, f"lat_{i}": info['lat'], f"lon_{i}": info['lon']})
+
+    result = db.execute(
+        text(f"""
+            WITH centres(slug, lat, lon) AS (
+                VALUES {', '.join(values)}
+            ),
+            nearest AS (
+                SELECT DISTINCT ON (e.id)
+                    e.id,
+                    CASE
+                        WHEN CAST(:max_distance_m AS DOUBLE PRECISION) IS NULL
+                          OR ST_DistanceSphere(e.geom, ST_SetSRID(ST_MakePoint(c.lon, c.lat), 4326))
+                             <= CAST(:max_distance_m AS DOUBLE PRECISION)
+                        THEN c.slug
+                        ELSE :unknown
+                    END AS city
+                FROM events e
+                CROSS JOIN centres c
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM cities b WHERE ST_Contains(b.boundary, e.geom)
                 )
-                
-                migrated += 1
-                print(f"Мигрировано событие {event.id}: {event.title} -> {city}")
-            else:
-                print(f"Событие {event.id}: не удалось получить координаты")
-                errors += 1
-                
-        except Exception as e:
-            print(f"Ошибка миграции события {event.id}: {e}")
-            errors += 1
-            continue
-    
+                ORDER BY e.id, ST_DistanceSphere(e.geom, ST_SetSRID(ST_MakePoint(c.lon, c.lat), 4326))
+            )
+            UPDATE events e
+            SET city = nearest.city, last_updated = CURRENT_TIMESTAMP
+            FROM nearest
+            WHERE e.id = nearest.id AND e.city IS DISTINCT FROM nearest.city
+            RETURNING e.city
+        """),
+        params
+    ).scalars().all()
     db.commit()
-    print(f"Миграция завершена: {migrated} успешно, {errors} ошибок")
-    
-    return migrated, errors
+
+    migrated = len(result)
+    unknown = sum(1 for city in result if city == UNKNOWN_CITY)
+    print(f"Миграция завершена: обновлено {migrated} событий, вне городов {unknown}")
+
+    return migrated, unknown
 
 if __name__ == "__main__":
     # Тестирование функции определения города
@@ -87,8 +164,9 @@ if __name__ == "__main__":
         (59.9343, 30.3351),  # Санкт-Петербург
         (51.6606, 39.2003),  # Воронеж
         (56.8389, 60.6057),  # Екатеринбург
+        (64.5401, 40.5433),  # Архангельск - нет в списке городов
     ]
-    
-    for lat, lon in test_coordinates:
-        city = detect_city_by_coordinates(lat, lon)
-        print(f"Координаты ({lat}, {lon}) -> город: {city}")
\ No newline at end of file
+
+    lats, lons = zip(*test_coordinates)
+    for (lat, lon), city in zip(test_coordinates, detect_cities_batch(lats, lons)):
+        print(f"Координаты ({lat}, {lon}) -> город: {city}")
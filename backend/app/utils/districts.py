@@ -0,0 +1,179 @@
+"""
+Загрузка районов городов из GeoJSON
+
+Файлы лежат в DISTRICTS_DIR и называются по slug города: moscow.geojson,
+voronezh.geojson и т.д. Каждый файл - FeatureCollection, у объектов
+берутся свойства name (или name:ru) и population.
+
+Район события назначает триггер trg_events_assign_district при вставке,
+счетчики district_event_stats поддерживает триггер trg_events_district_stats,
+поэтому запросы к районам не выполняют point-in-polygon по всем событиям.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..cities_config import CITIES
+
+logger = logging.getLogger(__name__)
+
+DISTRICTS_DIR = os.getenv(
+    'DISTRICTS_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'districts')
+)
+
+
+def _parse_population(value) -> Optional[int]:
+    try:
+        return int(str(value).replace(' ', '')) if value not in (None, '') else None
+    except ValueError:
+        return None
+
+
+def _read_features(document: Dict) -> List[Dict]:
+    """Районы из FeatureCollection: name, population и геометрия"""
+    if document.get('type') != 'FeatureCollection':
+        raise ValueError(f"Ожидался FeatureCollection, получен {document.get('type')}")
+
+    districts = {}
+    for feature in document.get('features', []):
+        properties = feature.get('properties') or {}
+        name = properties.get('name') or properties.get('name:ru')
+        if not name or not feature.get('geometry'):
+            continue
+        # Районы из нескольких объектов (анклавы) объединяются по названию
+        district = districts.setdefault(name, {'name': name, 'population': None, 'geometries': []})
+        district['geometries'].append(feature['geometry'])
+        district['population'] = district['population'] or _parse_population(properties.get('population'))
+
+    return list(districts.values())
+
+
+def load_districts(db: Session, directory: Optional[str] = None) -> Dict[str, int]:
+    """
+    Загрузить районы городов из GeoJSON-файлов
+
+    Файлы, загруженные ранее без изменений (совпадает SHA-256), пропускаются.
+    После загрузки районы существующих событий переназначаются set-based UPDATE.
+
+    Args:
+        db: Сессия базы данных
+        directory: Каталог с файлами (по умолчанию DISTRICTS_DIR)
+
+    Returns:
+        Словарь со статистикой: cities, districts, unchanged, errors и reassigned
+    """
+    directory = directory or DISTRICTS_DIR
+    stats = {'cities': 0, 'districts': 0, 'unchanged': 0, 'errors': 0, 'reassigned': 0}
+
+    if not os.path.isdir(directory):
+        logger.info(f"Каталог районов {directory} не найден, районы не загружаются")
+        return stats
+
+    for filename in sorted(os.listdir(directory)):
+        city, ext = os.path.splitext(filename)
+        if ext.lower() not in ('.geojson', '.json'):
+            continue
+        if city not in CITIES:
+            logger.warning(f"Файл районов {filename}: город '{city}' отсутствует в cities_config")
+            stats['errors'] += 1
+            continue
+
+        try:
+            with open(os.path.join(directory, filename), 'rb') as f:
+                raw = f.read()
+            source_hash = hashlib.sha256(raw).hexdigest()
+
+            stored_hashes = db.execute(
+                text("SELECT DISTINCT source_hash FROM districts WHERE city = :city"), {'city': city}
+            ).scalars().all()
+            if stored_hashes == [source_hash]:
+                stats['unchanged'] += 1
+                continue
+
+            districts = _read_features(json.loads(raw))
+            if not districts:
+                raise ValueError("файл не содержит районов")
+
+            for district in districts:
+                db.execute(
+                    text("""
+                        INSERT INTO districts (city, name, population, geom, source_hash)
+                        VALUES (
+                            :city, :name, :population,
+                            ST_Multi(ST_CollectionExtract(ST_MakeValid(ST_UnaryUnion(
+                                ST_SetSRID(ST_GeomFromGeoJSON(:geometry), 4326)
+                            )), 3)),
+                            :source_hash
+                        )
+                        ON CONFLICT (city, name) DO UPDATE
+                        SET population = EXCLUDED.population,
+                            geom = EXCLUDED.geom,
+                            source_hash = EXCLUDED.source_hash
+                    """),
+                    {
+                        'city': city,
+                        'name': district['name'][:255],
+                        'population': district['population'],
+                        'geometry': json.dumps({'type': 'GeometryCollection', 'geometries': district['geometries']}),
+                        'source_hash': source_hash
+                    }
+                )
+
+            # Районы, исчезнувшие из файла
+            db.execute(
+                text("DELETE FROM districts WHERE city = :city AND source_hash IS DISTINCT FROM :source_hash"),
+                {'city': city, 'source_hash': source_hash}
+            )
+            db.commit()
+
+            stats['cities'] += 1
+            stats['districts'] += len(districts)
+            logger.info(f"Загружено {len(districts)} районов города {city} из {filename}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Ошибка загрузки районов из {filename}: {e}")
+            stats['errors'] += 1
+
+    if stats['cities']:
+        stats['reassigned'] = reassign_event_districts(db)
+
+    return stats
+
+
+def reassign_event_districts(db: Session) -> int:
+    """
+    Переназначить районы существующих событий
+
+    Колонка geom не меняется, поэтому триггер назначения района не
+    срабатывает; счетчики district_event_stats обновляет триггер статистики.
+
+    Returns:
+        Количество измененных событий
+    """
+    assigned = db.execute(text("""
+        UPDATE events e
+        SET district_id = d.id
+        FROM districts d
+        WHERE ST_Contains(d.geom, e.geom)
+          AND e.district_id IS DISTINCT FROM d.id
+    """)).rowcount
+
+    cleared = db.execute(text("""
+        UPDATE events e
+        SET district_id = NULL
+        WHERE e.district_id IS NOT NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM districts d
+              WHERE d.id = e.district_id AND ST_Contains(d.geom, e.geom)
+          )
+    """)).rowcount
+
+    db.commit()
+    logger.info(f"Районы событий: назначено {assigned}, сброшено {cleared}")
+    return assigned + cleared
@@ -0,0 +1,84 @@
+"""
+Geohash: hierarchical string identifiers of grid cells
+
+Every next character splits a cell into 32 parts, so a prefix of length p
+is a cell of level p (p=5 ~ 4.9 x 4.9 km, p=6 ~ 1.2 x 0.6 km,
+p=7 ~ 153 x 153 m). The encoding matches PostGIS ST_GeoHash, which fills
+the events.geohash column.
+"""
+from typing import List, Tuple
+
+GEOHASH_PRECISION = 9  # Precision of the stored events.geohash (~5 m)
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {char: i for i, char in enumerate(_BASE32)}
+
+
+def encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Geohash of a point with the given length"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(chars) < precision:
+        value_range, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = bits * 2 + 1
+            value_range[0] = mid
+        else:
+            bits = bits * 2
+            value_range[1] = mid
+        even = not even
+
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return ''.join(chars)
+
+
+def bounds(cell: str) -> Tuple[float, float, float, float]:
+    """Cell bounds: (south, west, north, east)"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+
+    for char in cell:
+        bits = _DECODE[char]
+        for shift in range(4, -1, -1):
+            value_range = lon_range if even else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even = not even
+
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def neighbors(cell: str) -> List[str]:
+    """Neighbouring cells of the same level (up to 8, fewer at the poles)"""
+    south, west, north, east = bounds(cell)
+    d_lat = north - south
+    d_lon = east - west
+    center_lat = (south + north) / 2
+    center_lon = (west + east) / 2
+
+    result = []
+    for i in (-1, 0, 1):
+        lat = center_lat + i * d_lat
+        if not -90 < lat < 90:
+            continue
+        for j in (-1, 0, 1):
+            if i == 0 and j == 0:
+                continue
+            lon = (center_lon + j * d_lon + 180) % 360 - 180
+            result.append(encode(lat, lon, len(cell)))
+    return result
@@ -0,0 +1,246 @@
+"""
+Import Task Queue
+Postgres-backed queue of (source, city) import units. Workers claim tasks
+with FOR UPDATE SKIP LOCKED, so any number of worker containers can drain
+the queue concurrently without stepping on each other.
+"""
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Task is considered stuck when its heartbeat is older than this
+STALE_AFTER_SECONDS = 300
+
+
+def enqueue_import_tasks(db: Session, tasks: List[Tuple[str, str]],
+                         options: Optional[Dict[str, Dict]] = None) -> int:
+    """
+    Enqueue (source, city) import units, skipping pairs that are already queued or running
+
+    Args:
+        db: Database session
+        tasks: List of (source, city) pairs
+        options: Scraper options per source
+
+    Returns:
+        Number of newly enqueued tasks
+    """
+    options = options or {}
+    enqueued = 0
+
+    for source, city in tasks:
+        result = db.execute(
+            text("""
+                INSERT INTO import_tasks (source, city, options)
+                VALUES (:source, :city, :options)
+                ON CONFLICT (source, city) WHERE status IN ('pending', 'running') DO NOTHING
+            """),
+            {"source": source, "city": city, "options": json.dumps(options.get(source, {}))}
+        )
+        enqueued += result.rowcount
+
+    db.commit()
+    logger.info(f"Enqueued {enqueued} of {len(tasks)} import tasks")
+    return enqueued
+
+
+def claim_import_task(db: Session, worker_id: str) -> Optional[Dict]:
+    """
+    Claim the next runnable task
+
+    Args:
+        db: Database session
+        worker_id: Identifier of the claiming worker
+
+    Returns:
+        Task dictionary (id, source, city, options, attempts) or None if queue is empty
+    """
+    row = db.execute(
+        text("""
+            UPDATE import_tasks
+            SET status = 'running',
+                locked_by = :worker_id,
+                locked_at = timezone('utc', now()),
+                heartbeat_at = timezone('utc', now()),
+                attempts = attempts + 1
+            WHERE id = (
+                SELECT id FROM import_tasks
+                WHERE status = 'pending' AND run_after <= timezone('utc', now())
+                ORDER BY run_after, id
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id, source, city, options, attempts
+        """),
+        {"worker_id": worker_id}
+    ).first()
+    db.commit()
+
+    if not row:
+        return None
+
+    return {
+        "id": row.id,
+        "source": row.source,
+        "city": row.city,
+        "options": json.loads(row.options) if row.options else {},
+        "attempts": row.attempts
+    }
+
+
+def heartbeat_import_task(db: Session, task_id: int, worker_id: str) -> bool:
+    """
+    Refresh heartbeat of a running task
+
+    Returns:
+        False if the task no longer belongs to the worker (e.g. was re-queued)
+    """
+    result = db.execute(
+        text("""
+            UPDATE import_tasks SET heartbeat_at = timezone('utc', now())
+            WHERE id = :task_id AND locked_by = :worker_id AND status = 'running'
+        """),
+        {"task_id": task_id, "worker_id": worker_id}
+    )
+    db.commit()
+    return result.rowcount > 0
+
+
+def complete_import_task(db: Session, task_id: int, worker_id: str, stats: Dict):
+    """Mark task as done and store its import statistics"""
+    db.execute(
+        text("""
+            UPDATE import_tasks
+            SET status = 'done', result = :result, error = NULL,
+                finished_at = timezone('utc', now()), locked_by = NULL
+            WHERE id = :task_id AND locked_by = :worker_id
+        """),
+        {"task_id": task_id, "worker_id": worker_id, "result": json.dumps(stats, default=str)}
+    )
+    db.commit()
+
+
+def store_partial_result(db: Session, source: str, city: str, new_event_ids: List[int],
+                         run_id: Optional[int] = None):
+    """
+    Record events created by an interrupted or failed run for notification
+
+    They are stored as a finished, unnotified task row, so claim_unnotified_results
+    dispatches them; the retried task would no longer see these events as new.
+    """
+    if not new_event_ids:
+        return
+    db.execute(
+        text("""
+            INSERT INTO import_tasks (source, city, status, result, finished_at, notified)
+            VALUES (:source, :city, 'done', :result, timezone('utc', now()), FALSE)
+        """),
+        {"source": source, "city": city,
+         "result": json.dumps({"partial": True, "new_event_ids": new_event_ids, "run_id": run_id})}
+    )
+    db.commit()
+    logger.info(f"Stored {len(new_event_ids)} events of an unfinished {source}/{city} import for notification")
+
+
+def release_import_task(db: Session, task_id: int, worker_id: str):
+    """Put an interrupted task back into the queue without using up an attempt"""
+    db.execute(
+        text("""
+            UPDATE import_tasks
+            SET status = 'pending', attempts = GREATEST(attempts - 1, 0),
+                run_after = timezone('utc', now()), locked_by = NULL
+            WHERE id = :task_id AND locked_by = :worker_id
+        """),
+        {"task_id": task_id, "worker_id": worker_id}
+    )
+    db.commit()
+
+
+def fail_import_task(db: Session, task_id: int, worker_id: str, error: str):
+    """
+    Record task failure, re-queuing it with exponential backoff while attempts remain
+    """
+    db.execute(
+        text("""
+            UPDATE import_tasks
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                run_after = timezone('utc', now()) + make_interval(mins => power(2, attempts)::int),
+                finished_at = CASE WHEN attempts >= max_attempts THEN timezone('utc', now()) END,
+                error = :error,
+                locked_by = NULL
+            WHERE id = :task_id AND locked_by = :worker_id
+        """),
+        {"task_id": task_id, "worker_id": worker_id, "error": error[:2000]}
+    )
+    db.commit()
+
+
+def requeue_stale_import_tasks(db: Session, stale_after: int = STALE_AFTER_SECONDS) -> int:
+    """
+    Re-queue running tasks whose worker stopped heartbeating (crashed or killed)
+
+    Returns:
+        Number of re-queued (or finally failed) tasks
+    """
+    result = db.execute(
+        text("""
+            UPDATE import_tasks
+            SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+                finished_at = CASE WHEN attempts >= max_attempts THEN timezone('utc', now()) END,
+                error = 'Worker ' || coalesce(locked_by, '?') || ' stopped heartbeating',
+                locked_by = NULL,
+                run_after = timezone('utc', now())
+            WHERE status = 'running'
+              AND heartbeat_at < timezone('utc', now()) - make_interval(secs => :stale_after)
+        """),
+        {"stale_after": stale_after}
+    )
+    db.commit()
+
+    if result.rowcount:
+        logger.warning(f"Re-queued {result.rowcount} stuck import tasks")
+    return result.rowcount
+
+
+def claim_unnotified_results(db: Session, limit: int = 50) -> List[Dict]:
+    """
+    Take finished tasks whose new events have not been notified yet
+
+    Rows are marked as notified in the same transaction, so each result is
+    dispatched by exactly one backend process.
+
+    Returns:
+        List of dictionaries with task id, source, city, new_event_ids and run_id
+    """
+    rows = db.execute(
+        text("""
+            UPDATE import_tasks SET notified = TRUE
+            WHERE id IN (
+                SELECT id FROM import_tasks
+                WHERE status = 'done' AND notified = FALSE
+                ORDER BY finished_at
+                FOR UPDATE SKIP LOCKED
+                LIMIT :limit
+            )
+            RETURNING id, source, city, result
+        """),
+        {"limit": limit}
+    ).all()
+    db.commit()
+
+    results = []
+    for row in rows:
+        stats = json.loads(row.result) if row.result else {}
+        results.append({
+            "id": row.id,
+            "source": row.source,
+            "city": row.city,
+            "new_event_ids": stats.get('new_event_ids') or [],
+            "run_id": stats.get('run_id')
+        })
+    return results
@@ -0,0 +1,176 @@
+"""
+Standalone Import Worker
+Drains the import_tasks queue. Run any number of copies to scale imports
+horizontally:
+
+    python -m app.workers.import_worker
+"""
+import logging
+import os
+import signal
+import socket
+import threading
+import uuid
+
+from ..database import SessionLocal
+from ..scrapers.runner import PartialImportError, run_import
+from .import_queue import (
+    claim_import_task,
+    complete_import_task,
+    fail_import_task,
+    heartbeat_import_task,
+    release_import_task,
+    requeue_stale_import_tasks,
+    store_partial_result
+)
+
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = int(os.getenv('IMPORT_WORKER_CONCURRENCY', '2'))
+POLL_INTERVAL = float(os.getenv('IMPORT_WORKER_POLL_INTERVAL', '5'))
+HEARTBEAT_INTERVAL = float(os.getenv('IMPORT_WORKER_HEARTBEAT_INTERVAL', '30'))
+
+
+class ImportWorker:
+    """Claims import tasks and runs them, heartbeating while they run"""
+
+    def __init__(self, worker_id: str, stop_event: threading.Event):
+        """
+        Args:
+            worker_id: Unique worker identifier stored in claimed tasks
+            stop_event: Set to stop the worker after the current task
+        """
+        self.worker_id = worker_id
+        self.stop_event = stop_event
+
+    def run_forever(self):
+        """Claim and execute tasks until stopped"""
+        logger.info(f"Import worker {self.worker_id} started")
+
+        while not self.stop_event.is_set():
+            try:
+                db = SessionLocal()
+                try:
+                    requeue_stale_import_tasks(db)
+                    task = claim_import_task(db, self.worker_id)
+                finally:
+                    db.close()
+
+                if task is None:
+                    self.stop_event.wait(POLL_INTERVAL)
+                    continue
+
+                self.execute(task)
+
+            except Exception as e:
+                logger.error(f"Import worker {self.worker_id} error: {e}", exc_info=True)
+                self.stop_event.wait(POLL_INTERVAL)
+
+        logger.info(f"Import worker {self.worker_id} stopped")
+
+    def execute(self, task: dict):
+        """
+        Run a claimed task with a heartbeat thread alongside
+
+        Args:
+            task: Task dictionary returned by claim_import_task
+        """
+        source, city = task['source'], task['city']
+        logger.info(f"Worker {self.worker_id} running import task {task['id']} ({source}/{city}), "
+                    f"attempt {task['attempts']}")
+
+        cancel_event = threading.Event()
+        done_event = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat_loop,
+            args=(task['id'], cancel_event, done_event),
+            daemon=True
+        )
+        heartbeat.start()
+
+        try:
+            stats = run_import(source, city, cancel_event, trigger='worker', **task['options'])
+        except Exception as e:
+            done_event.set()
+            heartbeat.join()
+            logger.error(f"Import task {task['id']} failed: {e}", exc_info=True)
+            db = SessionLocal()
+            try:
+                if isinstance(e, PartialImportError):
+                    store_partial_result(db, source, city, e.new_event_ids, e.run_id)
+                fail_import_task(db, task['id'], self.worker_id, str(e))
+            finally:
+                db.close()
+            return
+
+        done_event.set()
+        heartbeat.join()
+
+        # A cancelled run returns partial stats: notify about what it created and
+        # hand the task back instead of completing it
+        if cancel_event.is_set():
+            db = SessionLocal()
+            try:
+                store_partial_result(db, source, city, stats.get('new_event_ids') or [], stats.get('run_id'))
+                release_import_task(db, task['id'], self.worker_id)
+            finally:
+                db.close()
+            logger.info(f"Import task {task['id']} ({source}/{city}) interrupted, returned to the queue")
+            return
+
+        db = SessionLocal()
+        try:
+            complete_import_task(db, task['id'], self.worker_id, stats)
+        finally:
+            db.close()
+
+        logger.info(f"Import task {task['id']} ({source}/{city}) completed: {stats}")
+
+    def _heartbeat_loop(self, task_id: int, cancel_event: threading.Event, done_event: threading.Event):
+        """Refresh heartbeat until the task finishes; cancel it if ownership was lost"""
+        while not done_event.wait(HEARTBEAT_INTERVAL):
+            if self.stop_event.is_set():
+                cancel_event.set()
+
+            db = SessionLocal()
+            try:
+                if not heartbeat_import_task(db, task_id, self.worker_id):
+                    logger.warning(f"Lost ownership of import task {task_id}, cancelling")
+                    cancel_event.set()
+                    return
+            except Exception as e:
+                logger.error(f"Heartbeat for import task {task_id} failed: {e}")
+            finally:
+                db.close()
+
+
+def main():
+    """Start WORKER_CONCURRENCY worker threads and wait for SIGTERM/SIGINT"""
+    stop_event = threading.Event()
+
+    def handle_signal(signum, frame):
+        logger.info(f"Received signal {signum}, stopping import workers")
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    host = socket.gethostname()
+    threads = []
+    for _ in range(WORKER_CONCURRENCY):
+        worker = ImportWorker(f"{host}-{uuid.uuid4().hex[:8]}", stop_event)
+        thread = threading.Thread(target=worker.run_forever, name=worker.worker_id)
+        thread.start()
+        threads.append(thread)
+
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+"""
+Offline import and notification benchmarks
+
+Run from the backend directory:
+    python -m benchmarks.replay_server --pages 10 --latency 0.05
+    python -m benchmarks.bench_import --source kudago --pages 10
+    python -m benchmarks.bench_parse
+    python -m benchmarks.bench_notifications --users 10000 --events 100
+"""
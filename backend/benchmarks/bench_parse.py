@@ -0,0 +1,60 @@
+"""
+Parser Microbenchmarks
+Times KudaGoScraper._parse_event, _parse_dates and _extract_price on the
+recorded fixtures. Needs no database or network.
+
+Usage:
+    python -m benchmarks.bench_parse --number 20000
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import timeit
+from unittest import mock
+
+from app.scrapers import kudago
+from app.scrapers.kudago import KudaGoScraper
+from app.scrapers.venue_gazetteer import VenueGazetteer
+
+from .replay_server import FIXTURES_DIR
+
+logger = logging.getLogger(__name__)
+
+
+def load_items():
+    with open(os.path.join(FIXTURES_DIR, 'kudago_events.json'), encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmarks of KudaGo parsing')
+    parser.add_argument('--number', type=int, default=10000, help='Calls per measurement')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    items = load_items()
+    scraper = KudaGoScraper(city='voronezh')
+
+    benchmarks = {
+        '_parse_event': lambda: [scraper._parse_event(item) for item in items],
+        '_parse_dates': lambda: [scraper._parse_dates(item) for item in items],
+        '_extract_price': lambda: [scraper._extract_price(item) for item in items],
+    }
+
+    # Venue lookups go to a private in-memory gazetteer, never to the database
+    gazetteer = VenueGazetteer()
+    with mock.patch.object(kudago, 'get_venue_gazetteer', lambda: gazetteer):
+        for name, func in benchmarks.items():
+            timings = timeit.repeat(func, number=args.number, repeat=args.repeat)
+            per_call = min(timings) / (args.number * len(items)) * 1e6
+            print(f"{name:<16} {per_call:8.2f} µs/call (best of {args.repeat}, {args.number * len(items)} calls)")
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+"""
+Replay Server
+Local stand-in for KudaGo and Yandex Afisha APIs that replays recorded
+responses from benchmarks/fixtures.
+
+Recorded items are cloned into as many pages as requested, with unique ids,
+descending publication dates and event dates moved into the near future,
+so the same fixtures drive imports of any size. Latency, jitter and error
+rate are configurable to reproduce slow or flaky sources.
+
+Fixtures:
+    kudago_events.json  - one response of GET /public-api/v1.4/events/
+    yandex_rubric.json  - one response of GET /api/events/rubric/<category>
+
+Usage:
+    python -m benchmarks.replay_server --port 8800 --pages 10 --latency 0.05 --error-rate 0.05
+"""
+import argparse
+import copy
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlencode, urlparse
+
+logger = logging.getLogger(__name__)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# Synthetic ids start here so they never collide with real KudaGo ids
+KUDAGO_ID_BASE = 900000000
+
+KUDAGO_EVENTS_PATH = '/public-api/v1.4/events/'
+YANDEX_EVENTS_PREFIXES = ('/api/events/rubric/', '/api/events/selection/')
+
+
+def _load_fixture(fixtures_dir: str, name: str) -> Dict:
+    with open(os.path.join(fixtures_dir, name), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _shift_iso(value: str, offset: timedelta) -> str:
+    try:
+        return (datetime.fromisoformat(value.replace('Z', '+00:00')) + offset).isoformat()
+    except ValueError:
+        return value
+
+
+class ReplayServer:
+    """Threaded HTTP server replaying recorded source responses"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 pages: int = 5, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None,
+                 fixtures_dir: str = FIXTURES_DIR):
+        """
+        Args:
+            host: Interface to bind
+            port: Port to bind (0 picks a free one)
+            pages: Number of KudaGo pages to serve
+            latency: Fixed delay of every response in seconds
+            jitter: Additional random delay up to this many seconds
+            error_rate: Share of requests answered with HTTP 503
+            seed: Random seed for reproducible jitter/errors
+            fixtures_dir: Directory with recorded responses
+        """
+        self.pages = pages
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+        self._kudago_items = _load_fixture(fixtures_dir, 'kudago_events.json')['results']
+        yandex = _load_fixture(fixtures_dir, 'yandex_rubric.json')
+        self._yandex_items = (
+            yandex.get('data', {}).get('items', []) or
+            yandex.get('events', []) or
+            yandex.get('items', [])
+        )
+
+        self.requests = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.served_ids: Dict[str, set] = {'kudago': set(), 'yandex_afisha': set()}
+        self._stats_lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+        self._started_at = int(time.time())
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'ReplayServer':
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='replay-server', daemon=True)
+        self._thread.start()
+        logger.info(f"Replay server listening on {self.url}")
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.requests = 0
+            self.errors = 0
+            self.bytes_sent = 0
+            self.served_ids = {'kudago': set(), 'yandex_afisha': set()}
+
+    # Responses
+
+    def kudago_page(self, page: int, page_size: int) -> Optional[Dict]:
+        """Synthesize KudaGo events page, None if the page does not exist"""
+        if page < 1 or page > self.pages:
+            return None
+
+        first = (page - 1) * page_size
+        results = [self._kudago_item(first + i) for i in range(page_size)]
+
+        next_url = None
+        if page < self.pages:
+            next_url = f"{self.url}{KUDAGO_EVENTS_PATH}?{urlencode({'page': page + 1})}"
+
+        with self._stats_lock:
+            self.served_ids['kudago'].update(str(item['id']) for item in results)
+
+        return {
+            'count': self.pages * page_size,
+            'next': next_url,
+            'previous': None,
+            'results': results
+        }
+
+    def _kudago_item(self, index: int) -> Dict:
+        template = self._kudago_items[index % len(self._kudago_items)]
+        item = copy.deepcopy(template)
+        item['id'] = KUDAGO_ID_BASE + index
+        # Newest first, as requested with order_by=-publication_date
+        item['publication_date'] = self._started_at - index * 60
+
+        offset = self._date_offset(template.get('dates') or [], index)
+        for date in item.get('dates') or []:
+            for key in ('start', 'end'):
+                if isinstance(date.get(key), (int, float)):
+                    date[key] = int(date[key] + offset.total_seconds())
+            for key in ('start_date', 'end_date'):
+                if date.get(key):
+                    shifted = datetime.fromisoformat(date[key]) + offset
+                    date[key] = shifted.date().isoformat()
+        return item
+
+    def _date_offset(self, dates: List[Dict], index: int) -> timedelta:
+        """Offset moving a recorded event to day (1 + index % 30) from now"""
+        target = datetime.now().replace(hour=19, minute=0, second=0, microsecond=0) + timedelta(days=1 + index % 30)
+        if not dates:
+            return timedelta(0)
+        first = dates[0]
+        if isinstance(first.get('start'), (int, float)):
+            recorded = datetime.fromtimestamp(first['start'])
+        elif first.get('start_date'):
+            recorded = datetime.fromisoformat(first['start_date'])
+        else:
+            return timedelta(0)
+        return target - recorded
+
+    def yandex_rubric(self, category: str, limit: int) -> Dict:
+        """Synthesize Yandex Afisha rubric response"""
+        items = [self._yandex_item(category, i) for i in range(limit)]
+        with self._stats_lock:
+            self.served_ids['yandex_afisha'].update(item['id'] for item in items)
+        return {'data': {'items': items}}
+
+    def _yandex_item(self, category: str, index: int) -> Dict:
+        item = copy.deepcopy(self._yandex_items[index % len(self._yandex_items)])
+        item['id'] = f"bench-{category}-{index}"
+
+        target = datetime.now().astimezone().replace(hour=19, minute=0, second=0, microsecond=0) + timedelta(days=1 + index % 30)
+        for key in ('date', 'dateFrom', 'start', 'startDate'):
+            if isinstance(item.get(key), str):
+                recorded = datetime.fromisoformat(item[key].replace('Z', '+00:00'))
+                offset = target - recorded
+                item[key] = target.isoformat()
+                for end_key in ('dateTo', 'end', 'endDate'):
+                    if isinstance(item.get(end_key), str):
+                        item[end_key] = _shift_iso(item[end_key], offset)
+                break
+            if isinstance(item.get(key), (int, float)):
+                item[key] = int(target.timestamp())
+                break
+        return item
+
+    # HTTP plumbing
+
+    def _should_fail(self) -> bool:
+        with self._random_lock:
+            return self._random.random() < self.error_rate
+
+    def _delay(self) -> float:
+        with self._random_lock:
+            return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+
+                delay = server._delay()
+                if delay:
+                    time.sleep(delay)
+
+                if server._should_fail():
+                    self._send(503, {'detail': 'Injected error'}, error=True)
+                    return
+
+                if parsed.path == KUDAGO_EVENTS_PATH:
+                    body = server.kudago_page(int(query.get('page', 1)), int(query.get('page_size', 20)))
+                    if body is None:
+                        self._send(404, {'detail': 'Invalid page.'})
+                    else:
+                        self._send(200, body)
+                    return
+
+                for prefix in YANDEX_EVENTS_PREFIXES:
+                    if parsed.path.startswith(prefix):
+                        category = parsed.path[len(prefix):].strip('/')
+                        self._send(200, server.yandex_rubric(category, int(query.get('limit', 50))))
+                        return
+
+                self._send(404, {'detail': 'Not found'})
+
+            def _send(self, status: int, body: Dict, error: bool = False):
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+                with server._stats_lock:
+                    server.requests += 1
+                    server.bytes_sent += len(payload)
+                    if error:
+                        server.errors += 1
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded KudaGo/Yandex Afisha responses')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--pages', type=int, default=5, help='KudaGo pages to serve')
+    parser.add_argument('--latency', type=float, default=0.0, help='Response delay, seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Extra random delay, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of HTTP 503 responses')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--fixtures', default=FIXTURES_DIR, help='Directory with recorded responses')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = ReplayServer(
+        host=args.host, port=args.port, pages=args.pages, latency=args.latency,
+        jitter=args.jitter, error_rate=args.error_rate, seed=args.seed,
+        fixtures_dir=args.fixtures
+    )
+    server.start()
+    print(f"KudaGo API base:  {server.url}/public-api/v1.4")
+    print(f"Yandex API base:  {server.url}/api")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
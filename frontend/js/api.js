@@ -104,6 +104,49 @@ class CityGeoAPI {
         });
     }
 
+    async getImportJob(jobId) {
+        return this.request(`/import/jobs/${jobId}`);
+    }
+
+    // Дождаться завершения фоновой задачи импорта, получая прогресс через SSE
+    waitForImportJob(jobId, onProgress = null) {
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(`${this.baseUrl}/import/jobs/${jobId}/events`);
+
+            const finish = (job) => {
+                source.close();
+                if (job.status === 'failed') {
+                    reject(new Error(job.error || 'Import job failed'));
+                } else {
+                    resolve(job);
+                }
+            };
+
+            source.addEventListener('progress', (event) => {
+                if (onProgress) onProgress(JSON.parse(event.data));
+            });
+
+            source.addEventListener('done', (event) => {
+                finish(JSON.parse(event.data));
+            });
+
+            source.onerror = async () => {
+                // Поток оборвался - запросить итоговое состояние задачи
+                source.close();
+                try {
+                    const job = await this.getImportJob(jobId);
+                    if (job.status === 'completed' || job.status === 'failed') {
+                        finish(job);
+                    } else {
+                        resolve(await this.waitForImportJob(jobId, onProgress));
+                    }
+                } catch (error) {
+                    reject(error);
+                }
+            };
+        });
+    }
+
     async importTestMoscowEvents() {
         return this.request('/events/import/test-moscow', {
             method: 'POST'
@@ -818,8 +818,9 @@ async function importFromKudaGo() {
     displayResults(`<h4>Импорт из KudaGo для ${cityName}...</h4><p>Загружаем события...<br>Пожалуйста, подождите...</p>`);
     
     try {
-        const result = await api.importKudaGoEvents(city, null, 30);
-        displayImportResult(result, 'KudaGo');
+        const accepted = await api.importKudaGoEvents(city, null, 30);
+        const job = await api.waitForImportJob(accepted.job_id, showImportProgress);
+        displayImportResult(job.result, 'KudaGo');
         await loadEvents();
     } catch (error) {
         console.error('Ошибка импорта KudaGo:', error);
@@ -834,8 +835,9 @@ async function importFromYandex() {
     displayResults(`<h4>Импорт из Яндекс.Афиши для ${cityName}...</h4><p>Загружаем события...<br>Пожалуйста, подождите...</p>`);
     
     try {
-        const result = await api.importYandexEvents(city, null, 30);
-        displayImportResult(result, 'Яндекс.Афиша');
+        const accepted = await api.importYandexEvents(city, null, 30);
+        const job = await api.waitForImportJob(accepted.job_id, showImportProgress);
+        displayImportResult(job.result, 'Яндекс.Афиша');
         await loadEvents();
     } catch (error) {
         console.error('Ошибка импорта Яндекс.Афиши:', error);
@@ -868,6 +870,28 @@ async function importTestMoscow() {
     }
 }
 
+function showImportProgress(job) {
+    const phases = {
+        queued: 'В очереди',
+        fetching: 'Загрузка событий',
+        importing: 'Сохранение событий',
+        notifying: 'Отправка уведомлений',
+        done: 'Завершение'
+    };
+    const progress = job.progress || {};
+    let details = '';
+    if (progress.fetched !== undefined) {
+        details += `Получено: ${progress.fetched}<br>`;
+    }
+    if (progress.total !== undefined) {
+        details += `Обработано: ${progress.processed || 0} из ${progress.total}<br>`;
+    } else if (progress.processed !== undefined) {
+        details += `Сохранено: ${progress.processed}<br>`;
+    }
+    
+    displayResults(`<h4>Импорт: ${phases[job.phase] || job.phase}...</h4><p>${details}Пожалуйста, подождите...</p>`);
+}
+
 function displayImportResult(result, sourceName) {
     const stats = result.statistics;
     const sourceClass = result.source === 'manual' ? 'manual' : result.source === 'yandex_afisha' ? 'yandex' : 'kudago';
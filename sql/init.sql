@@ -111,6 +111,520 @@ COMMENT ON TABLE notification_history IS 'History of sent notifications to preve
 -- Add comments to important columns
 COMMENT ON COLUMN telegram_users.notification_radius IS 'Notification radius in meters from user location';
 COMMENT ON COLUMN telegram_users.user_location IS 'User location point for proximity-based notifications';
-COMMENT ON COLUMN telegram_users.preferred_event_types IS 'JSON array of preferred event types';
 
-SELECT PostGIS_version();
\ No newline at end of file
+-- ============================================================================
+-- IMPORT TASK QUEUE (Migration 003)
+-- ============================================================================
+
+-- Queue of (source, city) import units, claimed by workers with FOR UPDATE SKIP LOCKED
+CREATE TABLE IF NOT EXISTS import_tasks (
+    id SERIAL PRIMARY KEY,
+    source VARCHAR(50) NOT NULL,  -- kudago, yandex_afisha
+    city VARCHAR(50) NOT NULL,
+    options TEXT,  -- JSON object with scraper options
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',  -- pending, running, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_after TIMESTAMP NOT NULL DEFAULT timezone('utc', now()),  -- Not claimed before this time (retry backoff), UTC
+    locked_by VARCHAR(100),  -- Worker that claimed the task
+    locked_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,  -- Updated periodically while the task runs
+    finished_at TIMESTAMP,
+    result TEXT,  -- JSON import statistics
+    error TEXT,
+    notified BOOLEAN NOT NULL DEFAULT FALSE,  -- Real-time notifications sent for new events
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Claim order for pending tasks
+CREATE INDEX IF NOT EXISTS idx_import_tasks_pending ON import_tasks(run_after, id) WHERE status = 'pending';
+-- Stuck task detection
+CREATE INDEX IF NOT EXISTS idx_import_tasks_running ON import_tasks(heartbeat_at) WHERE status = 'running';
+-- Finished tasks waiting for notifications
+CREATE INDEX IF NOT EXISTS idx_import_tasks_unnotified ON import_tasks(finished_at) WHERE status = 'done' AND notified = FALSE;
+-- At most one queued or running task per (source, city)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_import_tasks_active ON import_tasks(source, city) WHERE status IN ('pending', 'running');
+
+-- Queue timestamps are UTC, like the timezone('utc', now()) comparisons of the workers
+ALTER TABLE import_tasks ALTER COLUMN run_after SET DEFAULT timezone('utc', now());
+
+COMMENT ON TABLE import_tasks IS 'Queue of (source, city) import units for horizontally scaled import workers';
+
+-- ============================================================================
+-- IMPORT WATERMARKS (Migration 004)
+-- ============================================================================
+
+-- Per (source, city) progress of incremental imports
+CREATE TABLE IF NOT EXISTS import_watermarks (
+    source VARCHAR(50) NOT NULL,
+    city VARCHAR(50) NOT NULL,
+    last_publication_date TIMESTAMP,  -- Newest publication time seen in the source
+    last_seen_ids TEXT,  -- JSON array of source ids published exactly at last_publication_date
+    last_full_sync_at TIMESTAMP,  -- Last full reconciliation pass
+    last_run_at TIMESTAMP,
+    PRIMARY KEY (source, city)
+);
+
+COMMENT ON TABLE import_watermarks IS 'Watermarks of incremental imports per source and city';
+
+-- ============================================================================
+-- SCRAPER ENDPOINT MEMORY (Migration 005)
+-- ============================================================================
+
+-- Which API endpoint last worked for each (source, city, category)
+CREATE TABLE IF NOT EXISTS scraper_endpoints (
+    source VARCHAR(50) NOT NULL,
+    city VARCHAR(50) NOT NULL,
+    category VARCHAR(50) NOT NULL,
+    endpoint VARCHAR(50) NOT NULL,  -- Endpoint key, e.g. rubric, selection, city_rubric
+    last_success_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, city, category)
+);
+
+COMMENT ON TABLE scraper_endpoints IS 'Endpoints that worked for scraper categories, tried first on next runs';
+
+-- ============================================================================
+-- CROSS-SOURCE DUPLICATES (Migration 006)
+-- ============================================================================
+
+-- Events imported from several sources point to the canonical (first known) copy
+ALTER TABLE events ADD COLUMN IF NOT EXISTS canonical_event_id INTEGER REFERENCES events(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_events_canonical ON events(canonical_event_id) WHERE canonical_event_id IS NOT NULL;
+
+COMMENT ON COLUMN events.canonical_event_id IS 'Canonical event this one duplicates (NULL for canonical events)';
+
+-- ============================================================================
+-- ADAPTIVE IMPORT SCHEDULE (Migration 007)
+-- ============================================================================
+
+-- Observed behaviour and next planned run of each (source, city) pair
+CREATE TABLE IF NOT EXISTS import_schedule (
+    source VARCHAR(50) NOT NULL,
+    city VARCHAR(50) NOT NULL,
+    change_rate DOUBLE PRECISION,  -- EWMA of created/updated events per hour
+    failure_rate DOUBLE PRECISION NOT NULL DEFAULT 0,  -- EWMA of failed runs (0..1)
+    requests_per_run DOUBLE PRECISION,  -- EWMA of HTTP requests per run
+    interval_seconds INTEGER,
+    last_status VARCHAR(20),  -- ok, failed
+    last_run_at TIMESTAMP,
+    next_run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, city)
+);
+
+CREATE INDEX IF NOT EXISTS idx_import_schedule_next_run ON import_schedule(next_run_at);
+
+COMMENT ON TABLE import_schedule IS 'Adaptive per source/city import intervals based on change and failure rates';
+
+-- ============================================================================
+-- IMPORT RUN HISTORY (Migration 008)
+-- ============================================================================
+
+-- One row per (source, city) import run
+CREATE TABLE IF NOT EXISTS import_runs (
+    id SERIAL PRIMARY KEY,
+    source VARCHAR(50) NOT NULL,
+    city VARCHAR(50) NOT NULL,
+    trigger VARCHAR(20) NOT NULL,  -- schedule, manual, worker
+    status VARCHAR(20) NOT NULL,  -- completed, failed
+    started_at TIMESTAMP NOT NULL,
+    duration_seconds DOUBLE PRECISION,
+    fetch_seconds DOUBLE PRECISION,  -- Time spent waiting for source pages
+    parse_seconds DOUBLE PRECISION,
+    write_seconds DOUBLE PRECISION,
+    notify_seconds DOUBLE PRECISION,
+    http_requests INTEGER DEFAULT 0,
+    http_bytes BIGINT DEFAULT 0,
+    total INTEGER DEFAULT 0,
+    created INTEGER DEFAULT 0,
+    updated INTEGER DEFAULT 0,
+    unchanged INTEGER DEFAULT 0,
+    errors INTEGER DEFAULT 0,
+    peak_memory_bytes BIGINT,  -- tracemalloc peak
+    error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_import_runs_started ON import_runs(started_at);
+CREATE INDEX IF NOT EXISTS idx_import_runs_source_city ON import_runs(source, city, started_at);
+
+COMMENT ON TABLE import_runs IS 'History of import runs with per-stage timings, HTTP traffic and peak memory';
+
+-- ============================================================================
+-- CITY BOUNDARIES (Migration 009)
+-- ============================================================================
+
+-- City boundary polygons loaded from GeoJSON files (see app/utils/city_boundaries.py)
+CREATE TABLE IF NOT EXISTS cities (
+    slug VARCHAR(50) PRIMARY KEY,  -- Key of CITIES in cities_config.py
+    name VARCHAR(100) NOT NULL,
+    boundary GEOMETRY(MultiPolygon, 4326) NOT NULL,
+    source_hash VARCHAR(64),  -- SHA-256 of the loaded GeoJSON file
+    loaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_cities_boundary ON cities USING GIST(boundary);
+
+-- Events outside the boundary of their declared city
+ALTER TABLE events ADD COLUMN IF NOT EXISTS outside_city_bounds BOOLEAN NOT NULL DEFAULT FALSE;
+
+CREATE INDEX IF NOT EXISTS idx_events_outside_city ON events(city) WHERE outside_city_bounds;
+
+-- Assign city of an event by the boundary containing it.
+-- Declared city (from the scraper or API) is kept when no boundary contains
+-- the point; the event is flagged only if the declared city has a boundary.
+CREATE OR REPLACE FUNCTION assign_event_city() RETURNS TRIGGER AS $$
+DECLARE
+    matched VARCHAR(50);
+BEGIN
+    SELECT slug INTO matched
+    FROM cities
+    WHERE ST_Contains(boundary, NEW.geom)
+    ORDER BY ST_Area(boundary)
+    LIMIT 1;
+
+    IF matched IS NOT NULL THEN
+        NEW.city := matched;
+        NEW.outside_city_bounds := FALSE;
+    ELSE
+        NEW.outside_city_bounds := EXISTS (SELECT 1 FROM cities WHERE slug = NEW.city);
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_events_assign_city ON events;
+CREATE TRIGGER trg_events_assign_city
+    BEFORE INSERT OR UPDATE OF geom ON events
+    FOR EACH ROW EXECUTE FUNCTION assign_event_city();
+
+COMMENT ON TABLE cities IS 'City boundary polygons used to assign events to cities';
+COMMENT ON COLUMN events.outside_city_bounds IS 'Point lies outside the boundary of the declared city';
+
+-- ============================================================================
+-- DISTRICTS (Migration 010)
+-- ============================================================================
+
+-- City districts loaded from GeoJSON files (see app/utils/districts.py)
+CREATE TABLE IF NOT EXISTS districts (
+    id SERIAL PRIMARY KEY,
+    city VARCHAR(50) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    population INTEGER,
+    geom GEOMETRY(MultiPolygon, 4326) NOT NULL,
+    source_hash VARCHAR(64),  -- SHA-256 of the loaded GeoJSON file
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (city, name)
+);
+
+CREATE INDEX IF NOT EXISTS idx_districts_geom ON districts USING GIST(geom);
+CREATE INDEX IF NOT EXISTS idx_districts_city ON districts(city);
+
+-- District of an event, assigned once at insert instead of on every request
+ALTER TABLE events ADD COLUMN IF NOT EXISTS district_id INTEGER REFERENCES districts(id) ON DELETE SET NULL;
+
+CREATE INDEX IF NOT EXISTS idx_events_district ON events(district_id, start_time) WHERE district_id IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION assign_event_district() RETURNS TRIGGER AS $$
+BEGIN
+    SELECT id INTO NEW.district_id
+    FROM districts
+    WHERE ST_Contains(geom, NEW.geom)
+    ORDER BY ST_Area(geom)
+    LIMIT 1;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_events_assign_district ON events;
+CREATE TRIGGER trg_events_assign_district
+    BEFORE INSERT OR UPDATE OF geom ON events
+    FOR EACH ROW EXECUTE FUNCTION assign_event_district();
+
+-- Visible (not archived, canonical) events per district, type and start day
+CREATE TABLE IF NOT EXISTS district_event_stats (
+    district_id INTEGER NOT NULL REFERENCES districts(id) ON DELETE CASCADE,
+    event_type VARCHAR(50) NOT NULL,
+    day DATE NOT NULL,
+    events_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (district_id, event_type, day)
+);
+
+CREATE INDEX IF NOT EXISTS idx_district_event_stats_day ON district_event_stats(day);
+
+-- Keep district_event_stats up to date row by row. Column-list triggers do not
+-- fire for columns changed only by a BEFORE trigger, so geom is listed: a moved
+-- event gets its district_id from trg_events_assign_district.
+CREATE OR REPLACE FUNCTION update_district_event_stats() RETURNS TRIGGER AS $$
+BEGIN
+    -- Fired on geom updates too (district_id changed by the BEFORE trigger); skip no-op changes
+    IF TG_OP = 'UPDATE'
+       AND (OLD.district_id, OLD.event_type, OLD.start_time::date, COALESCE(OLD.is_archived, FALSE), OLD.canonical_event_id)
+           IS NOT DISTINCT FROM
+           (NEW.district_id, NEW.event_type, NEW.start_time::date, COALESCE(NEW.is_archived, FALSE), NEW.canonical_event_id) THEN
+        RETURN NULL;
+    END IF;
+
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.district_id IS NOT NULL
+       AND NOT COALESCE(OLD.is_archived, FALSE) AND OLD.canonical_event_id IS NULL THEN
+        UPDATE district_event_stats
+        SET events_count = events_count - 1
+        WHERE district_id = OLD.district_id
+          AND event_type = OLD.event_type
+          AND day = OLD.start_time::date;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.district_id IS NOT NULL
+       AND NOT COALESCE(NEW.is_archived, FALSE) AND NEW.canonical_event_id IS NULL THEN
+        INSERT INTO district_event_stats (district_id, event_type, day, events_count)
+        VALUES (NEW.district_id, NEW.event_type, NEW.start_time::date, 1)
+        ON CONFLICT (district_id, event_type, day)
+        DO UPDATE SET events_count = district_event_stats.events_count + 1;
+    END IF;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_events_district_stats ON events;
+CREATE TRIGGER trg_events_district_stats
+    AFTER INSERT OR DELETE OR UPDATE OF geom, district_id, event_type, start_time, is_archived, canonical_event_id ON events
+    FOR EACH ROW EXECUTE FUNCTION update_district_event_stats();
+
+COMMENT ON TABLE districts IS 'City districts with population for choropleth maps';
+COMMENT ON TABLE district_event_stats IS 'Incrementally maintained counts of visible events per district, type and day';
+
+-- ============================================================================
+-- GEOHASH CELLS (Migration 011)
+-- ============================================================================
+
+-- Geohash of the event point (precision 9, ~5 m). Any prefix is a coarser
+-- cell, so clustering and dedup blocking group by strings instead of geometry.
+ALTER TABLE events ADD COLUMN IF NOT EXISTS geohash VARCHAR(12);
+
+CREATE OR REPLACE FUNCTION set_event_geohash() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.geohash := ST_GeoHash(NEW.geom, 9);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_events_geohash ON events;
+CREATE TRIGGER trg_events_geohash
+    BEFORE INSERT OR UPDATE OF geom ON events
+    FOR EACH ROW EXECUTE FUNCTION set_event_geohash();
+
+-- Backfill events stored before the column existed
+UPDATE events SET geohash = ST_GeoHash(geom, 9) WHERE geohash IS NULL;
+
+-- Prefix lookups (geohash LIKE 'ucfv%') at any level
+CREATE INDEX IF NOT EXISTS idx_events_geohash ON events(geohash text_pattern_ops);
+-- Level 6 cells (~1.2 x 0.6 km) used by dedup blocking and city clusters
+CREATE INDEX IF NOT EXISTS idx_events_city_geohash6 ON events(city, LEFT(geohash, 6));
+
+COMMENT ON COLUMN events.geohash IS 'Geohash of geom (precision 9), maintained by trigger';
+
+-- ============================================================================
+-- SUBSCRIBER MATCHING (Migration 012)
+-- ============================================================================
+
+-- Radius join of new events to subscribers in metres (ST_DWithin on geography)
+CREATE INDEX IF NOT EXISTS idx_telegram_users_location_geog ON telegram_users USING GIST((user_location::geography));
+
+-- ============================================================================
+-- NOTIFICATION OUTBOX (Migration 013)
+-- ============================================================================
+
+-- Rendered notifications waiting for delivery, drained by workers with FOR UPDATE SKIP LOCKED.
+-- notification_dedup (Migration 015) PRIMARY KEY(user_id, event_id, notification_type) is the idempotency key.
+CREATE TABLE IF NOT EXISTS notification_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES telegram_users(id) ON DELETE CASCADE,
+    chat_id BIGINT NOT NULL,
+    event_ids INTEGER[] NOT NULL,
+    notification_type VARCHAR(50) NOT NULL DEFAULT 'new_event',
+    payload TEXT NOT NULL,  -- Rendered message text
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',  -- pending, sending, sent, skipped, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,  -- Retry backoff, end of quiet hours
+    locked_by VARCHAR(100),  -- Drain worker that claimed the row
+    locked_at TIMESTAMP,
+    sent_at TIMESTAMP,
+    error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Claim order for due notifications
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending ON notification_outbox(next_attempt_at, id) WHERE status = 'pending';
+-- Rows of crashed drain workers
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_sending ON notification_outbox(locked_at) WHERE status = 'sending';
+-- Retention cleanup
+CREATE INDEX IF NOT EXISTS idx_notification_outbox_created_at ON notification_outbox(created_at);
+
+COMMENT ON TABLE notification_outbox IS 'Queue of rendered Telegram notifications drained by delivery workers, deduplicated by notification_dedup';
+
+-- ============================================================================
+-- TYPED EVENT TYPE PREFERENCES (Migration 014)
+-- ============================================================================
+
+-- preferred_event_types: JSON text -> TEXT[], so type filters run in SQL without parsing.
+-- Subqueries are not allowed in ALTER ... USING, the conversion goes through a helper function.
+-- Malformed values (not JSON, or JSON that is not an array) become NULL instead of aborting the ALTER.
+CREATE OR REPLACE FUNCTION json_text_to_array(value TEXT) RETURNS TEXT[] AS $$
+DECLARE
+    parsed JSONB;
+BEGIN
+    IF value IS NULL OR btrim(value) = '' THEN
+        RETURN NULL;
+    END IF;
+
+    BEGIN
+        parsed := value::jsonb;
+    EXCEPTION WHEN others THEN
+        RETURN NULL;
+    END;
+
+    IF jsonb_typeof(parsed) <> 'array' OR jsonb_array_length(parsed) = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    RETURN ARRAY(SELECT jsonb_array_elements_text(parsed));
+END;
+$$ LANGUAGE plpgsql IMMUTABLE;
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'telegram_users' AND column_name = 'preferred_event_types' AND data_type = 'text'
+    ) THEN
+        ALTER TABLE telegram_users
+            ALTER COLUMN preferred_event_types TYPE TEXT[] USING json_text_to_array(preferred_event_types);
+    END IF;
+END $$;
+
+DROP FUNCTION IF EXISTS json_text_to_array(TEXT);
+
+-- Subscribers of a type: preferred_event_types @> ARRAY['concert']
+CREATE INDEX IF NOT EXISTS idx_telegram_users_event_types ON telegram_users USING GIN(preferred_event_types);
+
+COMMENT ON COLUMN telegram_users.preferred_event_types IS 'Preferred event types, NULL or empty means any type';
+
+-- ============================================================================
+-- PARTITIONED NOTIFICATION HISTORY (Migration 015)
+-- ============================================================================
+
+-- notification_history becomes an append-only log partitioned by month of sent_at;
+-- old months are dropped as whole partitions. A unique key on a partitioned table
+-- must include sent_at, so deduplication moves to notification_dedup: one row per
+-- (user, event, type) that lives only as long as the event (ON DELETE CASCADE).
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'notification_history' AND relkind = 'r') THEN
+        ALTER TABLE notification_history RENAME TO notification_history_legacy;
+        ALTER TABLE notification_history_legacy RENAME CONSTRAINT notification_history_pkey TO notification_history_legacy_pkey;
+        ALTER SEQUENCE IF EXISTS notification_history_id_seq RENAME TO notification_history_legacy_id_seq;
+        DROP INDEX IF EXISTS idx_notification_history_user_id;
+        DROP INDEX IF EXISTS idx_notification_history_event_id;
+        DROP INDEX IF EXISTS idx_notification_history_sent_at;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS notification_history (
+    id BIGSERIAL,
+    user_id INTEGER NOT NULL REFERENCES telegram_users(id) ON DELETE CASCADE,
+    event_id INTEGER NOT NULL,  -- No FK: the log outlives deleted events
+    sent_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    notification_type VARCHAR(50) NOT NULL DEFAULT 'new_event',
+    PRIMARY KEY (id, sent_at)
+) PARTITION BY RANGE (sent_at);
+
+CREATE INDEX IF NOT EXISTS idx_notification_history_user_sent ON notification_history(user_id, sent_at);
+
+CREATE TABLE IF NOT EXISTS notification_dedup (
+    user_id INTEGER NOT NULL REFERENCES telegram_users(id) ON DELETE CASCADE,
+    event_id INTEGER NOT NULL REFERENCES events(id) ON DELETE CASCADE,
+    notification_type VARCHAR(50) NOT NULL DEFAULT 'new_event',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, event_id, notification_type)
+);
+
+-- Dedup lookups by new event ids and cascade deletes of expired events
+CREATE INDEX IF NOT EXISTS idx_notification_dedup_event_id ON notification_dedup(event_id);
+
+-- Rows of months without a partition (maintenance job missed, clock skew) land here
+-- instead of failing delivery bookkeeping
+CREATE TABLE IF NOT EXISTS notification_history_default PARTITION OF notification_history DEFAULT;
+
+-- Monthly partition containing the given day. Rows of that month already in the
+-- DEFAULT partition are moved into it, otherwise the partition could not be attached.
+CREATE OR REPLACE FUNCTION create_notification_history_partition(month DATE) RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', month)::date;
+    month_end DATE := (date_trunc('month', month) + INTERVAL '1 month')::date;
+    partition_name TEXT := 'notification_history_' || to_char(month_start, 'YYYY_MM');
+BEGIN
+    IF to_regclass(partition_name) IS NOT NULL THEN
+        RETURN partition_name;
+    END IF;
+
+    LOCK TABLE notification_history_default IN ACCESS EXCLUSIVE MODE;
+    CREATE TEMP TABLE IF NOT EXISTS notification_history_moved (LIKE notification_history) ON COMMIT DROP;
+    TRUNCATE notification_history_moved;
+
+    WITH moved AS (
+        DELETE FROM notification_history_default
+        WHERE sent_at >= month_start AND sent_at < month_end
+        RETURNING *
+    )
+    INSERT INTO notification_history_moved SELECT * FROM moved;
+
+    EXECUTE format(
+        'CREATE TABLE %I PARTITION OF notification_history FOR VALUES FROM (%L) TO (%L)',
+        partition_name, month_start, month_end
+    );
+    INSERT INTO notification_history SELECT * FROM notification_history_moved;
+    TRUNCATE notification_history_moved;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    month DATE;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'notification_history_legacy') THEN
+        FOR month IN
+            SELECT generate_series(date_trunc('month', MIN(sent_at)), date_trunc('month', MAX(sent_at)), INTERVAL '1 month')::date
+            FROM notification_history_legacy
+        LOOP
+            PERFORM create_notification_history_partition(month);
+        END LOOP;
+        PERFORM create_notification_history_partition(CURRENT_DATE);
+
+        INSERT INTO notification_history (user_id, event_id, sent_at, notification_type)
+        SELECT user_id, event_id, COALESCE(sent_at, CURRENT_TIMESTAMP), COALESCE(notification_type, 'new_event')
+        FROM notification_history_legacy;
+
+        INSERT INTO notification_dedup (user_id, event_id, notification_type, created_at)
+        SELECT user_id, event_id, COALESCE(notification_type, 'new_event'), sent_at
+        FROM notification_history_legacy
+        ON CONFLICT DO NOTHING;
+
+        DROP TABLE notification_history_legacy;
+    END IF;
+
+    -- Current and two next months; the maintenance job keeps creating them ahead
+    FOR month IN SELECT generate_series(date_trunc('month', CURRENT_DATE), date_trunc('month', CURRENT_DATE) + INTERVAL '2 months', INTERVAL '1 month')::date
+    LOOP
+        PERFORM create_notification_history_partition(month);
+    END LOOP;
+END $$;
+
+COMMENT ON TABLE notification_history IS 'Log of delivered notifications, partitioned by month of sent_at';
+COMMENT ON TABLE notification_dedup IS 'Notified (user, event, type) pairs of existing events, idempotency key of notification delivery';
+
+SELECT PostGIS_version();